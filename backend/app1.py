@@ -1,7 +1,8 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from enum import member
 import hashlib
-from flask import Flask, flash, json, jsonify, request, redirect, url_for, render_template, session
+import hmac
+from flask import Flask, flash, json, jsonify, request, redirect, url_for, render_template, session, stream_with_context
 import sqlite3
 import random
 import os
@@ -9,6 +10,21 @@ import logging
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 import time
+import threading
+import bisect
+import base64
+import csv
+import io
+import heapq
+import itertools
+import queue
+from functools import wraps
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import secrets
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
 
 
 from flask_admin import Admin
@@ -32,7 +48,7 @@ app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__fil
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATABASE}'
-DATABASE = r'C:\Users\ADMIN\Documents\Truvisory\SMB (3)\SMB\backend\hospital1.db'
+DATABASE = os.getenv('DATABASE_PATH') or r'C:\Users\ADMIN\Documents\Truvisory\SMB (3)\SMB\backend\hospital1.db'
 
 # ✅ Session + CORS configuration for React localhost
 # app.config['SESSION_COOKIE_DOMAIN'] = None
@@ -54,6 +70,145 @@ def add_cors_headers(response):
     return response
 
 
+# ----------------- Server-side sessions -----------------
+# The session cookie only carries a signed random id; the data lives in the
+# sessions table. A doctor's or front office user's own row is cached on the
+# session the first time it is needed (see session_principal()), so handlers do
+# not look it up by family_id on every request. Triggers on doctors and
+# front_office drop the cached copy whenever that row changes.
+SESSION_LIFETIME_SECONDS = int(os.getenv('SESSION_LIFETIME_SECONDS', str(7 * 24 * 3600)))
+PRINCIPAL_TABLES = {'doctor': 'doctors', 'front_office': 'front_office'}
+_session_serializer = TaggedJSONSerializer()
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, new=False, expires_ts=None, principal=None):
+        super().__init__(initial)
+        self.sid = sid or new_session_id()
+        self.new = new
+        self.expires_ts = expires_ts
+        self.principal = principal  # (role, row dict) or None
+        self.principal_modified = False
+        self.stale_sid = None
+
+    def rotate(self):
+        """Move the data to a fresh id; call on login so an id issued before it cannot be reused."""
+        if not self.new:
+            self.stale_sid = self.sid
+        self.sid = new_session_id()
+        self.new = True
+        self.principal = None
+        self.modified = True
+
+    def set_principal(self, role, row):
+        self.principal = (role, row)
+        self.principal_modified = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Flask sessions stored in the sessions table, keyed by the id in a signed cookie."""
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                conn = get_db()
+                try:
+                    row = conn.execute('''SELECT data, expires_ts, principal_role, principal FROM sessions
+                                          WHERE id = ? AND expires_ts > ?''', (sid, int(time.time()))).fetchone()
+                finally:
+                    conn.close()
+                if row:
+                    principal = ((row['principal_role'], json.loads(row['principal']))
+                                 if row['principal'] else None)
+                    return ServerSideSession(_session_serializer.loads(row['data']), sid,
+                                             expires_ts=row['expires_ts'], principal=principal)
+        return ServerSideSession(new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = int(time.time())
+
+        conn = get_db()
+        try:
+            if session.stale_sid:
+                conn.execute('DELETE FROM sessions WHERE id = ?', (session.stale_sid,))
+            if not session:
+                if not session.new:
+                    conn.execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+                    response.delete_cookie(name, domain=domain, path=path)
+                conn.commit()
+                return
+
+            # Sliding expiry, but rewrite an untouched session at most once per half lifetime
+            extend = session.expires_ts is None or session.expires_ts - now < SESSION_LIFETIME_SECONDS // 2
+            if not (session.new or session.modified or session.principal_modified or extend):
+                return
+            expires_ts = now + SESSION_LIFETIME_SECONDS
+            role, principal = session.principal or (None, None)
+            conn.execute(f'''INSERT INTO sessions (id, data, expires_ts, principal_role, principal_family_id, principal)
+                             VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_ts = excluded.expires_ts
+                             {""", principal_role = excluded.principal_role,
+                                   principal_family_id = excluded.principal_family_id,
+                                   principal = excluded.principal""" if session.principal_modified else ""}''',
+                         (session.sid, _session_serializer.dumps(dict(session)), expires_ts, role,
+                          principal.get('family_id') if principal else None,
+                          json.dumps(principal) if principal else None))
+            conn.commit()
+        finally:
+            conn.close()
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode()).decode(),
+            expires=datetime.fromtimestamp(expires_ts, timezone.utc),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+app.session_interface = SQLiteSessionInterface()
+
+
+def session_principal(c, role):
+    """The signed-in user's doctors/front_office row (without password_hash), cached on the session."""
+    cached = getattr(session, 'principal', None)
+    if cached and cached[0] == role and cached[1].get('family_id') == session.get('family_id'):
+        return cached[1]
+    c.execute(f'SELECT * FROM {PRINCIPAL_TABLES[role]} WHERE family_id = ?', (session.get('family_id'),))
+    row = c.fetchone()
+    if row is None:
+        return None
+    principal = {key: row[key] for key in row.keys() if key != 'password_hash'}
+    if isinstance(session, ServerSideSession):
+        session.set_principal(role, principal)
+    return principal
+
+
+def purge_expired_sessions(conn):
+    c = conn.cursor()
+    c.execute('DELETE FROM sessions WHERE expires_ts <= ?', (int(time.time()),))
+    conn.commit()
+    return c.rowcount
+
+
 # def generate_slots_for_doctor(doctor_id, days):
 #     print("calling generate_slots_for_doctor")
 #     from datetime import datetime, timedelta
@@ -86,94 +241,457 @@ def add_cors_headers(response):
 #     print(f"✅ Inserted {len(slots)} slots for doctor {doctor_id}")
 
 
-def generate_slots_for_doctor(doctor_id, days):
-    print("calling generate_slots_for_doctor")
-    from datetime import datetime, timedelta
-    from sqlalchemy import and_
+SLOT_INSERT_SQL = 'INSERT OR IGNORE INTO slots (doctor_id, slot_time, booked) VALUES (?, ?, 0)'
+
+
+# Working hours used for doctors without a row in doctor_schedule_templates.
+# weekday (0=Mon, 6=Sun) -> template; a weekday missing from a template is a day off.
+# Weekdays: 10-13 and 14-18 | Weekends: 10-13, in 30 minute slots
+DEFAULT_WEEKLY_SCHEDULE = {
+    weekday: {
+        'start_time': '10:00',
+        'end_time': '18:00' if weekday < 5 else '13:00',
+        'slot_minutes': 30,
+        'break_start': '13:00' if weekday < 5 else None,
+        'break_end': '14:00' if weekday < 5 else None,
+    }
+    for weekday in range(7)
+}
+
 
-    start_date = datetime.now().date()
-    new_slots = []
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
 
+
+def compile_day_template(day):
+    """Template for one weekday -> list of 'HH:MM:00' slot start times."""
+    start, end, step = _minutes(day['start_time']), _minutes(day['end_time']), int(day['slot_minutes'])
+    break_start = _minutes(day['break_start']) if day.get('break_start') else None
+    break_end = _minutes(day['break_end']) if day.get('break_end') else None
+
+    times = []
+    t = start
+    while t + step <= end:
+        overlaps_break = break_start is not None and t < break_end and t + step > break_start
+        if overlaps_break:
+            t = break_end
+            continue
+        times.append(f"{t // 60:02d}:{t % 60:02d}:00")
+        t += step
+    return times
+
+
+def compile_weekly_schedule(schedule):
+    return {weekday: compile_day_template(day) for weekday, day in schedule.items()}
+
+
+def build_slot_grid(doctor_id, days, start_date=None, schedule=None, weekdays=None):
+    """Candidate (doctor_id, slot_time) rows covering `days` days of the doctor's schedule.
+
+    `weekdays` limits the grid to those days of the week.
+    """
+    start_date = start_date or datetime.now().date()
+    day_times = compile_weekly_schedule(DEFAULT_WEEKLY_SCHEDULE if schedule is None else schedule)
+    rows = []
     for i in range(days):
         current_date = start_date + timedelta(days=i)
         day_of_week = current_date.weekday()  # 0=Mon, 6=Sun
+        if weekdays is not None and day_of_week not in weekdays:
+            continue
+        for slot_time in day_times.get(day_of_week, []):
+            rows.append((doctor_id, f"{current_date:%Y-%m-%d} {slot_time}"))
+    return rows
 
-        # Weekdays: 10-12, 14-17 | Weekends: 10-12
-        hours = list(range(10, 13)) + (list(range(14, 18)) if day_of_week < 5 else [])
 
-        for hour in hours:
-            for minute in [0, 30]:
-                slot_time = datetime.combine(current_date, datetime.min.time()).replace(
-                    hour=hour, minute=minute, second=0
-                )
-                slot_str = slot_time.strftime("%Y-%m-%d %H:%M:%S")
-
-                # ✅ Check if slot already exists
-                existing = Slot.query.filter(
-                    and_(Slot.doctor_id == doctor_id, Slot.slot_time == slot_str)
-                ).first()
-
-                if not existing:  # Only add if not already present
-                    new_slots.append(Slot(
-                        doctor_id=doctor_id,
-                        slot_time=slot_str,
-                        booked=0
-                    ))
-
-    # ✅ Add only new slots
-    if new_slots:
-        db.session.add_all(new_slots)
-        db.session.commit()
-        print(f"✅ Inserted {len(new_slots)} new slots for doctor {doctor_id}")
+def load_doctor_schedules(conn, doctor_id=None):
+    """doctor_id -> weekly schedule from doctor_schedule_templates (doctors without rows are absent)."""
+    c = conn.cursor()
+    if doctor_id is None:
+        c.execute('SELECT * FROM doctor_schedule_templates')
     else:
-        print(f"⚠️ No new slots added — all already exist for doctor {doctor_id}")
+        c.execute('SELECT * FROM doctor_schedule_templates WHERE doctor_id = ?', (doctor_id,))
+    schedules = {}
+    for row in c.fetchall():
+        schedule = schedules.setdefault(row['doctor_id'], {})
+        if not row['start_time'] or not row['end_time']:
+            continue  # day off
+        schedule[row['weekday']] = {
+            'start_time': row['start_time'],
+            'end_time': row['end_time'],
+            'slot_minutes': row['slot_minutes'],
+            'break_start': row['break_start'],
+            'break_end': row['break_end'],
+        }
+    return schedules
 
 
-def generate_slots_for_doctor_for_admin(doctor_id, days, conn=None):
-    print("calling generate_slots_for_doctor")
-    from datetime import datetime, timedelta
+def bulk_insert_slots(rows, conn=None):
+    """Insert slot rows with one INSERT OR IGNORE statement; returns (inserted, skipped).
 
-    slots = []
-    start_date = datetime.now().date()
+    Slots that already exist are skipped by the uq_slots_doctor_ts unique
+    index instead of a per-slot lookup. Without a sqlite3 conn the insert runs
+    in the current SQLAlchemy session (e.g. from a Flask-Admin hook).
+    """
+    if not rows:
+        return 0, 0
+    if conn is not None:
+        c = conn.cursor()
+        c.executemany(SLOT_INSERT_SQL, rows)
+        inserted = c.rowcount
+    else:
+        from sqlalchemy import text
+        result = db.session.execute(
+            text('INSERT OR IGNORE INTO slots (doctor_id, slot_time, booked) VALUES (:doctor_id, :slot_time, 0)'),
+            [{'doctor_id': doctor_id, 'slot_time': slot_time} for doctor_id, slot_time in rows]
+        )
+        inserted = result.rowcount
+    return inserted, len(rows) - inserted
 
-    for i in range(days):
-        current_date = start_date + timedelta(days=i)
-        day_of_week = current_date.weekday()  # 0=Mon, 6=Sun
 
-        if day_of_week < 5:  # Weekdays
-            hours = list(range(10, 13)) + list(range(14, 18))
-        else:  # Weekends
-            hours = list(range(10, 13))
+def generate_slots_for_doctor(doctor_id, days):
+    print("calling generate_slots_for_doctor")
+    inserted, skipped = bulk_insert_slots(build_slot_grid(doctor_id, days))
+    db.session.commit()
+    print(f"✅ Inserted {inserted} new slots for doctor {doctor_id} ({skipped} already existed)")
+    return inserted, skipped
 
-        for hour in hours:
-            for minute in [0, 30]:
-                slot_time = datetime.combine(current_date, datetime.min.time()).replace(
-                    hour=hour, minute=minute, second=0
-                )
-                slots.append((
-                    doctor_id,
-                    slot_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    0
-                ))
 
-    # Use the existing connection if provided, otherwise create new
+def generate_slots_for_doctor_for_admin(doctor_id, days, conn=None):
+    print("calling generate_slots_for_doctor")
+    rows = build_slot_grid(doctor_id, days)
+
+    # Use the existing connection if provided, otherwise fall back to SQLAlchemy
+    inserted, skipped = bulk_insert_slots(rows, conn)
     if conn:
-        c = conn.cursor()
-        c.executemany('INSERT INTO slots (doctor_id, slot_time, booked) VALUES (?, ?, ?)', slots)
         conn.commit()
     else:
-        # Fallback to SQLAlchemy if no connection provided
-        from app1 import db
-        for slot_data in slots:
-            slot = Slot(doctor_id=slot_data[0], slot_time=slot_data[1], booked=slot_data[2])
-            db.session.add(slot)
         db.session.commit()
-    
-    print(f"✅ Inserted {len(slots)} slots for doctor {doctor_id}")
+
+    print(f"✅ Inserted {inserted} slots for doctor {doctor_id} ({skipped} already existed)")
+    return inserted, skipped
+
+
+# ----------------- Rolling slot horizon -----------------
+# A background job keeps SLOT_HORIZON_DAYS of future slots for every doctor and
+# prunes past slots nobody booked, so availability never runs dry and the slots
+# table stays bounded. It runs once at startup and then nightly.
+SLOT_HORIZON_DAYS = int(os.getenv('SLOT_HORIZON_DAYS') or 60)
+SLOT_PRUNE_AFTER_DAYS = int(os.getenv('SLOT_PRUNE_AFTER_DAYS') or 1)  # keep yesterday's slots for reporting
+SLOT_MAINTENANCE_HOUR = int(os.getenv('SLOT_MAINTENANCE_HOUR') or 2)  # local hour of the nightly run
+SLOT_MAINTENANCE_BATCH_SIZE = int(os.getenv('SLOT_MAINTENANCE_BATCH_SIZE') or 500)
+
+
+def extend_slot_horizon(conn, horizon_days=None):
+    """Generate missing days up to today + horizon_days for every doctor, one transaction per doctor."""
+    horizon_days = SLOT_HORIZON_DAYS if horizon_days is None else horizon_days
+    today = datetime.now().date()
+    horizon_end = today + timedelta(days=horizon_days)
+
+    c = conn.cursor()
+    c.execute('''SELECT d.id, date(MAX(s.slot_ts), 'unixepoch') AS last_day
+                 FROM doctors d
+                 LEFT JOIN slots s ON s.doctor_id = d.id
+                 GROUP BY d.id''')
+    doctors = c.fetchall()
+    schedules = load_doctor_schedules(conn)
+
+    total_inserted = 0
+    for doctor in doctors:
+        # Only append days after the last generated one, so days an admin
+        # cleared on purpose are not refilled
+        start_date = today
+        if doctor['last_day']:
+            start_date = max(today, datetime.strptime(doctor['last_day'], '%Y-%m-%d').date() + timedelta(days=1))
+        days = (horizon_end - start_date).days
+        if days <= 0:
+            continue
+        rows = build_slot_grid(doctor['id'], days, start_date, schedules.get(doctor['id']))
+        inserted, _ = bulk_insert_slots(rows, conn)
+        conn.commit()
+        total_inserted += inserted
+    return total_inserted
+
+
+def regenerate_doctor_days(conn, doctor_id, weekdays, schedule=None, horizon_days=None):
+    """Rebuild upcoming slots on the given weekdays after a schedule change; returns (inserted, removed).
+
+    Free slots that no longer fit the schedule are removed, new ones inserted.
+    Booked slots and slots any appointment points at are left alone.
+    """
+    horizon_days = SLOT_HORIZON_DAYS if horizon_days is None else horizon_days
+    if schedule is None:
+        schedule = load_doctor_schedules(conn, doctor_id).get(doctor_id)
+    now = datetime.now()
+    rows = [row for row in build_slot_grid(doctor_id, horizon_days, now.date(), schedule, weekdays)
+            if row[1] > now.strftime('%Y-%m-%d %H:%M:%S')]
+    wanted = {slot_time for _, slot_time in rows}
+
+    c = conn.cursor()
+    start_ts, end_ts = epoch_seconds(now), epoch_seconds(now.date() + timedelta(days=horizon_days))
+    c.execute('''SELECT s.id, s.slot_time, CAST(strftime('%w', s.slot_ts, 'unixepoch') AS INTEGER) AS dow
+                 FROM slots s
+                 WHERE s.doctor_id = ? AND s.slot_ts > ? AND s.slot_ts < ? AND s.booked = 0
+                 AND NOT EXISTS (SELECT 1 FROM appointments a WHERE a.slot_id = s.id)''',
+              (doctor_id, start_ts, end_ts))
+    # strftime('%w') counts from Sunday=0, datetime.weekday() from Monday=0
+    stale_ids = [row['id'] for row in c.fetchall()
+                 if (row['dow'] - 1) % 7 in weekdays and row['slot_time'] not in wanted]
+    if stale_ids:
+        c.executemany('DELETE FROM slots WHERE id = ?', [(slot_id,) for slot_id in stale_ids])
+
+    inserted, _ = bulk_insert_slots(rows, conn)
+    conn.commit()
+    return inserted, len(stale_ids)
+
+
+def prune_expired_slots(conn, older_than_days=None, batch_size=None):
+    """Delete past, unbooked slots no appointment references, in small batches to keep write locks short."""
+    older_than_days = SLOT_PRUNE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or SLOT_MAINTENANCE_BATCH_SIZE
+    cutoff = epoch_seconds(datetime.now().date() - timedelta(days=older_than_days))
+
+    c = conn.cursor()
+    total_deleted = 0
+    while True:
+        c.execute('''DELETE FROM slots WHERE id IN (
+                         SELECT s.id FROM slots s
+                         WHERE s.slot_ts < ? AND s.booked = 0
+                         AND NOT EXISTS (SELECT 1 FROM appointments a WHERE a.slot_id = s.id)
+                         LIMIT ?
+                     )''', (cutoff, batch_size))
+        deleted = c.rowcount
+        conn.commit()
+        total_deleted += deleted
+        if deleted < batch_size:
+            return total_deleted
+
+
+def run_slot_maintenance():
+    conn = get_db()
+    try:
+        inserted = extend_slot_horizon(conn)
+        deleted = prune_expired_slots(conn)
+        logger.info(f"Slot maintenance: generated {inserted} slots, pruned {deleted} expired slots")
+        return inserted, deleted
+    finally:
+        conn.close()
+
+
+_slot_scheduler_stop = threading.Event()
+
+
+def seconds_until_hour(hour, now=None):
+    now = now or datetime.now()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def start_slot_scheduler():
+    """Run slot maintenance (plus idempotency key, rollup and session cleanup) now and then every night at SLOT_MAINTENANCE_HOUR."""
+    def run():
+        wait = 0
+        while not _slot_scheduler_stop.wait(wait):
+            # Any failure is logged and retried next night; letting it escape would end the thread
+            try:
+                run_slot_maintenance()
+            except Exception as e:
+                logger.error(f"Slot maintenance failed: {e}", exc_info=True)
+            try:
+                conn = get_db()
+                try:
+                    purged = purge_expired_idempotency_keys(conn)
+                    logger.info(f"Purged {purged} expired idempotency keys")
+                    compacted = compact_daily_rollups(conn)
+                    logger.info(f"Compacted {compacted} empty daily rollup rows")
+                    expired = purge_expired_sessions(conn)
+                    logger.info(f"Purged {expired} expired sessions")
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Idempotency key / rollup / session cleanup failed: {e}", exc_info=True)
+            wait = seconds_until_hour(SLOT_MAINTENANCE_HOUR)
+
+    thread = threading.Thread(target=run, name='slot-scheduler', daemon=True)
+    thread.start()
+    return thread
+
+
+
+def begin_immediate(conn):
+    """Open a write transaction now, so the slot claim cannot hit SQLITE_BUSY halfway through a booking."""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+
+def claim_slot(c, slot_id, appointment_id=None, family_id=None):
+    """Mark slot_id booked if it is still free; returns False when someone else holds it.
+
+    The availability check and the write are one statement, so two requests
+    racing for the same slot cannot both see it free. appointment_id is the
+    appointment being rescheduled, whose own booking does not count, and
+    family_id may book through its own slot hold. A successful claim consumes
+    the slot's hold.
+    """
+    c.execute('''UPDATE slots SET booked = 1
+                 WHERE id = ? AND booked = 0
+                 AND NOT EXISTS (
+                     SELECT 1 FROM appointments
+                     WHERE slot_id = ? AND status IN ('Scheduled', 'Confirmed') AND id IS NOT ?
+                 )
+                 AND NOT EXISTS (
+                     SELECT 1 FROM slot_holds
+                     WHERE slot_id = ? AND held_until > ? AND family_id IS NOT ?
+                 )''', (slot_id, slot_id, appointment_id, slot_id, int(time.time()), family_id))
+    if c.rowcount != 1:
+        return False
+    release_slot_hold(c, slot_id)
+    return True
+
+# ----------------- Availability index -----------------
+# Free slots per (doctor_id, day) are kept in memory and rebuilt lazily. Every
+# write that can change a day's availability (booking, cancelling,
+# rescheduling, adding/removing slots) bumps that day's row in
+# availability_versions through triggers, so readers only need one primary-key
+# lookup to know whether their cached copy is still current - in this process
+# or any other worker sharing the database.
+AVAILABILITY_INDEX_MAX_DAYS = int(os.getenv('AVAILABILITY_INDEX_MAX_DAYS', '5000'))
+
+# Days and free slots of one doctor, as (slot_ts, slot_id, slot_time, 'YYYY-MM-DD', 'HH:MM') tuples
+FREE_SLOTS_SQL = '''
+    SELECT s.slot_ts, s.id, s.slot_time,
+           strftime('%Y-%m-%d', s.slot_ts, 'unixepoch') AS date,
+           strftime('%H:%M', s.slot_ts, 'unixepoch') AS time
+    FROM slots s
+    WHERE s.doctor_id = ?
+    AND s.slot_ts >= ? AND s.slot_ts < ?
+    AND s.booked = 0
+    AND s.id NOT IN (
+        SELECT slot_id FROM appointments WHERE status IN ('Scheduled', 'Confirmed')
+    )
+    ORDER BY s.slot_ts
+'''
+
+
+class AvailabilityIndex:
+    """LRU map of (doctor_id, 'YYYY-MM-DD') -> (version, sorted free slot tuples)."""
+
+    def __init__(self, max_days=AVAILABILITY_INDEX_MAX_DAYS):
+        self.max_days = max_days
+        self._days = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, key, version, slots):
+        with self._lock:
+            self._days[key] = (version, slots)
+            self._days.move_to_end(key)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    def _cached(self, key, version):
+        with self._lock:
+            entry = self._days.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._days.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _load(self, conn, doctor_id, start_day, end_day, versions):
+        """Rebuild every day of doctor_id in [start_day, end_day] with one range query."""
+        # Versions were read before this query, so a write landing in between
+        # leaves the entry one version behind and it is simply rebuilt next time
+        start_ts, end_ts = epoch_day_range(start_day, end_day)
+        by_day = {}
+        for row in conn.execute(FREE_SLOTS_SQL, (doctor_id, start_ts, end_ts)):
+            by_day.setdefault(row['date'], []).append(tuple(row))
+
+        loaded = {}
+        day = datetime.strptime(start_day, '%Y-%m-%d').date()
+        last_day = datetime.strptime(end_day, '%Y-%m-%d').date()
+        while day <= last_day:
+            key_day = day.strftime('%Y-%m-%d')
+            if key_day in versions:
+                slots = by_day.get(key_day, [])
+                self._store((doctor_id, key_day), versions[key_day], slots)
+                loaded[key_day] = slots
+            day += timedelta(days=1)
+        return loaded
+
+    def free_slots(self, conn, doctor_id, day, after_ts=None):
+        """Free slots of one doctor on one day, optionally only those starting after after_ts."""
+        doctor_id = int(doctor_id)
+        row = conn.execute('SELECT version FROM availability_versions WHERE doctor_id = ? AND day = ?',
+                           (doctor_id, day)).fetchone()
+        version = row['version'] if row else 0
+        slots = self._cached((doctor_id, day), version)
+        if slots is None:
+            slots = self._load(conn, doctor_id, day, day, {day: version})[day]
+        if after_ts is not None:
+            slots = slots[bisect.bisect_right(slots, (after_ts, float('inf'))):]
+        return slots
+
+    def iter_free_slots(self, conn, doctor_id, first_day, last_day, after_ts=None):
+        """Yield free slots of one doctor from first_day to last_day in time order, loading a day only when reached."""
+        day = datetime.strptime(first_day, '%Y-%m-%d').date()
+        last_day = datetime.strptime(last_day, '%Y-%m-%d').date()
+        while day <= last_day:
+            yield from self.free_slots(conn, doctor_id, day.strftime('%Y-%m-%d'), after_ts)
+            if day == last_day:
+                break  # stepping past 9999-12-31 would overflow
+            day += timedelta(days=1)
+
+    def upcoming_free_slots(self, conn, after_ts, doctor_ids=None):
+        """doctor_id -> free slots starting after after_ts, across every day that has slots."""
+        first_day = time.strftime('%Y-%m-%d', time.gmtime(after_ts))
+        c = conn.cursor()
+        c.execute('SELECT doctor_id, day, version FROM availability_versions WHERE day >= ?', (first_day,))
+        versions = {}
+        for row in c.fetchall():
+            if doctor_ids is None or row['doctor_id'] in doctor_ids:
+                versions.setdefault(row['doctor_id'], {})[row['day']] = row['version']
+
+        result = {}
+        for doctor_id, days in versions.items():
+            slots_by_day = {}
+            stale = []
+            for day, version in days.items():
+                slots = self._cached((doctor_id, day), version)
+                if slots is None:
+                    stale.append(day)
+                else:
+                    slots_by_day[day] = slots
+            if stale:
+                stale_versions = {day: days[day] for day in stale}
+                slots_by_day.update(self._load(conn, doctor_id, min(stale), max(stale), stale_versions))
+
+            doctor_slots = []
+            for day in sorted(slots_by_day):
+                doctor_slots.extend(slots_by_day[day])
+            result[doctor_id] = doctor_slots[bisect.bisect_right(doctor_slots, (after_ts, float('inf'))):]
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'days_cached': len(self._days), 'hits': self.hits, 'misses': self.misses}
+
+
+availability_index = AvailabilityIndex()
 # imports (add to top of your file)
 import os
 import smtplib
+import jinja2
 from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from werkzeug.security import generate_password_hash
 from flask import current_app, request, url_for
@@ -194,30 +712,280 @@ def get_serializer():
     key = SECRET_KEY or current_app.config.get('SECRET_KEY')
     return URLSafeTimedSerializer(key)
 
-# email sending helper (simple using smtplib)
-def send_email(to_email: str, subject: str, body: str):
-    print("coming into sned email")
-    if not MAIL_SERVER or not MAIL_USERNAME or not MAIL_PASSWORD:
+# ----------------- Email outbox -----------------
+# Request handlers only queue mail: send_email() and the credential emails store the
+# finished MIME message in email_outbox and return. The email worker thread sends
+# due messages in batches over one reused SMTP session, retrying failures with
+# exponential backoff until EMAIL_MAX_ATTEMPTS. When the server cannot be reached
+# or rejects the login, the whole batch backs off without spending attempts.
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '20'))
+EMAIL_POLL_INTERVAL = int(os.getenv('EMAIL_POLL_INTERVAL', '30'))  # seconds between checks for retries
+EMAIL_CLAIM_SECONDS = 300  # a claimed message is retried after this if its worker died mid-send
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_RETRY_BASE_SECONDS', '30'))
+EMAIL_RETRY_MAX_SECONDS = 3600
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '8'))
+EMAIL_SMTP_IDLE_SECONDS = 10  # keep the session open this long for the next message
+
+_email_wakeup = threading.Event()
+_email_worker_stop = threading.Event()
+
+
+def enqueue_email(msg):
+    """Queue a built email.message for the email worker; returns the outbox id."""
+    if not MAIL_SERVER:
         raise RuntimeError("Mail server not configured. Please set MAIL_SERVER, MAIL_USERNAME, MAIL_PASSWORD.")
+    if not msg['From']:
+        msg['From'] = MAIL_FROM
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('''INSERT INTO email_outbox (to_email, subject, message, next_attempt_ts, created_ts)
+                     VALUES (?, ?, ?, ?, ?)''',
+                  (msg['To'], msg['Subject'], msg.as_string(), int(time.time()), int(time.time())))
+        conn.commit()
+        outbox_id = c.lastrowid
+    finally:
+        conn.close()
+    _email_wakeup.set()
+    return outbox_id
+
+
+# Transactional email templates live in templates/email as <name>.html plus an
+# optional <name>.txt plain-text part. They are compiled once, here, and only
+# the per-recipient variables are rendered for each message.
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+EMAIL_TEMPLATES = ('account_details', 'set_password', 'waitlist_offer', 'admin_created_credentials',
+                   'family_member_credentials')
+
+email_template_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(EMAIL_TEMPLATE_DIR),
+    autoescape=jinja2.select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+)
+
+
+def compile_email_templates():
+    """name -> (compiled html template, compiled text template or None) for every EMAIL_TEMPLATES entry."""
+    compiled = {}
+    for name in EMAIL_TEMPLATES:
+        text_name = f'{name}.txt'
+        text = (email_template_env.get_template(text_name)
+                if os.path.exists(os.path.join(EMAIL_TEMPLATE_DIR, text_name)) else None)
+        compiled[name] = (email_template_env.get_template(f'{name}.html'), text)
+    return compiled
+
+
+email_templates = compile_email_templates()
+
+
+def render_email(to_email, subject, template, **context):
+    """MIME message for one recipient; multipart/alternative when the template has a text part."""
+    html, text = email_templates[template]
+    if text is None:
+        msg = MIMEText(html.render(**context), 'html')
+    else:
+        msg = MIMEMultipart('alternative')
+        msg.attach(MIMEText(text.render(**context), 'plain'))
+        msg.attach(MIMEText(html.render(**context), 'html'))
+    msg['Subject'] = subject
+    msg['From'] = MAIL_FROM
+    msg['To'] = to_email
+    return msg
+
+
+def send_templated_email(to_email, subject, template, **context):
+    """Render a template for one recipient and queue it; the outbox keeps the rendered message for retries."""
+    return enqueue_email(render_email(to_email, subject, template, **context))
+
+
+def send_email(to_email: str, subject: str, body: str):
+    """Queue an HTML email; the email worker delivers it."""
     msg = MIMEText(body, "html")
     msg['Subject'] = subject
     msg['From'] = MAIL_FROM
     msg['To'] = to_email
+    return enqueue_email(msg)
 
-    # choose SSL or TLS
-    if MAIL_USE_SSL:
-        server = smtplib.SMTP_SSL(MAIL_SERVER, MAIL_PORT)
+
+def claim_due_emails(conn, limit=None):
+    """Lease up to `limit` due messages to this worker; returns their rows."""
+    now = int(time.time())
+    c = conn.cursor()
+    c.execute('''UPDATE email_outbox SET next_attempt_ts = ?
+                 WHERE id IN (SELECT id FROM email_outbox
+                              WHERE status = 'Pending' AND next_attempt_ts <= ?
+                              ORDER BY next_attempt_ts, id LIMIT ?)
+                 RETURNING id, to_email, message, attempts''',
+              (now + EMAIL_CLAIM_SECONDS, now, limit or EMAIL_BATCH_SIZE))
+    rows = sorted(c.fetchall(), key=lambda row: row['id'])
+    conn.commit()
+    return rows
+
+
+def email_retry_delay(attempts):
+    return min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+
+
+def record_email_result(conn, row, error=None, permanent=False):
+    attempts = row['attempts'] + 1
+    if error is None:
+        # The message may hold a plaintext password, so it is not kept once delivered
+        conn.execute('''UPDATE email_outbox SET status = 'Sent', attempts = ?, sent_ts = ?,
+                            message = NULL, last_error = NULL
+                        WHERE id = ?''', (attempts, int(time.time()), row['id']))
+    elif permanent or attempts >= EMAIL_MAX_ATTEMPTS:
+        conn.execute('''UPDATE email_outbox SET status = 'Failed', attempts = ?, last_error = ?
+                        WHERE id = ?''', (attempts, str(error)[:500], row['id']))
+        logger.error(f"Giving up on email {row['id']} to {row['to_email']} after {attempts} attempts: {error}")
     else:
-        server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT)
-    try:
+        conn.execute('''UPDATE email_outbox SET attempts = ?, last_error = ?, next_attempt_ts = ?
+                        WHERE id = ?''',
+                     (attempts, str(error)[:500], int(time.time()) + email_retry_delay(attempts), row['id']))
+    conn.commit()
+
+
+class SMTPConnectionError(Exception):
+    """Connecting or logging in to the mail server failed; no message was attempted."""
+
+
+class SMTPSession:
+    """One SMTP connection, opened and authenticated on first use and kept for the following messages."""
+
+    def __init__(self):
+        self.server = None
+        self.failures = 0  # consecutive failed connects, for backing off the whole outbox
+
+    def connect(self):
+        try:
+            self._open()
+        except (smtplib.SMTPException, OSError) as e:
+            self.close()
+            self.failures += 1
+            raise SMTPConnectionError(e) from e
+        self.failures = 0
+
+    def _open(self):
+        if MAIL_USE_SSL:
+            server = smtplib.SMTP_SSL(MAIL_SERVER, MAIL_PORT, timeout=30)
+        else:
+            server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=30)
+        self.server = server
         server.ehlo()
         if MAIL_USE_TLS and not MAIL_USE_SSL:
             server.starttls()
             server.ehlo()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD)
-        server.sendmail(MAIL_FROM, [to_email], msg.as_string())
+        if MAIL_USERNAME:
+            server.login(MAIL_USERNAME, MAIL_PASSWORD)
+
+    def send(self, to_email, message):
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.sendmail(MAIL_FROM, [to_email], message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle session; reconnect once and retry
+            self.connect()
+            self.server.sendmail(MAIL_FROM, [to_email], message)
+
+    def close(self):
+        server, self.server = self.server, None
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+
+
+def defer_emails(conn, rows, error, delay):
+    """Put claimed rows back in the queue after `delay` seconds without counting an attempt."""
+    conn.executemany('UPDATE email_outbox SET last_error = ?, next_attempt_ts = ? WHERE id = ?',
+                     [(str(error)[:500], int(time.time()) + delay, row['id']) for row in rows])
+    conn.commit()
+
+
+def send_email_batch(conn, smtp, rows):
+    """Send claimed rows over smtp; returns how many were delivered."""
+    sent = 0
+    for index, row in enumerate(rows):
+        try:
+            smtp.send(row['to_email'], row['message'])
+        except SMTPConnectionError as e:
+            # The server is unreachable or rejected our login (e.g. 535): that says nothing
+            # about the messages, so back the whole batch off instead of failing them
+            delay = email_retry_delay(smtp.failures)
+            defer_emails(conn, rows[index:], e, delay)
+            logger.error(f"Cannot connect to mail server, retrying {len(rows) - index} emails in {delay}s: {e}")
+            break
+        except smtplib.SMTPRecipientsRefused as e:
+            codes = [code for code, _ in e.recipients.values()]
+            record_email_result(conn, row, e, permanent=all(500 <= code < 600 for code in codes))
+        except smtplib.SMTPResponseException as e:
+            # 5xx replies are permanent; 4xx (and anything else) are retried
+            record_email_result(conn, row, e, permanent=500 <= e.smtp_code < 600)
+        except (smtplib.SMTPException, OSError) as e:
+            # Connection-level failure: the rest of the batch would fail the same way
+            smtp.close()
+            for pending in rows[index:]:
+                record_email_result(conn, pending, e)
+            break
+        else:
+            record_email_result(conn, row)
+            sent += 1
+    return sent
+
+
+def process_email_outbox(smtp=None):
+    """Send every due message; returns (messages delivered, epoch seconds the next retry is due or None)."""
+    smtp = smtp or SMTPSession()
+    conn = get_db()
+    sent = 0
+    try:
+        while True:
+            rows = claim_due_emails(conn)
+            if not rows:
+                break
+            sent += send_email_batch(conn, smtp, rows)
+            if smtp.failures:
+                break
+        next_due = conn.execute("SELECT MIN(next_attempt_ts) FROM email_outbox WHERE status = 'Pending'").fetchone()[0]
+        return sent, next_due
     finally:
-        server.quit()
+        conn.close()
+
+
+def start_email_worker():
+    """Deliver queued email in the background; wakes on enqueue_email() and every EMAIL_POLL_INTERVAL seconds."""
+    def run():
+        smtp = SMTPSession()
+        next_due = None
+        while not _email_worker_stop.is_set():
+            wait = EMAIL_SMTP_IDLE_SECONDS if smtp.server else EMAIL_POLL_INTERVAL
+            if next_due is not None:
+                wait = max(min(wait, next_due - time.time()), 0)
+            woken = _email_wakeup.wait(wait)
+            _email_wakeup.clear()
+            # Any failure is logged and retried next pass; letting it escape would end the thread
+            try:
+                if not woken and smtp.server and (next_due is None or next_due > time.time()):
+                    # Idle: do not hold the connection open until the next message
+                    smtp.close()
+                sent, next_due = process_email_outbox(smtp)
+                if sent:
+                    logger.info(f"Email worker sent {sent} messages")
+            except Exception as e:
+                logger.error(f"Email outbox processing failed: {e}", exc_info=True)
+                # Start the next pass on a fresh connection; claimed rows are retried once their lease ends
+                smtp.close()
+                next_due = None
+
+    thread = threading.Thread(target=run, name='email-worker', daemon=True)
+    thread.start()
+    return thread
+
 
 # generate password reset token
 def generate_reset_token(email):
@@ -237,11 +1005,428 @@ def verify_reset_token(token, max_age_seconds=3600):
 
 
 
-from flask import make_response
+from flask import make_response
+
+# Add these imports at the top
+import hashlib
+import calendar
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def day_range(start_day, end_day=None):
+    """Half-open [start, next_day) bounds covering start_day..end_day (inclusive).
+
+    Timestamps are stored as 'YYYY-MM-DD ...' TEXT, so filtering with
+    `col >= ? AND col < ?` matches every stored format and, unlike
+    `date(col) = ?`, lets SQLite use an index on col.
+    """
+    if not isinstance(start_day, str):
+        start_day = start_day.strftime('%Y-%m-%d')
+    end_day = end_day or start_day
+    if isinstance(end_day, str):
+        end_day = datetime.strptime(end_day[:10], '%Y-%m-%d')
+    next_day = (end_day + timedelta(days=1)).strftime('%Y-%m-%d')
+    return start_day[:10], next_day
+
+
+def epoch_seconds(value):
+    """Naive local datetime/date/'YYYY-MM-DD' -> integer seconds, matching SQLite's strftime('%s', ...)."""
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], '%Y-%m-%d')
+    return calendar.timegm(value.timetuple())
+
+
+def epoch_day_range(start_day, end_day=None):
+    """day_range() expressed as [start, end) epoch seconds for the *_ts columns."""
+    start, end = day_range(start_day, end_day)
+    return epoch_seconds(start), epoch_seconds(end)
+
+
+# ----------------- Slot holds -----------------
+# A patient picking a slot leases it for SLOT_HOLD_MINUTES so nobody else can
+# book it during checkout. Holds are plain rows checked against held_until at
+# read time, so an abandoned hold simply stops counting when it expires; the
+# sweeper only keeps the table small.
+SLOT_HOLD_MINUTES = int(os.getenv('SLOT_HOLD_MINUTES', '5'))
+SLOT_HOLD_SWEEP_INTERVAL = int(os.getenv('SLOT_HOLD_SWEEP_INTERVAL', '60'))  # seconds
+SLOT_HOLD_MAX_PER_FAMILY = int(os.getenv('SLOT_HOLD_MAX_PER_FAMILY', '3'))  # active holds one family may have
+
+_hold_sweeper_stop = threading.Event()
+
+
+def held_slot_ids(conn, family_id, doctor_id=None, day=None):
+    """Ids of slots currently held by anyone other than family_id."""
+    query = 'SELECT slot_id FROM slot_holds WHERE held_until > ? AND family_id IS NOT ?'
+    params = [int(time.time()), family_id]
+    if doctor_id is not None:
+        query += ' AND doctor_id = ? AND day = ?'
+        params += [int(doctor_id), day]
+    return {row['slot_id'] for row in conn.execute(query, params)}
+
+
+def active_hold_count(conn, family_id):
+    return conn.execute('SELECT COUNT(*) FROM slot_holds WHERE family_id = ? AND held_until > ?',
+                        (family_id, int(time.time()))).fetchone()[0]
+
+
+def hold_slot(conn, slot_id, family_id, minutes=None, max_holds=SLOT_HOLD_MAX_PER_FAMILY):
+    """Lease slot_id to family_id; returns held_until (epoch seconds) or None if it is taken.
+
+    Renewing your own hold or taking over an expired one is the same upsert,
+    so this is a single short write with no lock held across requests. A
+    family already holding max_holds other slots gets None (None = no cap).
+    """
+    now = int(time.time())
+    held_until = now + 60 * (SLOT_HOLD_MINUTES if minutes is None else minutes)
+    c = conn.cursor()
+    # The cap is counted inside the write lock, so concurrent holds cannot both slip under it
+    begin_immediate(conn)
+    c.execute('''INSERT INTO slot_holds (slot_id, doctor_id, day, family_id, held_until)
+                 SELECT s.id, s.doctor_id, substr(s.slot_time, 1, 10), ?, ? FROM slots s
+                 WHERE s.id = ? AND s.booked = 0 AND s.slot_ts > ?
+                 AND NOT EXISTS (
+                     SELECT 1 FROM appointments
+                     WHERE slot_id = s.id AND status IN ('Scheduled', 'Confirmed')
+                 )
+                 AND (? IS NULL OR (SELECT COUNT(*) FROM slot_holds
+                                    WHERE family_id = ? AND held_until > ? AND slot_id != s.id) < ?)
+                 ON CONFLICT(slot_id) DO UPDATE SET family_id = excluded.family_id, held_until = excluded.held_until
+                 WHERE slot_holds.held_until <= ? OR slot_holds.family_id = excluded.family_id''',
+              (family_id, held_until, slot_id, epoch_seconds(datetime.now()),
+               max_holds, family_id, now, max_holds, now))
+    conn.commit()
+    return held_until if c.rowcount == 1 else None
+
+
+def release_slot_hold(c, slot_id, family_id=None):
+    if family_id is None:
+        c.execute('DELETE FROM slot_holds WHERE slot_id = ?', (slot_id,))
+    else:
+        c.execute('DELETE FROM slot_holds WHERE slot_id = ? AND family_id = ?', (slot_id, family_id))
+    return c.rowcount
+
+
+def sweep_expired_holds(conn):
+    c = conn.cursor()
+    c.execute('DELETE FROM slot_holds WHERE held_until <= ?', (int(time.time()),))
+    conn.commit()
+    return c.rowcount
+
+
+def start_hold_sweeper(interval=None):
+    """Delete expired slot holds and expire lapsed waitlist offers every SLOT_HOLD_SWEEP_INTERVAL seconds."""
+    interval = SLOT_HOLD_SWEEP_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+
+    def run():
+        while not _hold_sweeper_stop.wait(interval):
+            # Any failure is logged and retried next interval; letting it escape would end the thread
+            try:
+                conn = get_db()
+                try:
+                    swept = sweep_expired_holds(conn)
+                    if swept:
+                        logger.debug(f"Swept {swept} expired slot holds")
+                    expired = expire_waitlist_offers(conn)
+                    if expired:
+                        logger.info(f"Expired {expired} lapsed waitlist offers")
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Slot hold sweep failed: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, name='slot-hold-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+@app.route('/api/slot_holds', methods=['POST'])
+def api_hold_slot():
+    if 'family_id' not in session or session.get('user_type') not in ('patient', 'front_office'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    data = request.get_json() or {}
+    slot_id = data.get('slot_id')
+    if not slot_id:
+        return jsonify({'success': False, 'error': 'slot_id is required'}), 400
+
+    conn = get_db()
+    try:
+        held_until = hold_slot(conn, slot_id, session['family_id'])
+        at_limit = held_until is None and active_hold_count(conn, session['family_id']) >= SLOT_HOLD_MAX_PER_FAMILY
+    finally:
+        conn.close()
+
+    if at_limit:
+        logger.info(f"Family {session['family_id']} is at the hold limit; slot {slot_id} not held")
+        return jsonify({'success': False,
+                        'error': f'You can hold at most {SLOT_HOLD_MAX_PER_FAMILY} slots at a time'}), 429
+    if held_until is None:
+        logger.info(f"Slot {slot_id} could not be held")
+        return jsonify({'success': False, 'error': 'Selected slot is no longer available'}), 409
+
+    logger.info(f"Slot {slot_id} held for family {session['family_id']} until {datetime.fromtimestamp(held_until)}")
+    return jsonify({
+        'success': True,
+        'slot_id': int(slot_id),
+        'held_until': datetime.fromtimestamp(held_until).isoformat(timespec='seconds'),
+        'hold_seconds': held_until - int(time.time()),
+    })
+
+
+@app.route('/api/slot_holds/<int:slot_id>', methods=['DELETE'])
+def api_release_slot_hold(slot_id):
+    if 'family_id' not in session or session.get('user_type') not in ('patient', 'front_office'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    conn = get_db()
+    try:
+        released = release_slot_hold(conn.cursor(), slot_id, session['family_id'])
+        conn.commit()
+    finally:
+        conn.close()
+    return jsonify({'success': True, 'released': bool(released)})
+
+
+# ----------------- Waitlist -----------------
+# Members can wait for a doctor/day that is full. When a cancellation frees a
+# slot, the request thread only queues the slot id; a worker thread offers it
+# to the highest-priority waiting member by holding it for them (see slot
+# holds above) and emailing them. The waitlist table is the source of truth;
+# each (doctor, day) keeps an in-memory heap of waiting entries that is topped
+# up from the table before every offer, so picking the next member is O(log n).
+WAITLIST_OFFER_MINUTES = int(os.getenv('WAITLIST_OFFER_MINUTES', '30'))
+# An entry left in 'Offering' this long (the worker died mid-offer) is expired by the hold sweeper
+WAITLIST_OFFERING_TIMEOUT = int(os.getenv('WAITLIST_OFFERING_TIMEOUT', '60'))  # seconds
+
+
+class WaitlistQueues:
+    """(doctor_id, day) -> heap of (-priority, entry_id), plus the highest entry id loaded so far."""
+
+    def __init__(self):
+        self._heaps = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self, conn, key):
+        heap, last_id = self._heaps.get(key, ([], 0))
+        c = conn.cursor()
+        c.execute('''SELECT id, priority FROM waitlist
+                     WHERE doctor_id = ? AND day = ? AND status = 'Waiting' AND id > ?''',
+                  (key[0], key[1], last_id))
+        for row in c.fetchall():
+            heapq.heappush(heap, (-row['priority'], row['id']))
+            last_id = max(last_id, row['id'])
+        self._heaps[key] = (heap, last_id)
+        return heap
+
+    def pop_next(self, conn, doctor_id, day):
+        """Claim the next waiting entry for doctor_id/day, or None if nobody is waiting.
+
+        Entries cancelled or served elsewhere are still in the heap; the
+        conditional UPDATE skips them.
+        """
+        key = (int(doctor_id), day)
+        with self._lock:
+            heap = self._refresh(conn, key)
+            claimed = None
+            while heap and claimed is None:
+                _, entry_id = heapq.heappop(heap)
+                c = conn.cursor()
+                c.execute("""UPDATE waitlist SET status = 'Offering', offered_until = ?
+                             WHERE id = ? AND status = 'Waiting'""",
+                          (int(time.time()) + WAITLIST_OFFERING_TIMEOUT, entry_id))
+                conn.commit()
+                if c.rowcount == 1:
+                    claimed = entry_id
+            self._prune()
+            return claimed
+
+    def _prune(self):
+        """Drop empty heaps and past days; a dropped key is reloaded from the table on its next offer."""
+        today = datetime.now().strftime('%Y-%m-%d')
+        for key in [key for key, (heap, _) in self._heaps.items() if not heap or key[1] < today]:
+            del self._heaps[key]
+
+    def prune(self):
+        with self._lock:
+            self._prune()
+
+    def push_back(self, conn, entry_id, priority, doctor_id, day):
+        conn.execute("UPDATE waitlist SET status = 'Waiting', offered_until = NULL WHERE id = ?", (entry_id,))
+        conn.commit()
+        with self._lock:
+            heap, _ = self._heaps.get((int(doctor_id), day), ([], 0))
+            heapq.heappush(heap, (-priority, entry_id))
+
+
+waitlist_queues = WaitlistQueues()
+_released_slots = queue.Queue()
+
+
+def notify_slot_released(slot_id):
+    """Called after a cancellation commits; the offer itself happens on the waitlist worker."""
+    _released_slots.put(slot_id)
+
+
+def offer_released_slot(conn, slot_id):
+    """Offer a freed slot to the next member waiting for that doctor/day; returns the waitlist entry id."""
+    c = conn.cursor()
+    c.execute('''SELECT id, doctor_id, substr(slot_time, 1, 10) AS day, slot_time, slot_ts FROM slots
+                 WHERE id = ? AND booked = 0''', (slot_id,))
+    slot = c.fetchone()
+    if not slot or slot['doctor_id'] is None or (slot['slot_ts'] or 0) <= epoch_seconds(datetime.now()):
+        return None
+
+    while True:
+        entry_id = waitlist_queues.pop_next(conn, slot['doctor_id'], slot['day'])
+        if entry_id is None:
+            return None
+        c.execute('''SELECT w.id, w.family_id, w.priority, m.first_name, m.email, d.name AS doctor_name
+                     FROM waitlist w
+                     JOIN members m ON w.member_id = m.id
+                     JOIN doctors d ON w.doctor_id = d.id
+                     WHERE w.id = ?''', (entry_id,))
+        entry = c.fetchone()
+        if entry is None:
+            continue
+
+        try:
+            # One offer per waitlist entry; it does not count against the family's own holds
+            held_until = hold_slot(conn, slot_id, entry['family_id'], minutes=WAITLIST_OFFER_MINUTES,
+                                   max_holds=None)
+        except sqlite3.Error:
+            conn.rollback()
+            waitlist_queues.push_back(conn, entry_id, entry['priority'], slot['doctor_id'], slot['day'])
+            raise
+        if held_until is None:
+            # Somebody booked or held the slot first; keep the member's place
+            waitlist_queues.push_back(conn, entry_id, entry['priority'], slot['doctor_id'], slot['day'])
+            return None
+
+        c.execute('''UPDATE waitlist SET status = 'Offered', offered_slot_id = ?, offered_until = ?
+                     WHERE id = ?''', (slot_id, held_until, entry_id))
+        conn.commit()
+        logger.info(f"Offered slot {slot_id} to waitlist entry {entry_id}")
+
+        if entry['email']:
+            try:
+                send_templated_email(entry['email'], 'An appointment slot has opened up', 'waitlist_offer',
+                                     first_name=entry['first_name'], doctor_name=entry['doctor_name'],
+                                     slot_time=slot['slot_time'], offer_minutes=WAITLIST_OFFER_MINUTES)
+            except Exception as e:
+                logger.error(f"Failed to email waitlist offer {entry_id}: {e}")
+        return entry_id
+
+
+def expire_waitlist_offers(conn):
+    """Expire offers whose hold lapsed (and entries stuck in Offering), then offer those slots again."""
+    c = conn.cursor()
+    c.execute('''UPDATE waitlist SET status = 'Expired'
+                 WHERE status IN ('Offered', 'Offering') AND offered_until <= ?
+                 RETURNING id, family_id, offered_slot_id''', (int(time.time()),))
+    expired = c.fetchall()
+    for row in expired:
+        if row['offered_slot_id'] is not None:
+            release_slot_hold(c, row['offered_slot_id'], row['family_id'])
+    conn.commit()
+    for slot_id in {row['offered_slot_id'] for row in expired if row['offered_slot_id'] is not None}:
+        notify_slot_released(slot_id)
+    waitlist_queues.prune()
+    return len(expired)
+
+
+def start_waitlist_worker():
+    def run():
+        while True:
+            slot_id = _released_slots.get()
+            # Any failure is logged and the worker moves on; letting it escape would end the thread
+            try:
+                conn = get_db()
+                try:
+                    offer_released_slot(conn, slot_id)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Waitlist offer for slot {slot_id} failed: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, name='waitlist-worker', daemon=True)
+    thread.start()
+    return thread
+
+
+@app.route('/api/waitlist', methods=['GET', 'POST'])
+def api_waitlist():
+    if 'family_id' not in session or session.get('user_type') not in ('patient', 'front_office'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    uid = session['family_id']
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        if request.method == 'GET':
+            query = '''SELECT w.id, w.member_id, m.first_name, m.last_name, w.doctor_id, d.name AS doctor_name,
+                              w.day, w.priority, w.status, w.offered_slot_id, w.created_date
+                       FROM waitlist w
+                       JOIN members m ON w.member_id = m.id
+                       JOIN doctors d ON w.doctor_id = d.id
+                       WHERE w.status IN ('Waiting', 'Offered')'''
+            params = ()
+            if session['user_type'] == 'patient':
+                query += ' AND w.family_id = ?'
+                params = (uid,)
+            c.execute(query + ' ORDER BY w.day, w.priority DESC, w.id', params)
+            return jsonify({'success': True, 'waitlist': [dict(row) for row in c.fetchall()]})
+
+        data = request.get_json() or {}
+        member_id = data.get('member_id')
+        doctor_id = data.get('doctor_id')
+        day = data.get('date')
+        if not member_id or not doctor_id or not day:
+            return jsonify({'success': False, 'error': 'member_id, doctor_id and date are required'}), 400
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+        c.execute('SELECT id, family_id FROM members WHERE id = ?', (member_id,))
+        member = c.fetchone()
+        if not member or (session['user_type'] == 'patient' and str(member['family_id']) != str(uid)):
+            return jsonify({'success': False, 'error': 'Family member not found or does not belong to your family'}), 400
+
+        # Only the front desk can move someone up the list
+        priority = int(data.get('priority') or 0) if session['user_type'] == 'front_office' else 0
+        c.execute('''INSERT INTO waitlist (member_id, family_id, doctor_id, day, priority)
+                     VALUES (?, ?, ?, ?, ?)''', (member_id, member['family_id'], doctor_id, day, priority))
+        conn.commit()
+        return jsonify({'success': True, 'waitlist_id': c.lastrowid, 'message': 'Added to waitlist'})
+    except sqlite3.IntegrityError:
+        return jsonify({'success': False, 'error': 'This member is already on the waitlist for that day'}), 400
+    finally:
+        conn.close()
+
+
+@app.route('/api/waitlist/<int:waitlist_id>', methods=['DELETE'])
+def api_leave_waitlist(waitlist_id):
+    if 'family_id' not in session or session.get('user_type') not in ('patient', 'front_office'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        if session['user_type'] == 'patient':
+            c.execute("UPDATE waitlist SET status = 'Cancelled' WHERE id = ? AND family_id = ?",
+                      (waitlist_id, session['family_id']))
+        else:
+            c.execute("UPDATE waitlist SET status = 'Cancelled' WHERE id = ?", (waitlist_id,))
+        conn.commit()
+        if c.rowcount == 0:
+            return jsonify({'success': False, 'error': 'Waitlist entry not found'}), 404
+        return jsonify({'success': True, 'message': 'Removed from waitlist'})
+    finally:
+        conn.close()
+
 
-# Add these imports at the top
-import hashlib
-from werkzeug.security import generate_password_hash, check_password_hash
 @app.route('/api/available_slots', methods=['GET'])
 def api_available_slots():
     print("=== /api/available_slots GET endpoint called ===")
@@ -282,59 +1467,25 @@ def api_available_slots():
         print(f"👨‍⚕️ Doctor found: {doctor['name']} ({doctor['specialty']})")
 
         # --- Fetch available (unbooked) slots ---
-        c.execute('''
-            SELECT s.id, s.slot_time, d.name AS doctor_name, d.specialty
-            FROM slots s
-            JOIN doctors d ON s.doctor_id = d.id
-            WHERE s.doctor_id = ?
-            AND STRFTIME('%Y-%m-%d', s.slot_time) = ?
-            AND s.id NOT IN (
-                SELECT slot_id FROM appointments WHERE status IN ('Scheduled', 'Confirmed')
-            )
-            AND s.booked = 0
-            ORDER BY s.slot_time
-        ''', (doctor_id, date))
-
-        available_slots = c.fetchall()
-        print("Available_slots",available_slots)
-        print(f"🟢 Found {len(available_slots)} unbooked slots for doctor {doctor_id} on {date}")
-
-        formatted_slots = []
-        for slot in available_slots:
-            slot = dict(slot)
-            slot_time = slot['slot_time']
-
-            try:
-                # Handle both formats
-                if slot_time.count(':') == 2:
-                    dt = datetime.strptime(slot_time.strip(), '%Y-%m-%d %H:%M:%S')
-                elif slot_time.count(':') == 1:
-                    dt = datetime.strptime(slot_time.strip(), '%Y-%m-%d %H:%M')
-                else:
-                    print(f"⚠️ Unexpected format: {slot_time}")
-                    continue
-
-                slot_datetime = dt
-                slot_date = slot_datetime.date()
-                slot_time_only = slot_datetime.time()
-
-                # Filter out past slots for current day
-                if slot_date == current_date and slot_time_only <= current_time:
-                    print(f"⏰ Skipping past slot: {slot_time} (current time: {current_time})")
-                    continue
-
-                formatted_slots.append({
-                    'id': slot['id'],
-                    'slot_time': slot_time,
-                    'display': dt.strftime('%H:%M'),
-                    'date': dt.strftime('%Y-%m-%d'),
-                    'time': dt.strftime('%H:%M'),
-                    'doctor_name': slot['doctor_name'],
-                    'specialty': slot['specialty'],
-                    'formatted_display': f"{dt.strftime('%H:%M')} - Dr. {slot['doctor_name']}"
-                })
-            except Exception as e:
-                print(f"⚠️ Error formatting slot {slot_time}: {e}")
+        # Served from the in-memory availability index; slot_ts > now drops past slots
+        day = target_date.strftime('%Y-%m-%d')
+        available_slots = availability_index.free_slots(conn, doctor['id'], day,
+                                                        after_ts=epoch_seconds(current_datetime))
+        held = held_slot_ids(conn, session.get('family_id'), doctor['id'], day)
+        if held:
+            available_slots = [slot for slot in available_slots if slot[1] not in held]
+        print(f"🟢 Found {len(available_slots)} upcoming unbooked slots for doctor {doctor_id} on {date}")
+
+        formatted_slots = [{
+            'id': slot_id,
+            'slot_time': slot_time,
+            'display': slot_clock,
+            'date': slot_date,
+            'time': slot_clock,
+            'doctor_name': doctor['name'],
+            'specialty': doctor['specialty'],
+            'formatted_display': f"{slot_clock} - Dr. {doctor['name']}"
+        } for _, slot_id, slot_time, slot_date, slot_clock in available_slots]
 
         conn.close()
 
@@ -356,6 +1507,84 @@ def api_available_slots():
         traceback.print_exc()
         return jsonify({'error': 'Failed to load available slots'}), 500
 
+
+AVAILABILITY_SEARCH_MAX_LIMIT = 100
+
+
+@app.route('/api/availability/search', methods=['GET'])
+def api_availability_search():
+    """Earliest free slots across every doctor of a specialty.
+
+    Each doctor's free slots come from the availability index as a time-ordered
+    iterator; heapq.merge interleaves them and stops after `limit` results, so
+    only the days actually reached are ever loaded. The window is capped at
+    SLOT_HORIZON_DAYS from its start, so a page with no matches walks at most
+    that many days per doctor. Pass the returned next_cursor as `after` for
+    the next page.
+    """
+    if 'family_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    specialty = request.args.get('specialty')
+    try:
+        now = datetime.now()
+        first_day = datetime.strptime(request.args.get('from') or now.strftime('%Y-%m-%d'), '%Y-%m-%d').date()
+        # Past days never have free slots
+        first_day = max(first_day, now.date())
+        last_day = first_day + timedelta(days=SLOT_HORIZON_DAYS)
+        if request.args.get('to'):
+            last_day = min(last_day, datetime.strptime(request.args['to'], '%Y-%m-%d').date())
+        limit = min(max(int(request.args.get('limit', 20)), 1), AVAILABILITY_SEARCH_MAX_LIMIT)
+
+        # Keyset cursor: '<slot_ts>:<slot_id>' of the last slot already returned
+        after = request.args.get('after')
+        after_key = tuple(int(part) for part in after.split(':')) if after else None
+        after_ts = epoch_seconds(now)
+        if after_key is not None:
+            if len(after_key) != 2 or after_key[0] < 0:
+                raise ValueError('bad cursor')
+            after_ts = max(after_ts, after_key[0] - 1)
+            first_day = max(first_day, (datetime(1970, 1, 1) + timedelta(seconds=after_key[0])).date())
+    except (ValueError, OverflowError):
+        # OverflowError: a from/to or cursor so close to year 9999 that the window runs past it
+        return jsonify({'success': False, 'error': 'Use YYYY-MM-DD for from/to, an integer limit and a cursor from next_cursor'}), 400
+    first_day, last_day = first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d')
+
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        if specialty:
+            c.execute('SELECT id, name, specialty FROM doctors WHERE specialty = ? COLLATE NOCASE', (specialty,))
+        else:
+            c.execute('SELECT id, name, specialty FROM doctors')
+        doctors = {row['id']: dict(row) for row in c.fetchall()}
+        held = held_slot_ids(conn, session['family_id'])
+
+        def doctor_stream(doctor_id):
+            for slot_ts, slot_id, slot_time, slot_date, slot_clock in availability_index.iter_free_slots(
+                    conn, doctor_id, first_day, last_day, after_ts):
+                if slot_id in held or (after_key is not None and (slot_ts, slot_id) <= after_key):
+                    continue
+                yield slot_ts, slot_id, doctor_id, slot_time, slot_date, slot_clock
+
+        merged = heapq.merge(*(doctor_stream(doctor_id) for doctor_id in doctors))
+        page = list(itertools.islice(merged, limit + 1))
+    finally:
+        conn.close()
+
+    slots = [{
+        'id': slot_id,
+        'doctor_id': doctor_id,
+        'doctor_name': doctors[doctor_id]['name'],
+        'specialty': doctors[doctor_id]['specialty'],
+        'slot_time': slot_time,
+        'date': slot_date,
+        'time': slot_clock,
+    } for slot_ts, slot_id, doctor_id, slot_time, slot_date, slot_clock in page[:limit]]
+    next_cursor = f"{page[limit - 1][0]}:{page[limit - 1][1]}" if len(page) > limit else None
+
+    return jsonify({'success': True, 'slots': slots, 'next_cursor': next_cursor})
+
 @app.route('/api/upload_medical_record', methods=['POST'])
 def upload_medical_record():
     try:
@@ -495,6 +1724,35 @@ def view_medical_record(record_id):
 # Get all medical records for front office - FIXED VERSION
 # Get all medical records for front office - USING SQLITE CONNECTION
 # Get all medical records for front office - COMPLETE DATA VERSION
+MEDICAL_RECORDS_SELECT = '''mr.id, mr.record_type, mr.record_date, mr.description, mr.file_path,
+    mr.uploaded_date, mr.member_id, m.first_name, m.last_name, m.phone, m.email, m.age, m.gender'''
+MEDICAL_RECORDS_FROM = 'medical_records mr LEFT JOIN members m ON mr.member_id = m.id'
+MEDICAL_RECORDS_FILTERS = {'member_id': 'mr.member_id', 'date': 'mr.record_date'}
+NO_PRESCRIPTION = {'prescription_date': None, 'medication': None, 'doctor_name': None, 'doctor_specialty': None}
+
+
+def latest_prescriptions_by_member(c, member_ids):
+    """member_id -> latest prescription (with its doctor) for the given members, in one query."""
+    member_ids = [m for m in member_ids if m is not None]
+    if not member_ids:
+        return {}
+    placeholders = ','.join('?' * len(member_ids))
+    c.execute(f'''
+        SELECT p.member_id, p.prescription_date, p.medication,
+               d.name AS doctor_name, d.specialty AS doctor_specialty
+        FROM (
+            SELECT member_id, doctor_id, prescription_date, medication,
+                   ROW_NUMBER() OVER (PARTITION BY member_id
+                                      ORDER BY prescription_date DESC, id DESC) AS rn
+            FROM prescriptions
+            WHERE member_id IN ({placeholders})
+        ) p
+        LEFT JOIN doctors d ON p.doctor_id = d.id
+        WHERE p.rn = 1
+    ''', member_ids)
+    return {row['member_id']: dict(row) for row in c.fetchall()}
+
+
 @app.route('/api/All_medical_records', methods=['GET'])
 def get_all_medical_records():
     print("inside the get all front office medical records")
@@ -509,41 +1767,28 @@ def get_all_medical_records():
         conn = get_db()
         c = conn.cursor()
         
-        # Get ALL medical records with COMPLETE information
-        c.execute('''
-            SELECT 
-                mr.id,
-                mr.record_type,
-                mr.record_date,
-                mr.description,
-                mr.file_path,
-                mr.uploaded_date,
-                mr.member_id,
-                m.first_name,
-                m.last_name,
-                m.phone,
-                m.email,
-                m.age,
-                m.gender,
-                d.name as doctor_name,
-                d.specialty as doctor_specialty,
-                p.prescription_date,
-                p.medication
-            FROM medical_records mr
-            LEFT JOIN members m ON mr.member_id = m.id
-            LEFT JOIN prescriptions p ON p.member_id = m.id
-            LEFT JOIN doctors d ON p.doctor_id = d.id
-            ORDER BY mr.record_date DESC, mr.id DESC
-        ''')
-        
-        records = c.fetchall()
+        # One row per record; the latest prescription per member is attached
+        # below with a batched lookup, so records are never multiplied by
+        # the member's prescription count.
+        try:
+            records, pagination = admin_list(
+                c, MEDICAL_RECORDS_SELECT, MEDICAL_RECORDS_FROM,
+                sort_fields={'id': 'mr.id', 'record_date': 'mr.record_date',
+                             'uploaded_date': 'mr.uploaded_date', 'record_type': 'mr.record_type'},
+                default_sort='-record_date',
+                filters=MEDICAL_RECORDS_FILTERS,
+                args=request.args, id_expr='mr.id')
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        latest = latest_prescriptions_by_member(c, {r['member_id'] for r in records})
         print(f"Found {len(records)} raw records")
         
         # Convert to list of dictionaries with ALL data
         medical_records = []
         for record in records:
             record_dict = dict(record)
-            print(f"RAW RECORD DATA: {record_dict}")  # Debug print
+            record_dict.update(latest.get(record_dict['member_id'], NO_PRESCRIPTION))
             
             # Build patient name properly
             first_name = record_dict.get('first_name', '')
@@ -615,6 +1860,7 @@ def get_all_medical_records():
             'success': True,
             'medical_records': medical_records,
             'total_records': len(medical_records),
+            'pagination': pagination,
             'message': f'Successfully fetched {len(medical_records)} medical records'
         })
         
@@ -756,40 +2002,481 @@ def delete_medical_record(record_id):
 
 
 
-@app.route('/api/admin_dashboard', methods=['GET'])
-def admin_dashboard():
+# ----------------- Daily rollups -----------------
+# daily_rollups holds one row per (day, doctor_id, metric), kept current by the
+# triggers create_daily_rollups() installs, so reports sum a few rows per day
+# instead of aggregating appointments, bills and members on every page view.
+#   appointments:<status>   appointments, on their slot's day
+#   revenue_collected       paid bill amounts, on their payment day
+#   bills_paid              paid bill count, on their payment day
+#   pending_amount          unpaid bill amounts, on their bill day
+#   bills_pending           unpaid bill count, on their bill day
+#   registrations           new members, on their created day
+# Bills and members have no doctor; their metrics use ROLLUP_NO_DOCTOR.
+ROLLUP_NO_DOCTOR = 0
+APPOINTMENT_METRIC_PREFIX = 'appointments:'
+
+
+def rollup_where(start_day=None, end_day=None, doctor_id=None, metric_prefix=None):
+    """WHERE clause and params over daily_rollups for an inclusive 'YYYY-MM-DD' day range."""
+    where, params = [], []
+    if start_day:
+        where.append('day >= ?')
+        params.append(start_day)
+    if end_day:
+        where.append('day <= ?')
+        params.append(end_day)
+    if doctor_id is not None:
+        where.append('doctor_id = ?')
+        params.append(doctor_id)
+    if metric_prefix:
+        where.append('metric LIKE ?')
+        params.append(metric_prefix + '%')
+    return (f" WHERE {' AND '.join(where)}" if where else ''), params
+
+
+def rollup_totals(c, start_day=None, end_day=None, doctor_id=None):
+    """metric -> total over the day range (all days when no bounds are given)."""
+    where_sql, params = rollup_where(start_day, end_day, doctor_id)
+    c.execute(f'SELECT metric, SUM(value) AS total FROM daily_rollups{where_sql} GROUP BY metric', params)
+    return {row['metric']: round(row['total'], 2) for row in c.fetchall()}
+
+
+def rollup_appointment_count(totals):
+    """Appointments of every status in a rollup_totals() result."""
+    return int(sum(v for k, v in totals.items() if k.startswith(APPOINTMENT_METRIC_PREFIX)))
+
+
+def rollup_appointments_by_status(totals):
+    """status -> count from a rollup_totals() result."""
+    return {k[len(APPOINTMENT_METRIC_PREFIX):]: int(v) for k, v in totals.items()
+            if k.startswith(APPOINTMENT_METRIC_PREFIX) and v}
+
+
+def rollup_top_doctors(c, limit, start_day=None, end_day=None):
+    """[{doctor, appointments}] for the doctors with the most appointments in the day range."""
+    where_sql, params = rollup_where(start_day, end_day, metric_prefix=APPOINTMENT_METRIC_PREFIX)
+    c.execute(f'''SELECT d.name AS doctor, CAST(SUM(r.value) AS INTEGER) AS appointments
+                  FROM (SELECT doctor_id, value FROM daily_rollups{where_sql}) r
+                  JOIN doctors d ON r.doctor_id = d.id
+                  GROUP BY d.id ORDER BY appointments DESC LIMIT ?''', (*params, limit))
+    return [dict(row) for row in c.fetchall() if row['appointments']]
+
+
+def rollup_appointments_by_month(c, start_day):
+    where_sql, params = rollup_where(start_day, metric_prefix=APPOINTMENT_METRIC_PREFIX)
+    c.execute(f'''SELECT substr(day, 1, 7) AS month, CAST(SUM(value) AS INTEGER) AS appointments
+                  FROM daily_rollups{where_sql}
+                  GROUP BY month ORDER BY month''', params)
+    return [dict(row) for row in c.fetchall()]
+
+
+def rebuild_daily_rollups(c):
+    """Recompute daily_rollups from the source tables; the triggers keep it current afterwards."""
+    c.execute('DELETE FROM daily_rollups')
+    c.execute(f'''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                  SELECT substr(s.slot_time, 1, 10), COALESCE(s.doctor_id, {ROLLUP_NO_DOCTOR}),
+                         '{APPOINTMENT_METRIC_PREFIX}' || COALESCE(a.status, 'Scheduled'), COUNT(*)
+                  FROM appointments a JOIN slots s ON a.slot_id = s.id
+                  WHERE s.slot_time IS NOT NULL
+                  GROUP BY 1, 2, 3''')
+    for amount_metric, count_metric, day_expr, status_filter in (
+            ('revenue_collected', 'bills_paid', 'COALESCE(payment_date, bill_date)', "status = 'Paid'"),
+            ('pending_amount', 'bills_pending', 'bill_date', "(status IS NULL OR status != 'Paid')")):
+        c.execute(f'''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                      SELECT day, {ROLLUP_NO_DOCTOR}, metric, value FROM (
+                          SELECT substr({day_expr}, 1, 10) AS day, '{amount_metric}' AS metric, SUM(amount) AS value
+                          FROM bills WHERE {status_filter} GROUP BY 1
+                          UNION ALL
+                          SELECT substr({day_expr}, 1, 10), '{count_metric}', COUNT(*)
+                          FROM bills WHERE {status_filter} GROUP BY 1
+                      ) WHERE day IS NOT NULL''')
+    c.execute(f'''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                  SELECT substr(created_date, 1, 10), {ROLLUP_NO_DOCTOR}, 'registrations', COUNT(*)
+                  FROM members WHERE created_date IS NOT NULL
+                  GROUP BY 1''')
+
+
+def compact_daily_rollups(conn):
+    """Drop rows whose metric has gone back to zero (e.g. an appointment moved away); returns the count."""
+    c = conn.cursor()
+    c.execute('DELETE FROM daily_rollups WHERE ABS(value) < 0.005')
+    conn.commit()
+    return c.rowcount
+
+
+# ----------------- Dashboard counters -----------------
+# dashboard_counters holds one running total per (counter, key), kept current by the
+# triggers create_dashboard_counters() installs, so the dashboard reads a few dozen
+# rows however many members, appointments and rollup days have piled up.
+#   rows:<table>                    rows in each DASHBOARD_COUNT_TABLES table
+#   booked_slots                    slots with booked = 1 (key '')
+#   age_group:<group>               members per AGE_GROUP_SQL bucket
+#   rollup:<metric>                 all-time total of each daily_rollups metric
+#   doctor_appointments:<doctor>    all-time appointments per doctor id
+DASHBOARD_COUNT_TABLES = ('members', 'doctors', 'appointments', 'slots', 'bills', 'medical_records',
+                          'prescriptions', 'admins')
+AGE_GROUPS = ('0-18', '19-35', '36-50', '51-65', '65+')
+AGE_GROUP_SQL = '''CASE WHEN {age} <= 18 THEN '0-18' WHEN {age} <= 35 THEN '19-35' WHEN {age} <= 50 THEN '36-50'
+                        WHEN {age} <= 65 THEN '51-65' ELSE '65+' END'''
+
+
+def dashboard_counter_values(c, counter):
+    """key -> value for one counter."""
+    c.execute('SELECT key, value FROM dashboard_counters WHERE counter = ?', (counter,))
+    return {row['key']: row['value'] for row in c.fetchall()}
+
+
+def rebuild_dashboard_counters(c):
+    """Recompute dashboard_counters from the source tables; the triggers keep it current afterwards."""
+    c.execute('DELETE FROM dashboard_counters')
+    for table in DASHBOARD_COUNT_TABLES:
+        c.execute(f"INSERT INTO dashboard_counters (counter, key, value) SELECT 'rows', ?, COUNT(*) FROM {table}",
+                  (table,))
+    c.execute('''INSERT INTO dashboard_counters (counter, key, value)
+                 SELECT 'booked_slots', '', COUNT(*) FROM slots WHERE booked = 1''')
+    c.execute(f'''INSERT INTO dashboard_counters (counter, key, value)
+                  SELECT 'age_group', {AGE_GROUP_SQL.format(age='age')}, COUNT(*) FROM members GROUP BY 2''')
+    c.execute('''INSERT INTO dashboard_counters (counter, key, value)
+                 SELECT 'rollup', metric, SUM(value) FROM daily_rollups GROUP BY metric''')
+    c.execute('''INSERT INTO dashboard_counters (counter, key, value)
+                 SELECT 'doctor_appointments', doctor_id, SUM(value) FROM daily_rollups
+                 WHERE metric LIKE ? GROUP BY doctor_id''', (APPOINTMENT_METRIC_PREFIX + '%',))
+
+
+# ----------------- Analytics series -----------------
+# Dense per-day/week/month series over daily_rollups for the analytics charts.
+# Periods with no data are filled with 0, so a chart never has to fill gaps itself.
+ANALYTICS_METRICS = ('appointments', 'revenue_collected', 'bills_paid', 'pending_amount', 'bills_pending',
+                     'registrations')
+ANALYTICS_DEFAULT_PERIODS = {'day': 30, 'week': 12, 'month': 12}
+ANALYTICS_MAX_POINTS = int(os.getenv('ANALYTICS_MAX_POINTS', '2000'))
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', '256'))
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', '60'))  # seconds
+
+# SQL bucket for a 'YYYY-MM-DD' day; weeks start on Monday and are labelled by that date
+_PERIOD_SQL = {
+    'day': 'day',
+    'week': "date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER) + 6) % 7) || ' days')",
+    'month': 'substr(day, 1, 7)',
+}
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def period_labels(start, end, granularity):
+    """Labels of every period from the one containing start to the one containing end."""
+    current = period_start(start, granularity)
+    labels = []
+    while current <= end:
+        labels.append(current.strftime('%Y-%m' if granularity == 'month' else '%Y-%m-%d'))
+        if len(labels) > ANALYTICS_MAX_POINTS:
+            raise ValueError(f'Range is too long for granularity {granularity}: '
+                             f'more than {ANALYTICS_MAX_POINTS} points')
+        try:
+            if granularity == 'day':
+                current += timedelta(days=1)
+            elif granularity == 'week':
+                current += timedelta(weeks=1)
+            else:
+                current = (current + timedelta(days=32)).replace(day=1)
+        except OverflowError:
+            break  # current is the last period before 9999-12-31 runs out
+    return labels
+
+
+def parse_series_params(args):
+    """(metric, granularity, start date, end date, doctor_id) from the query string, or raises ValueError."""
+    metric = args.get('metric') or 'appointments'
+    base_metric = metric.split(':', 1)[0] if metric.startswith(APPOINTMENT_METRIC_PREFIX) else metric
+    if base_metric not in ANALYTICS_METRICS:
+        raise ValueError(f"metric must be one of: {', '.join(ANALYTICS_METRICS)} or appointments:<status>")
+    granularity = args.get('granularity') or 'day'
+    if granularity not in _PERIOD_SQL:
+        raise ValueError('granularity must be day, week or month')
+
+    end = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else datetime.now().date()
+    if args.get('from'):
+        start = datetime.strptime(args['from'], '%Y-%m-%d').date()
+    else:
+        start = period_start(end, granularity)
+        for _ in range(ANALYTICS_DEFAULT_PERIODS[granularity] - 1):
+            if start == datetime.min.date():
+                break  # a `to` in the first periods of year 1 has nothing earlier to walk back to
+            start = period_start(start - timedelta(days=1), granularity)
+    if start > end:
+        raise ValueError('from must not be after to')
+
+    doctor_id = args.get('doctor_id')
+    if doctor_id:
+        doctor_id = int(doctor_id)
+        if base_metric != 'appointments':
+            raise ValueError(f'{metric} is not broken down by doctor')
+    return metric, granularity, start, end, doctor_id or None
+
+
+def compute_series(conn, metric, granularity, start, end, doctor_id=None):
+    labels = period_labels(start, end, granularity)
+    if metric == 'appointments':
+        where_sql, params = rollup_where(start.isoformat(), end.isoformat(), doctor_id,
+                                         metric_prefix=APPOINTMENT_METRIC_PREFIX)
+    else:
+        where_sql, params = rollup_where(start.isoformat(), end.isoformat(), doctor_id)
+        where_sql += ' AND metric = ?'
+        params.append(metric)
+    rows = conn.execute(f'''SELECT {_PERIOD_SQL[granularity]} AS period, SUM(value) AS value
+                            FROM daily_rollups{where_sql}
+                            GROUP BY period''', params).fetchall()
+    # Counts are stored as REAL alongside amounts; hand whole numbers back as ints
+    values = {row['period']: (int(row['value']) if row['value'] == int(row['value']) else round(row['value'], 2))
+              for row in rows}
+    points = [{'period': label, 'value': values.get(label, 0)} for label in labels]
+    return {
+        'success': True,
+        'metric': metric,
+        'granularity': granularity,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'doctor_id': doctor_id,
+        'points': points,
+        'total': round(sum(point['value'] for point in points), 2),
+    }
+
+
+class SeriesCache:
+    """LRU of series results keyed by their parameters; entries expire after ANALYTICS_CACHE_TTL seconds."""
+
+    def __init__(self, max_entries=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+series_cache = SeriesCache()
+
+
+@app.route('/api/analytics/series', methods=['GET'])
+def api_analytics_series():
+    """?metric=&granularity=day|week|month&from=YYYY-MM-DD&to=YYYY-MM-DD&doctor_id="""
+    if session.get('user_type') not in ('admin', 'front_office'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
+        key = parse_series_params(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    series = series_cache.get(key)
+    if series is None:
         conn = get_db()
-        conn.row_factory = sqlite3.Row  # So we can access columns by name
-        c = conn.cursor()
+        try:
+            series = compute_series(conn, *key)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        finally:
+            conn.close()
+        series_cache.put(key, series)
+    return jsonify(series)
+
+
+# Columns the admin UI may read from each table; password hashes are never exposed
+ADMIN_TABLE_COLUMNS = {
+    'admins': ('id', 'family_id', 'username', 'first_name', 'last_name', 'email', 'created_date'),
+    'doctors': ('id', 'family_id', 'name', 'specialty', 'email', 'phone'),
+    'members': ('id', 'family_id', 'first_name', 'middle_name', 'last_name', 'age', 'gender', 'phone', 'email',
+                'aadhar', 'address', 'prev_problem', 'curr_problem', 'created_date'),
+    'appointments': ('id', 'member_id', 'slot_id', 'status'),
+    'slots': ('id', 'doctor_id', 'slot_time', 'booked'),
+    'bills': ('id', 'member_id', 'bill_date', 'amount', 'status', 'description', 'created_date', 'payment_date'),
+    'medical_records': ('id', 'member_id', 'record_type', 'record_date', 'description', 'file_path', 'uploaded_date'),
+    'prescriptions': ('id', 'member_id', 'doctor_id', 'prescription_date', 'medication', 'dosage', 'instructions',
+                      'created_date', 'frequency', 'duration', 'notes'),
+    'checkins': ('id', 'member_id', 'checkin_time', 'checkout_time', 'status', 'created_date'),
+    'families': ('id', 'user_type'),
+    'user_types': ('id', 'type_name'),
+}
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+DASHBOARD_TOP_N = 5
+DASHBOARD_SUMMARY_TTL = int(os.getenv('DASHBOARD_SUMMARY_TTL', '30'))  # seconds
+
+_dashboard_summary_cache = {'expires': 0, 'data': None}
+_dashboard_summary_lock = threading.Lock()
+
+
+def compute_dashboard_summary(conn):
+    """Counts and top-N lists for the admin dashboard.
+
+    Totals come from dashboard_counters and the lists are index-bounded, so past
+    history adds nothing to the cost; only today's and upcoming appointments are scanned.
+    """
+    c = conn.cursor()
+    now = datetime.now()
+    today_start, today_end = epoch_day_range(now)
+
+    rows = dashboard_counter_values(c, 'rows')
+    counts = {table: int(rows.get(table, 0)) for table in DASHBOARD_COUNT_TABLES}
+
+    totals = {metric: round(value, 2) for metric, value in dashboard_counter_values(c, 'rollup').items()}
+    appointments_by_status = rollup_appointments_by_status(totals)
+
+    # CROSS JOIN keeps slots as the outer loop so idx_slots_ts skips everything before today
+    c.execute('''SELECT
+                     SUM(CASE WHEN s.slot_ts < ? THEN 1 ELSE 0 END) AS today,
+                     SUM(CASE WHEN s.slot_ts > ? THEN 1 ELSE 0 END) AS upcoming
+                 FROM slots s CROSS JOIN appointments a ON a.slot_id = s.id
+                 WHERE s.slot_ts >= ? AND a.status IN ('Scheduled', 'Confirmed')''',
+              (today_end, epoch_seconds(now), today_start))
+    row = c.fetchone()
+
+    revenue = {'collected': totals.get('revenue_collected', 0),
+               'pending': totals.get('pending_amount', 0),
+               'paid_bills': int(totals.get('bills_paid', 0))}
+
+    booked_slots = int(dashboard_counter_values(c, 'booked_slots').get('', 0))
+
+    c.execute('''SELECT a.id, a.status, a.member_id, m.first_name || ' ' || m.last_name AS patient_name,
+                        d.name AS doctor_name, s.slot_time,
+                        strftime('%Y-%m-%d', s.slot_ts, 'unixepoch') AS date,
+                        strftime('%H:%M', s.slot_ts, 'unixepoch') AS time
+                 FROM appointments a
+                 JOIN slots s ON a.slot_id = s.id
+                 LEFT JOIN members m ON a.member_id = m.id
+                 LEFT JOIN doctors d ON s.doctor_id = d.id
+                 WHERE a.status IN ('Scheduled', 'Confirmed') AND s.slot_ts > ?
+                 ORDER BY s.slot_ts
+                 LIMIT ?''', (epoch_seconds(now), DASHBOARD_TOP_N))
+    upcoming_list = [dict(r) for r in c.fetchall()]
+
+    c.execute('''SELECT id, first_name, last_name, email, phone, created_date
+                 FROM members ORDER BY id DESC LIMIT ?''', (DASHBOARD_TOP_N,))
+    recent_patients = [dict(r) for r in c.fetchall()]
+
+    c.execute('''SELECT b.id, b.member_id, m.first_name || ' ' || m.last_name AS patient_name,
+                        b.amount, b.status, b.bill_date
+                 FROM bills b LEFT JOIN members m ON b.member_id = m.id
+                 ORDER BY b.id DESC LIMIT ?''', (DASHBOARD_TOP_N,))
+    recent_bills = [dict(r) for r in c.fetchall()]
+
+    c.execute('''SELECT d.name AS doctor, CAST(t.value AS INTEGER) AS appointments
+                 FROM dashboard_counters t JOIN doctors d ON d.id = CAST(t.key AS INTEGER)
+                 WHERE t.counter = 'doctor_appointments' AND t.value >= 1
+                 ORDER BY t.value DESC LIMIT ?''', (DASHBOARD_TOP_N,))
+    top_doctors = [dict(r) for r in c.fetchall()]
+
+    six_months_ago = (now.replace(day=1) - timedelta(days=5 * 31)).replace(day=1)
+    appointments_by_month = rollup_appointments_by_month(c, six_months_ago.strftime('%Y-%m-%d'))
+
+    age_groups = dashboard_counter_values(c, 'age_group')
+
+    return {
+        'success': True,
+        'generated_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'counts': counts,
+        'appointments_by_status': appointments_by_status,
+        'today_appointments': row['today'] or 0,
+        'upcoming_appointments': row['upcoming'] or 0,
+        'revenue': revenue,
+        'slots': {'total': counts['slots'], 'booked': booked_slots},
+        'upcoming_appointments_list': upcoming_list,
+        'recent_patients': recent_patients,
+        'recent_bills': recent_bills,
+        'top_doctors': top_doctors,
+        'appointments_by_month': appointments_by_month,
+        'age_groups': [{'ageGroup': group, 'patients': int(age_groups.get(group, 0))} for group in AGE_GROUPS],
+    }
 
-        tables = [
-            'admins',
-            'doctors',
-            'members',
-            'appointments',
-            'slots',
-            'bills',
-            'medical_records',
-            'prescriptions',
-            'checkins',
-            'families',
-            'user_types'
-        ]
-
-        data = {}
-
-        for table in tables:
-            rows = c.execute(f"SELECT * FROM {table}").fetchall()
-            # Convert each row to dict
-            data[table] = [dict(row) for row in rows]
-
-        return jsonify(data)
+
+@app.route('/api/admin_dashboard', methods=['GET'])
+def admin_dashboard():
+    """Dashboard summary, recomputed at most every DASHBOARD_SUMMARY_TTL seconds.
+
+    Full tables are served page by page from /api/admin/tables/<table>.
+    """
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        with _dashboard_summary_lock:
+            if _dashboard_summary_cache['expires'] <= time.time():
+                conn = get_db()
+                try:
+                    _dashboard_summary_cache['data'] = compute_dashboard_summary(conn)
+                finally:
+                    conn.close()
+                _dashboard_summary_cache['expires'] = time.time() + DASHBOARD_SUMMARY_TTL
+            return jsonify(_dashboard_summary_cache['data'])
 
     except Exception as e:
         print("Error in admin_dashboard:", e)
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/api/admin/tables/<table>', methods=['GET'])
+def admin_table_page(table):
+    """One page of a table: ?fields=a,b&limit=50&after=<last id>; pass next_cursor back as after."""
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    if table not in ADMIN_TABLE_COLUMNS:
+        return jsonify({'success': False, 'error': f'Unknown table {table}'}), 404
+
+    allowed = ADMIN_TABLE_COLUMNS[table]
+    fields = [f for f in (request.args.get('fields') or '').split(',') if f] or list(allowed)
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown fields for {table}: {', '.join(unknown)}"}), 400
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+
+    try:
+        limit = min(max(int(request.args.get('limit', ADMIN_PAGE_SIZE)), 1), ADMIN_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+    after = request.args.get('after')
+
+    conn = get_db()
+    try:
+        query = f"SELECT {', '.join(fields)} FROM {table}"
+        params = []
+        if after:
+            query += ' WHERE id > ?'
+            # families.id is TEXT, every other key is an INTEGER
+            params.append(after if table == 'families' else int(after))
+        query += ' ORDER BY id LIMIT ?'
+        params.append(limit + 1)
+        rows = [dict(row) for row in conn.execute(query, params)]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'after must be an id from next_cursor'}), 400
+    finally:
+        conn.close()
+
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return jsonify({'success': True, 'table': table, 'rows': rows[:limit], 'next_cursor': next_cursor})
+
 from flask import Flask, jsonify, session
 
 # Add this flag to control behavior: default False -> send reset link
@@ -840,7 +2527,7 @@ def api_register():
         curr_problem = data.get('curr_problem', '')
 
         # Hash password if provided
-        password_hash = generate_password_hash(password) if password else None
+        password_hash = hash_password(password) if password else None
 
         c.execute('''INSERT INTO members
             (family_id, first_name, middle_name, last_name, age, gender, phone, email, aadhar, address, prev_problem, curr_problem, password_hash)
@@ -862,17 +2549,8 @@ def api_register():
                 if SEND_PLAIN_PASSWORD_IN_EMAIL and password:
                     print("getting inside")
                     # Warning: this emails plaintext password — insecure
-                    subject = "Your account details"
-                    body = f"""
-                        <p>Hi {first_name},</p>
-                        <p>Your account has been created.</p>
-                        <ul>
-                          <li><strong>Username / Email:</strong> {email}</li>
-                          <li><strong>Password:</strong> {password}</li>
-                        </ul>
-                        <p>Please change your password after first login.</p>
-                    """
-                    send_email(email, subject, body)
+                    send_templated_email(email, "Your account details", 'account_details',
+                                         first_name=first_name, email=email, password=password)
                 else:
                     # Preferred: send password reset link so they create a password securely
                     token = generate_reset_token(email)
@@ -881,14 +2559,8 @@ def api_register():
                     reset_path = f"/reset-password?token={token}"  # adapt to your frontend route
                     reset_url = f"{base}{reset_path}"
 
-                    subject = "Set your password"
-                    body = f"""
-                        <p>Hi {first_name},</p>
-                        <p>Welcome — your account was created successfully. To set your password, click the link below (valid for 1 hour):</p>
-                        <p><a href="{reset_url}">Set your password</a></p>
-                        <p>If you didn't request this, ignore this email.</p>
-                    """
-                    send_email(email, subject, body)
+                    send_templated_email(email, "Set your password", 'set_password',
+                                         first_name=first_name, reset_url=reset_url)
             except Exception as mail_exc:
                 # Log mail failure but don't break registration
                 current_app.logger.exception("Failed to send registration email: %s", mail_exc)
@@ -964,7 +2636,7 @@ def api_front_office_register():
         curr_problem = data.get('curr_problem', '').strip()
 
         # Hash the password before storing
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
 
         # Insert member with password
         c.execute('''INSERT INTO members
@@ -1005,6 +2677,125 @@ def api_front_office_register():
         if conn:
             conn.close()
 
+# ----------------- Password hashing -----------------
+# PASSWORD_HASH_METHOD is a Werkzeug method string carrying the algorithm and its
+# cost, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Hashes made with any
+# other method (or by the unsalted sha256 of older versions) still verify, and
+# are replaced with a policy hash the next time their owner logs in.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '4'))
+
+
+class WerkzeugHasher:
+    """Salted 'method$salt$hash' strings from werkzeug.security."""
+
+    def __init__(self, method):
+        # Normalise e.g. 'pbkdf2:sha256' to the 'pbkdf2:sha256:<iterations>' prefix it writes
+        self.method = generate_password_hash('', method=method).split('$', 1)[0]
+
+    def identify(self, stored):
+        return '$' in stored
+
+    def hash(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, stored, password):
+        return check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        return stored.split('$', 1)[0] != self.method
+
+
+class LegacySHA256Hasher:
+    """Unsalted sha256 hex digests written by older versions; verified, never written."""
+
+    def identify(self, stored):
+        return len(stored) == 64 and '$' not in stored
+
+    def verify(self, stored, password):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored.lower())
+
+    def needs_rehash(self, stored):
+        return True
+
+
+class PasswordPolicy:
+    """Hashes new passwords with `hasher`; verifies with whichever known hasher matches the stored format."""
+
+    def __init__(self, hasher, legacy_hashers=()):
+        self.hasher = hasher
+        self.hashers = [hasher, *legacy_hashers]
+
+    def hash(self, password):
+        return self.hasher.hash(password)
+
+    def verify(self, stored, password):
+        """(matches, replacement hash or None when the stored one already follows the policy)."""
+        if not stored or not password:
+            return False, None
+        for hasher in self.hashers:
+            if hasher.identify(stored):
+                if not hasher.verify(stored, password):
+                    return False, None
+                needs_rehash = hasher is not self.hasher or hasher.needs_rehash(stored)
+                return True, (self.hasher.hash(password) if needs_rehash else None)
+        return False, None
+
+
+password_policy = PasswordPolicy(WerkzeugHasher(PASSWORD_HASH_METHOD), [LegacySHA256Hasher()])
+_password_hash_pool = None
+_password_hash_pool_lock = threading.Lock()
+
+
+def new_password_hash_pool():
+    """PASSWORD_HASH_WORKERS native threads; a gevent ThreadPool when threading is monkey-patched."""
+    try:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+        if monkey.is_module_patched('threading'):
+            return ThreadPool(PASSWORD_HASH_WORKERS)
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+
+
+def run_in_password_pool(fn, *args):
+    """Run a hash computation on the bounded hashing pool and wait for it.
+
+    Under gevent the pool is a dedicated gevent ThreadPool rather than the hub's
+    shared one, so hashing neither blocks other greenlets nor competes with DNS
+    and file I/O for the hub's threads. Either way at most PASSWORD_HASH_WORKERS
+    hashes run at once.
+    """
+    global _password_hash_pool
+    if _password_hash_pool is None:
+        with _password_hash_pool_lock:
+            if _password_hash_pool is None:
+                _password_hash_pool = new_password_hash_pool()
+    if isinstance(_password_hash_pool, ThreadPoolExecutor):
+        return _password_hash_pool.submit(fn, *args).result()
+    return _password_hash_pool.apply(fn, args)
+
+
+def hash_password(password):
+    return run_in_password_pool(password_policy.hash, password)
+
+
+def verify_password(stored, password):
+    """(matches, replacement hash or None); see PasswordPolicy.verify."""
+    return run_in_password_pool(password_policy.verify, stored, password)
+
+
+def start_user_session(c, user_type, family_id):
+    """Sign the caller in on a fresh session id, caching their doctors/front_office row when they have one."""
+    if isinstance(session, ServerSideSession):
+        session.rotate()
+    session['user_type'] = user_type
+    session['family_id'] = family_id
+    if user_type in PRINCIPAL_TABLES:
+        session_principal(c, user_type)
+
+
 # Update the login endpoint to support both UID and email/password
 from flask import request, jsonify, session
 import sqlite3
@@ -1033,8 +2824,7 @@ def login():
     if identifier in TEMP_CREDENTIALS:
         temp_user = TEMP_CREDENTIALS[identifier]
         if password == temp_user['password']:
-            session['user_type'] = temp_user['user_type']
-            session['family_id'] = temp_user['id']
+            start_user_session(c, temp_user['user_type'], temp_user['id'])
             print(session['user_type'])
             print(session['family_id'])
             conn.close()
@@ -1049,64 +2839,40 @@ def login():
         c.execute('SELECT * FROM members WHERE family_id = ?', (family_id,))
         user = c.fetchone()
         if user:
-            session['user_type'] = 'patient'
-            session['family_id'] = family_id
+            start_user_session(c, 'patient', family_id)
             conn.close()
             return jsonify({'success': True, 'user_type': 'patient', 'message': 'Login successful with Family ID'})
 
     elif identifier and password:  # Email/password login
-        # Check admins
-        c.execute('SELECT * FROM admins WHERE email = ?', (identifier,))
-        admin = c.fetchone()
-        if admin:
-            stored_hash = admin[3]  # password_hash is at index 3
-            # FIX: Use check_password_hash instead of sha256
-            if check_password_hash(stored_hash, password):
-                session['user_type'] = 'admin'
-                session['family_id'] = admin[1]  # id is at index 0
-                conn.close()
-                return jsonify({'success': True, 'user_type': 'admin', 'message': 'Login successful as admin'})
-
-        # Check doctors
-        c.execute('SELECT * FROM doctors WHERE email = ?', (identifier,))
-        doctor = c.fetchone()
-        if doctor:
-            stored_hash = doctor[6]  # password_hash is at index 6
-            # FIX: Use check_password_hash instead of sha256
-            if check_password_hash(stored_hash, password):
-                session['user_type'] = 'doctor'
-                session['family_id'] = doctor[1]  # id is at index 0
-                print(doctor[1])
-                conn.close()
-                print(session['user_type'],session['family_id'])
-                return jsonify({'success': True, 'user_type': 'doctor', 'message': 'Login successful as doctor'})
-
-        # Check front office
-        c.execute('SELECT * FROM front_office WHERE email = ?', (identifier,))
-        front_office = c.fetchone()
-        if front_office:
-            stored_hash = front_office[6]  # password_hash is at index 6
-            # FIX: Use check_password_hash instead of sha256
-            if check_password_hash(stored_hash, password):
-                session['user_type'] = 'front_office'
-                session['family_id'] = front_office[1]  # id is at index 0
-                conn.close()
-                return jsonify({'success': True, 'user_type': 'front_office', 'message': 'Login successful as front office'})
-
-        # Check members (patients)
-        c.execute('SELECT * FROM members WHERE email = ?', (identifier,))
-        patient = c.fetchone()
-        if patient:
-            print(patient)
-            stored_hash = patient[14]  # password_hash is at index 14
-            # FIX: Use check_password_hash for patients too
-            if check_password_hash(stored_hash, password):
-                print("hiiiiiiiii")
-                session['user_type'] = 'patient'
-                session['family_id'] = patient[1]  # family_id is at index 1
-                conn.close()
-                print(session['user_type'],session['family_id'])
-                return jsonify({'success': True, 'user_type': 'patient', 'message': 'Login successful as patient'})
+        # One indexed lookup across every role; an email registered under several
+        # roles is tried in IDENTITY_SOURCES order, as the per-table checks were
+        c.execute('''SELECT role, principal_id, family_id, password_hash FROM identities
+                     WHERE email = ? ORDER BY rank''', (identifier,))
+        identities = c.fetchall()
+        # Hashing takes far longer than the lookup; don't hold a pooled connection through it
+        conn.close()
+        for identity in identities:
+            matches, new_hash = verify_password(identity['password_hash'], password)
+            if matches:
+                role = identity['role']
+                if not new_hash and role not in PRINCIPAL_TABLES:
+                    start_user_session(None, role, identity['family_id'])
+                else:
+                    conn = get_db()
+                    try:
+                        c = conn.cursor()
+                        if new_hash:
+                            # Upgrade to the current PASSWORD_HASH_METHOD; the identities trigger follows
+                            table = next(t for r, t, _ in IDENTITY_SOURCES if r == role)
+                            c.execute(f'UPDATE {table} SET password_hash = ? WHERE id = ?',
+                                      (new_hash, identity['principal_id']))
+                            conn.commit()
+                        start_user_session(c, role, identity['family_id'])
+                    finally:
+                        conn.close()
+                print(session['user_type'], session['family_id'])
+                return jsonify({'success': True, 'user_type': role,
+                                'message': f"Login successful as {role.replace('_', ' ')}"})
 
     conn.close()
     return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
@@ -1230,6 +2996,223 @@ def api_patient_dashboard():
         logger.error(f"Error in patient dashboard: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Joins shared by the list routes and /api/admin/export/<table>
+APPOINTMENTS_SELECT = '''a.id, a.member_id, m.first_name as patient_first_name, m.last_name as patient_last_name,
+               s.doctor_id, d.name as doctor_name, s.slot_time, a.status'''
+APPOINTMENTS_FROM = '''appointments a
+               LEFT JOIN members m ON a.member_id = m.id
+               LEFT JOIN slots s ON a.slot_id = s.id
+               LEFT JOIN doctors d ON s.doctor_id = d.id'''
+APPOINTMENTS_FILTERS = {'doctor_id': 's.doctor_id', 'member_id': 'a.member_id', 'status': 'a.status',
+                        'date': 's.slot_time'}
+
+PRESCRIPTIONS_SELECT = '''p.id, p.member_id as patient_id, m.first_name as patient_first_name,
+               m.last_name as patient_last_name, p.doctor_id, d.name as doctor_name, p.prescription_date,
+               p.medication, p.dosage, p.instructions, p.frequency, p.duration, p.notes'''
+PRESCRIPTIONS_FROM = '''prescriptions p
+               LEFT JOIN members m ON p.member_id = m.id
+               LEFT JOIN doctors d ON p.doctor_id = d.id'''
+PRESCRIPTIONS_FILTERS = {'doctor_id': 'p.doctor_id', 'member_id': 'p.member_id', 'date': 'p.prescription_date'}
+
+BILLS_SELECT = 'b.*, m.first_name, m.last_name'
+BILLS_FROM = 'bills b LEFT JOIN members m ON b.member_id = m.id'
+BILLS_FILTERS = {'member_id': 'b.member_id', 'status': 'b.status', 'date': 'b.bill_date'}
+
+
+# ----------------- Admin list queries -----------------
+# Shared query params for the /api/admin/* list routes:
+#   sort=<field> or sort=-<field> (descending), from a per-route whitelist
+#   doctor_id=, member_id=, status=, from=YYYY-MM-DD, to=YYYY-MM-DD
+#   limit=, after=  keyset pagination; pass next_cursor back as after
+# Without limit/cursor a route returns every matching row, as it always has.
+ADMIN_COUNT_CAP = 10000
+
+
+def _encode_cursor(sort, key, row_id):
+    return base64.urlsafe_b64encode(json.dumps([sort, key, row_id]).encode()).decode()
+
+
+def _decode_cursor(cursor, sort):
+    try:
+        cursor_sort, key, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor was issued for a different sort')
+    return key, row_id
+
+
+def admin_list_filters(filters, args):
+    """WHERE clauses and params for the doctor_id/member_id/status/from/to params a route supports."""
+    where, params = [], []
+    for name in ('doctor_id', 'member_id', 'status'):
+        if args.get(name) and name in filters:
+            where.append(f'{filters[name]} = ?')
+            params.append(args[name])
+    if (args.get('from') or args.get('to')) and 'date' in filters:
+        start_day = datetime.strptime(args.get('from') or '0001-01-01', '%Y-%m-%d')
+        start, end = day_range(start_day, args.get('to') or '9999-12-30')
+        where.append(f"{filters['date']} >= ? AND {filters['date']} < ?")
+        params += [start, end]
+    return where, params
+
+
+def admin_list(c, select, from_clause, sort_fields, default_sort, filters, args, id_expr):
+    """Run an admin list query with the shared params; returns (rows, meta) or raises ValueError.
+
+    sort_fields maps public sort names to columns of the route's own table,
+    each backed by a (column, id) index in DB_INDEXES, so a page is an index
+    range read rather than a sort of the whole table. filters maps
+    'doctor_id' / 'member_id' / 'status' / 'date' to the column each one
+    filters on. The total is counted on the first page only and stops at
+    ADMIN_COUNT_CAP, so it stays cheap on large tables.
+    """
+    sort = args.get('sort') or default_sort
+    descending = sort.startswith('-')
+    sort_name = sort.lstrip('-')
+    if sort_name not in sort_fields:
+        raise ValueError(f"sort must be one of: {', '.join(sorted(sort_fields))}")
+    sort_col = sort_fields[sort_name]
+    direction = 'DESC' if descending else 'ASC'
+    by_id = sort_col == id_expr
+
+    where, params = admin_list_filters(filters, args)
+
+    limit = args.get('limit')
+    after = args.get('after')
+    paginated = bool(limit or after)
+    limit = min(max(int(limit or ADMIN_PAGE_SIZE), 1), ADMIN_MAX_PAGE_SIZE)
+
+    meta = {'sort': sort}
+    if paginated and not after:
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+        total = c.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {from_clause}{where_sql} LIMIT ?)',
+                          (*params, ADMIN_COUNT_CAP + 1)).fetchone()[0]
+        meta['total'] = min(total, ADMIN_COUNT_CAP)
+        meta['total_capped'] = total > ADMIN_COUNT_CAP
+
+    # (extra WHERE clauses, params) read one after another. SQLite sorts NULLs
+    # first ascending and last descending; after a cursor the NULL and non-NULL
+    # keys are separate index ranges, since a row-value comparison skips NULLs.
+    ranges = [([], [])]
+    if after:
+        key, row_id = _decode_cursor(after, sort)
+        cmp = '<' if descending else '>'
+        if by_id:
+            ranges = [([f'{id_expr} {cmp} ?'], [row_id])]
+        elif key is None:
+            ranges = [([f'{sort_col} IS NULL', f'{id_expr} {cmp} ?'], [row_id])]
+            if not descending:
+                ranges.append(([f'{sort_col} IS NOT NULL'], []))
+        else:
+            ranges = [([f'({sort_col}, {id_expr}) {cmp} (?, ?)'], [key, row_id])]
+            if descending:
+                ranges.append(([f'{sort_col} IS NULL'], []))
+
+    order_by = f'{id_expr} {direction}' if by_id else f'{sort_col} {direction}, {id_expr} {direction}'
+    rows = []
+    for range_where, range_params in ranges:
+        page_where = where + range_where
+        query = f'SELECT {select}, {sort_col} AS _sort_key, {id_expr} AS _sort_id FROM {from_clause}'
+        if page_where:
+            query += f" WHERE {' AND '.join(page_where)}"
+        query += f' ORDER BY {order_by}'
+        page_params = params + range_params
+        if paginated:
+            query += ' LIMIT ?'
+            page_params.append(limit + 1 - len(rows))
+        rows += c.execute(query, page_params).fetchall()
+        if paginated and len(rows) > limit:
+            break
+
+    if paginated:
+        meta['has_more'] = len(rows) > limit
+        rows = rows[:limit]
+        meta['next_cursor'] = (_encode_cursor(sort, rows[-1]['_sort_key'], rows[-1]['_sort_id'])
+                               if meta['has_more'] else None)
+
+    results = []
+    for row in rows:
+        item = dict(row)
+        item.pop('_sort_key')
+        item.pop('_sort_id')
+        results.append(item)
+    return results, meta
+
+
+# table -> (select, from, filters, order by, user types allowed to export it)
+EXPORT_TABLES = {
+    'appointments': (APPOINTMENTS_SELECT, APPOINTMENTS_FROM, APPOINTMENTS_FILTERS, 'a.id', ('admin', 'front_office')),
+    'bills': (BILLS_SELECT, BILLS_FROM, BILLS_FILTERS, 'b.id', ('admin', 'front_office')),
+    'prescriptions': (PRESCRIPTIONS_SELECT, PRESCRIPTIONS_FROM, PRESCRIPTIONS_FILTERS, 'p.id', ('admin',)),
+}
+EXPORT_BATCH_SIZE = 500
+
+
+def stream_export_rows(table, fmt, args):
+    """Yield an export as CSV or NDJSON chunks, EXPORT_BATCH_SIZE rows at a time.
+
+    Rows are read with fetchmany() from one open cursor, so memory stays flat
+    however large the table is. Under WAL the long read does not block writers.
+    """
+    select, from_clause, filters, order_by, _ = EXPORT_TABLES[table]
+    where, params = admin_list_filters(filters, args)
+    query = f'SELECT {select} FROM {from_clause}'
+    if where:
+        query += f" WHERE {' AND '.join(where)}"
+    query += f' ORDER BY {order_by}'
+
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute(query, params)
+        columns = [col[0] for col in c.description]
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if fmt == 'csv':
+                writer.writerows(tuple(row) for row in rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+        if fmt == 'csv' and buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        conn.close()
+
+
+@app.route('/api/admin/export/<table>', methods=['GET'])
+def api_export_table(table):
+    """Stream a table export: ?format=csv|ndjson plus the admin list filters (doctor_id, member_id, status, from, to)."""
+    if table not in EXPORT_TABLES:
+        return jsonify({'success': False, 'error': f'Unknown export {table}'}), 404
+    if session.get('user_type') not in EXPORT_TABLES[table][4]:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    try:
+        # Validate dates before the response starts streaming
+        admin_list_filters(EXPORT_TABLES[table][2], request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+    filename = f"{table}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    print(f"📤 Streaming {table} export as {fmt}")
+    return app.response_class(stream_with_context(stream_export_rows(table, fmt, request.args)),
+                              mimetype=mimetype,
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 @app.route('/api/admin/getpatientdata', methods=['GET'])
 def api_admin_get_patient_data():
     if 'family_id' not in session or session.get('user_type') != 'admin':
@@ -1249,15 +3232,23 @@ def api_admin_get_patient_data():
         # profile = dict(c.fetchone() or {})
 
         # Get family members
-        c.execute('SELECT * FROM members')
-        family_members = [dict(row) for row in c.fetchall()]
-        print("Family members fetched:", family_members)
+        family_members, pagination = admin_list(
+            c, ', '.join(f'm.{col}' for col in ADMIN_TABLE_COLUMNS['members']), 'members m',
+            sort_fields={'id': 'm.id', 'first_name': 'm.first_name', 'last_name': 'm.last_name',
+                         'age': 'm.age', 'created_date': 'm.created_date'},
+            default_sort='id',
+            filters={'member_id': 'm.id', 'date': 'm.created_date'},
+            args=request.args, id_expr='m.id')
+        print("Family members fetched:", len(family_members))
 
         conn.close()
 
         return jsonify({
             "success": True,
-            "family_members": family_members,})
+            "family_members": family_members,
+            "pagination": pagination})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print("Error fetching family members:", str(e))
         return jsonify({'error': str(e)}), 500
@@ -1281,16 +3272,23 @@ def api_admin_get_doctor_data():
         # c.execute('SELECT * FROM members WHERE family_id = ?', (uid,))
         # profile = dict(c.fetchone() or {})
 
-        # Get family members
-        c.execute('SELECT * FROM Doctors')
-        Doctors = [dict(row) for row in c.fetchall()]
-        print("Family members fetched:", Doctors)
+        # Get doctors
+        Doctors, pagination = admin_list(
+            c, ', '.join(f'd.{col}' for col in ADMIN_TABLE_COLUMNS['doctors']), 'doctors d',
+            sort_fields={'id': 'd.id', 'name': 'd.name', 'specialty': 'd.specialty'},
+            default_sort='id',
+            filters={'doctor_id': 'd.id'},
+            args=request.args, id_expr='d.id')
+        print("Doctors fetched:", len(Doctors))
 
         conn.close()
 
         return jsonify({
             "success": True,
-            "Doctors": Doctors,})
+            "Doctors": Doctors,
+            "pagination": pagination})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print("Error fetching family members:", str(e))
         return jsonify({'error': str(e)}), 500
@@ -1310,24 +3308,12 @@ def get_admin_appointments():
         c = conn.cursor()
         
         # Get appointments with patient and doctor details
-        c.execute('''
-            SELECT 
-                a.id,
-                a.member_id,
-                m.first_name as patient_first_name,
-                m.last_name as patient_last_name,
-                s.doctor_id,
-                d.name as doctor_name,
-                s.slot_time,
-                a.status
-            FROM appointments a
-            LEFT JOIN members m ON a.member_id = m.id
-            LEFT JOIN slots s ON a.slot_id = s.id
-            LEFT JOIN doctors d ON s.doctor_id = d.id
-            ORDER BY a.id DESC
-        ''')
-        
-        appointments = c.fetchall()
+        appointments, pagination = admin_list(
+            c, APPOINTMENTS_SELECT, APPOINTMENTS_FROM,
+            sort_fields={'id': 'a.id', 'status': 'a.status'},
+            default_sort='-id',
+            filters=APPOINTMENTS_FILTERS,
+            args=request.args, id_expr='a.id')
         conn.close()
 
         # Transform the data
@@ -1351,9 +3337,12 @@ def get_admin_appointments():
         print(f"✅ Found {len(appointments_list)} appointments")
         return jsonify({
             'success': True,
-            'appointments': appointments_list
+            'appointments': appointments_list,
+            'pagination': pagination
         })
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ Error fetching admin appointments: {str(e)}")
         import traceback
@@ -1374,19 +3363,13 @@ def get_admin_slots():
         c = conn.cursor()
         
         # Get slots with doctor details
-        c.execute('''
-            SELECT 
-                s.id,
-                s.doctor_id,
-                d.name as doctor_name,
-                s.slot_time,
-                s.booked
-            FROM slots s
-            LEFT JOIN doctors d ON s.doctor_id = d.id
-            ORDER BY s.slot_time DESC
-        ''')
-        
-        slots = c.fetchall()
+        slots, pagination = admin_list(
+            c, 's.id, s.doctor_id, d.name as doctor_name, s.slot_time, s.booked',
+            'slots s LEFT JOIN doctors d ON s.doctor_id = d.id',
+            sort_fields={'id': 's.id', 'slot_time': 's.slot_time'},
+            default_sort='-slot_time',
+            filters={'doctor_id': 's.doctor_id', 'date': 's.slot_time'},
+            args=request.args, id_expr='s.id')
         conn.close()
 
         # Transform the data
@@ -1407,9 +3390,12 @@ def get_admin_slots():
         print(f"✅ Found {len(slots_list)} slots")
         return jsonify({
             'success': True,
-            'slots': slots_list
+            'slots': slots_list,
+            'pagination': pagination
         })
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ Error fetching admin slots: {str(e)}")
         import traceback
@@ -1431,23 +3417,17 @@ def get_admin_medical_records():
         c = conn.cursor()
         
         # Get medical records with patient details
-        c.execute('''
-            SELECT 
-                mr.id,
-                mr.member_id as patient_id,
-                m.first_name as patient_first_name,
-                m.last_name as patient_last_name,
-                mr.record_type,
-                mr.record_date,
-                mr.description,
-                mr.file_path,
-                mr.uploaded_date
-            FROM medical_records mr
-            LEFT JOIN members m ON mr.member_id = m.id
-            ORDER BY mr.record_date DESC
-        ''')
-        
-        medical_records = c.fetchall()
+        medical_records, pagination = admin_list(
+            c,
+            '''mr.id, mr.member_id as patient_id, m.first_name as patient_first_name,
+               m.last_name as patient_last_name, mr.record_type, mr.record_date, mr.description,
+               mr.file_path, mr.uploaded_date''',
+            'medical_records mr LEFT JOIN members m ON mr.member_id = m.id',
+            sort_fields={'id': 'mr.id', 'record_date': 'mr.record_date', 'uploaded_date': 'mr.uploaded_date',
+                         'record_type': 'mr.record_type'},
+            default_sort='-record_date',
+            filters={'member_id': 'mr.member_id', 'date': 'mr.record_date'},
+            args=request.args, id_expr='mr.id')
         conn.close()
 
         # Transform the data
@@ -1468,9 +3448,12 @@ def get_admin_medical_records():
         print(f"✅ Found {len(records_list)} medical records")
         return jsonify({
             'success': True,
-            'medical_records': records_list
+            'medical_records': records_list,
+            'pagination': pagination
         })
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ Error fetching admin medical records: {str(e)}")
         import traceback
@@ -1490,28 +3473,12 @@ def get_admin_prescriptions():
         c = conn.cursor()
         
         # Get prescriptions with patient and doctor details
-        c.execute('''
-            SELECT 
-                p.id,
-                p.member_id as patient_id,
-                m.first_name as patient_first_name,
-                m.last_name as patient_last_name,
-                p.doctor_id,
-                d.name as doctor_name,
-                p.prescription_date,
-                p.medication,
-                p.dosage,
-                p.instructions,
-                p.frequency,
-                p.duration,
-                p.notes
-            FROM prescriptions p
-            LEFT JOIN members m ON p.member_id = m.id
-            LEFT JOIN doctors d ON p.doctor_id = d.id
-            ORDER BY p.prescription_date DESC
-        ''')
-        
-        prescriptions = c.fetchall()
+        prescriptions, pagination = admin_list(
+            c, PRESCRIPTIONS_SELECT, PRESCRIPTIONS_FROM,
+            sort_fields={'id': 'p.id', 'prescription_date': 'p.prescription_date', 'medication': 'p.medication'},
+            default_sort='-prescription_date',
+            filters=PRESCRIPTIONS_FILTERS,
+            args=request.args, id_expr='p.id')
         conn.close()
 
         # Transform the data
@@ -1536,9 +3503,12 @@ def get_admin_prescriptions():
         print(f"✅ Found {len(prescriptions_list)} prescriptions")
         return jsonify({
             'success': True,
-            'prescriptions': prescriptions_list
+            'prescriptions': prescriptions_list,
+            'pagination': pagination
         })
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ Error fetching admin prescriptions: {str(e)}")
         import traceback
@@ -1803,31 +3773,133 @@ def delete_admin_slot(slot_id):
         conn = get_db()
         c = conn.cursor()
 
-        # Check if slot has any appointments
-        c.execute('SELECT id FROM appointments WHERE slot_id = ?', (slot_id,))
-        appointments = c.fetchall()
-        
-        if appointments:
-            conn.close()
-            return jsonify({'error': 'Cannot delete slot with existing appointments'}), 400
+        # Check if slot has any appointments
+        c.execute('SELECT id FROM appointments WHERE slot_id = ?', (slot_id,))
+        appointments = c.fetchall()
+        
+        if appointments:
+            conn.close()
+            return jsonify({'error': 'Cannot delete slot with existing appointments'}), 400
+
+        # Delete the slot
+        c.execute('DELETE FROM slots WHERE id = ?', (slot_id,))
+
+        conn.commit()
+        conn.close()
+
+        print(f"✅ Slot {slot_id} deleted successfully")
+        return jsonify({
+            'success': True,
+            'message': 'Slot deleted successfully'
+        })
+
+    except Exception as e:
+        print(f"❌ Error deleting admin slot: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+def parse_weekly_schedule(days):
+    """Validate a list of weekday templates from the API into a weekday -> template dict."""
+    schedule = {}
+    for day in days:
+        weekday = int(day.get('weekday', -1))
+        if weekday < 0 or weekday > 6:
+            raise ValueError('weekday must be between 0 (Monday) and 6 (Sunday)')
+        if weekday in schedule:
+            raise ValueError(f'weekday {weekday} listed more than once')
+        if day.get('off'):
+            continue
+
+        template = {
+            'start_time': day.get('start_time'),
+            'end_time': day.get('end_time'),
+            'slot_minutes': int(day.get('slot_minutes') or 30),
+            'break_start': day.get('break_start') or None,
+            'break_end': day.get('break_end') or None,
+        }
+        try:
+            start, end = _minutes(template['start_time']), _minutes(template['end_time'])
+            breaks = [_minutes(t) for t in (template['break_start'], template['break_end']) if t]
+        except (AttributeError, ValueError):
+            raise ValueError(f'weekday {weekday}: times must be HH:MM')
+        if not 0 <= start < end <= 24 * 60:
+            raise ValueError(f'weekday {weekday}: start_time must be before end_time')
+        if not 5 <= template['slot_minutes'] <= 240:
+            raise ValueError(f'weekday {weekday}: slot_minutes must be between 5 and 240')
+        if len(breaks) == 1 or (breaks and not start <= breaks[0] < breaks[1] <= end):
+            raise ValueError(f'weekday {weekday}: break must lie within working hours')
+        schedule[weekday] = template
+    return schedule
+
+
+# Doctor weekly schedule template (admin)
+@app.route('/api/admin/doctors/<int:doctor_id>/schedule', methods=['GET', 'PUT'])
+def admin_doctor_schedule(doctor_id):
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+
+    conn = None
+    try:
+        conn = get_db()
+        c = conn.cursor()
+
+        c.execute('SELECT id FROM doctors WHERE id = ?', (doctor_id,))
+        if not c.fetchone():
+            return jsonify({'error': 'Doctor not found'}), 404
 
-        # Delete the slot
-        c.execute('DELETE FROM slots WHERE id = ?', (slot_id,))
+        stored = load_doctor_schedules(conn, doctor_id).get(doctor_id)
+        current = DEFAULT_WEEKLY_SCHEDULE if stored is None else stored
 
+        if request.method == 'GET':
+            return jsonify({
+                'success': True,
+                'doctor_id': doctor_id,
+                'is_default': stored is None,
+                'schedule': [dict(weekday=weekday, off=weekday not in current, **current.get(weekday, {}))
+                             for weekday in range(7)]
+            })
+
+        # PUT replaces the whole week; weekdays not listed (or with "off": true) are days off
+        data = request.get_json() or {}
+        try:
+            schedule = parse_weekly_schedule(data.get('schedule', []))
+        except ValueError as ve:
+            return jsonify({'success': False, 'error': str(ve)}), 400
+
+        c.execute('DELETE FROM doctor_schedule_templates WHERE doctor_id = ?', (doctor_id,))
+        c.executemany('''INSERT INTO doctor_schedule_templates
+                         (doctor_id, weekday, start_time, end_time, slot_minutes, break_start, break_end)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''', [
+            (doctor_id, weekday, day['start_time'], day['end_time'], day['slot_minutes'],
+             day['break_start'], day['break_end']) if day else (doctor_id, weekday, None, None, 30, None, None)
+            for weekday, day in ((weekday, schedule.get(weekday)) for weekday in range(7))
+        ])
+
+        # Only weekdays whose template actually changed get their future slots rebuilt
+        changed = {weekday for weekday in range(7) if current.get(weekday) != schedule.get(weekday)}
+        inserted, removed = regenerate_doctor_days(conn, doctor_id, changed, schedule) if changed else (0, 0)
         conn.commit()
-        conn.close()
 
-        print(f"✅ Slot {slot_id} deleted successfully")
         return jsonify({
             'success': True,
-            'message': 'Slot deleted successfully'
+            'message': 'Schedule updated successfully',
+            'changed_weekdays': sorted(changed),
+            'slots_added': inserted,
+            'slots_removed': removed
         })
 
     except Exception as e:
-        print(f"❌ Error deleting admin slot: {str(e)}")
+        if conn:
+            conn.rollback()
+        print(f"❌ Error updating doctor schedule: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Server error: {str(e)}'}), 500
+    finally:
+        if conn:
+            conn.close()
 
 
 
@@ -1967,7 +4039,7 @@ def admin_add_patient():
         random_password = ''.join(secrets.choice(alphabet) for i in range(8))
         
         # Generate password hash
-        password_hash = generate_password_hash(random_password)
+        password_hash = hash_password(random_password)
         
         # Create a new family
         c.execute('INSERT INTO families (id, user_type) VALUES (?, ?)', (family_id, 1))
@@ -2036,7 +4108,7 @@ def admin_add_user():
             # Generate a random password
             alphabet = string.ascii_letters + string.digits
             random_password = ''.join(secrets.choice(alphabet) for i in range(8))
-            password_hash = generate_password_hash(random_password)
+            password_hash = hash_password(random_password)
             
             # Map user types to database user_type values
             user_type_map = {
@@ -2702,6 +4774,7 @@ def admin_delete_user(user_type, user_id):
     try:
         conn = get_db()
         c = conn.cursor()
+        released_slot_id = None
         
         if user_type == 'patients':
             # Get family_id for this patient
@@ -2761,6 +4834,7 @@ def admin_delete_user(user_type, user_id):
                 
                 # Update the slot to available (booked = 0)
                 c.execute('UPDATE slots SET booked = 0 WHERE id = ?', (appointment['slot_id'],))
+                released_slot_id = appointment['slot_id']
                 print("deleted sucessfully")
         
         elif user_type == 'slots':
@@ -2832,6 +4906,8 @@ def admin_delete_user(user_type, user_id):
         
         conn.commit()
         conn.close()
+        if released_slot_id:
+            notify_slot_released(released_slot_id)
         
         return jsonify({'success': True, 'message': f'{user_type.capitalize()} deleted successfully'})
     
@@ -2868,11 +4944,6 @@ def admin_delete_doctor(doctor_id):
         logger.error(f"Admin delete doctor error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-# Correct imports (note the capitalization)
-from email.mime.text import MIMEText
-
-from email.mime.multipart import MIMEMultipart
-
 def send_admin_created_credentials(recipient_email, name, user_type, username, password):
     """Send email with login credentials for admin-created users"""
     
@@ -2882,201 +4953,21 @@ def send_admin_created_credentials(recipient_email, name, user_type, username, p
         'frontoffice': 'Staff Member'
     }.get(user_type, 'User')
     
-    # Create message
-    subject = f"Your {user_type_display} Account Has Been Created"
-    
-    # HTML email content
-    html = f"""
-    <html>
-        <body>
-            <h2>Welcome to Our Healthcare System, {name}!</h2>
-            <p>Your {user_type_display.lower()} account has been created by the administrator.</p>
-            <p>Here are your login details:</p>
-            <table style="border-collapse: collapse; width: 100%; max-width: 500px; margin: 20px 0;">
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #ddd; background-color: #f8f9fa; font-weight: bold; width: 40%;">Username/Email:</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">{username}</td>
-                </tr>
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #ddd; background-color: #f8f9fa; font-weight: bold;">Password:</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">{password}</td>
-                </tr>
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #ddd; background-color: #f8f9fa; font-weight: bold;">Account Type:</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">{user_type_display}</td>
-                </tr>
-            </table>
-            
-            <div style="background-color: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px; padding: 15px; margin: 20px 0;">
-                <strong>⚠️ Security Notice:</strong> 
-                <ul style="margin: 10px 0; padding-left: 20px;">
-                    <li>This is a system-generated password</li>
-                    <li>Please change your password after first login</li>
-                    <li>Keep your login credentials secure and confidential</li>
-                </ul>
-            </div>
-            
-            <p>You can access the system at: <a href="{request.host_url}login">{request.host_url}login</a></p>
-            
-            <p>If you have any questions or need assistance, please contact the system administrator.</p>
-            
-            <br>
-            <p>Best regards,<br>Healthcare System Administration</p>
-        </body>
-    </html>
-    """
-    
-    # Plain text version
-    text = f"""
-    Welcome to Our Healthcare System, {name}!
-
-    Your {user_type_display.lower()} account has been created by the administrator.
-
-    Here are your login details:
-    Username/Email: {username}
-    Password: {password}
-    Account Type: {user_type_display}
-
-    Security Notice:
-    - This is a system-generated password
-    - Please change your password after first login  
-    - Keep your login credentials secure and confidential
-
-    You can access the system at: {request.host_url}login
-
-    If you have any questions or need assistance, please contact the system administrator.
-
-    Best regards,
-    Healthcare System Administration
-    """
-    
-    # Create message container
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = MAIL_FROM
-    msg['To'] = recipient_email
-    
-    # Attach both HTML and plain text versions
-    part1 = MIMEText(text, 'plain')
-    part2 = MIMEText(html, 'html')
+    send_templated_email(recipient_email, f"Your {user_type_display} Account Has Been Created",
+                         'admin_created_credentials', name=name, username=username, password=password,
+                         account_type=user_type_display, login_url=f"{request.host_url}login")
     
-    msg.attach(part1)
-    msg.attach(part2)
-    
-    # Send email
-    with smtplib.SMTP(MAIL_SERVER, MAIL_PORT) as server:
-        server.starttls()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD)
-        server.send_message(msg)
-    
-    logger.info(f"Credentials email sent to {recipient_email} for {user_type_display} account")
+    logger.info(f"Credentials email queued for {recipient_email} for {user_type_display} account")
 
 
 def send_family_member_credentials(recipient_email, name, username, password):
     """Send email with login credentials for newly added family members"""
     
-    # Create message
-    subject = "Your Family Member Account Has Been Created"
-    
-    # HTML email content
-    html = f"""
-    <html>
-        <body>
-            <h2>Welcome to Our Healthcare System, {name}!</h2>
-            <p>Your family member account has been successfully added to the healthcare system.</p>
-            <p>Here are your login details:</p>
-            <table style="border-collapse: collapse; width: 100%; max-width: 500px; margin: 20px 0;">
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #ddd; background-color: #f8f9fa; font-weight: bold; width: 40%;">Username/Email:</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">{username}</td>
-                </tr>
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #ddd; background-color: #f8f9fa; font-weight: bold;">Password:</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">{password}</td>
-                </tr>
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #ddd; background-color: #f8f9fa; font-weight: bold;">Account Type:</td>
-                    <td style="padding: 12px; border: 1px solid #ddd;">Family Member</td>
-                </tr>
-            </table>
-            
-            <div style="background-color: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px; padding: 15px; margin: 20px 0;">
-                <strong>⚠️ Security Notice:</strong> 
-                <ul style="margin: 10px 0; padding-left: 20px;">
-                    <li>Please change your password after first login for security</li>
-                    <li>Keep your login credentials secure and confidential</li>
-                    <li>Do not share your password with anyone</li>
-                </ul>
-            </div>
-            
-            <p>You can access the system at: <a href="{request.host_url}login">{request.host_url}login</a></p>
-            
-            <p>As a family member, you can:</p>
-            <ul style="margin: 10px 0; padding-left: 20px;">
-                <li>View your medical records</li>
-                <li>Book appointments with doctors</li>
-                <li>Access your health information</li>
-                <li>Manage your profile</li>
-            </ul>
-            
-            <p>If you have any questions or need assistance, please contact the system administrator.</p>
-            
-            <br>
-            <p>Best regards,<br>Healthcare System Administration</p>
-        </body>
-    </html>
-    """
-    
-    # Plain text version
-    text = f"""
-    Welcome to Our Healthcare System, {name}!
-
-    Your family member account has been successfully added to the healthcare system.
-
-    Here are your login details:
-    Username/Email: {username}
-    Password: {password}
-    Account Type: Family Member
-
-    Security Notice:
-    - Please change your password after first login for security
-    - Keep your login credentials secure and confidential
-    - Do not share your password with anyone
-
-    You can access the system at: {request.host_url}login
-
-    As a family member, you can:
-    - View your medical records
-    - Book appointments with doctors  
-    - Access your health information
-    - Manage your profile
-
-    If you have any questions or need assistance, please contact the system administrator.
-
-    Best regards,
-    Healthcare System Administration
-    """
-    
-    # Create message container
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = MAIL_FROM
-    msg['To'] = recipient_email
-    
-    # Attach both HTML and plain text versions
-    part1 = MIMEText(text, 'plain')
-    part2 = MIMEText(html, 'html')
+    send_templated_email(recipient_email, "Your Family Member Account Has Been Created",
+                         'family_member_credentials', name=name, username=username, password=password,
+                         account_type='Family Member', login_url=f"{request.host_url}login")
     
-    msg.attach(part1)
-    msg.attach(part2)
-    
-    # Send email
-    with smtplib.SMTP(MAIL_SERVER, MAIL_PORT) as server:
-        server.starttls()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD)
-        server.send_message(msg)
-    
-    logger.info(f"Family member credentials email sent to {recipient_email}")
+    logger.info(f"Family member credentials email queued for {recipient_email}")
 
 
 @app.route('/api/doctor_dashboard')
@@ -3094,8 +4985,7 @@ def api_doctor_dashboard():
         c = conn.cursor()
         
         # Get doctor details
-        c.execute('SELECT * FROM doctors WHERE family_id = ?', (uid,))
-        doctor = c.fetchone()
+        doctor = session_principal(c, 'doctor')
         print("Doctor fetched:", doctor)
 
         if not doctor:
@@ -3117,13 +5007,13 @@ def api_doctor_dashboard():
         c.execute('''SELECT COUNT(*) as patients_today 
                      FROM appointments a 
                      JOIN slots s ON a.slot_id = s.id 
-                     WHERE s.doctor_id = ? AND date(s.slot_time) = ?''', (doctor['id'], today))
+                     WHERE s.doctor_id = ? AND s.slot_time >= ? AND s.slot_time < ?''', (doctor['id'], *day_range(today)))
         patients_today = c.fetchone()['patients_today']
         print("Patients today:", patients_today)
 
         c.execute('''SELECT COUNT(*) as prescriptions_issued 
                      FROM prescriptions p 
-                     WHERE p.doctor_id = ? AND date(p.created_date) = ?''', (doctor['id'], today))
+                     WHERE p.doctor_id = ? AND p.created_date >= ? AND p.created_date < ?''', (doctor['id'], *day_range(today)))
         prescriptions_issued = c.fetchone()['prescriptions_issued']
         print("Prescriptions issued today:", prescriptions_issued)
 
@@ -3133,8 +5023,8 @@ def api_doctor_dashboard():
                      FROM appointments a
                      JOIN slots s ON a.slot_id = s.id
                      JOIN members m ON a.member_id = m.id
-                     WHERE s.doctor_id = ? AND date(s.slot_time) = ?
-                     ORDER BY s.slot_time''', (doctor['id'], today))
+                     WHERE s.doctor_id = ? AND s.slot_time >= ? AND s.slot_time < ?
+                     ORDER BY s.slot_time''', (doctor['id'], *day_range(today)))
         upcoming_appointments = [{
             'id': row['id'],
             'patient_id': row['patient_id'],
@@ -3195,8 +5085,7 @@ def api_front_office_dashboard():
         c = conn.cursor()
 
         # Front office details
-        c.execute('SELECT * FROM front_office WHERE family_id = ?', (uid,))
-        front_office = c.fetchone()
+        front_office = session_principal(c, 'front_office')
         if not front_office:
             return jsonify({'error': 'Front office staff not found'}), 404
 
@@ -3204,30 +5093,17 @@ def api_front_office_dashboard():
         today = datetime.now().strftime('%Y-%m-%d')
         target_date = today
 
-        # Dashboard stats
-        c.execute('''SELECT COUNT(*) as scheduled_today
-                     FROM appointments a 
-                     JOIN slots s ON a.slot_id = s.id 
-                     WHERE date(s.slot_time) = ?''', (target_date,))
-        scheduled_today = c.fetchone()['scheduled_today']
+        # Dashboard stats, from the daily rollups
+        today_totals = rollup_totals(c, today, today)
+        scheduled_today = rollup_appointment_count(today_totals)
 
         pending_checkins = scheduled_today
         total_patients_today = scheduled_today
         
-        # Calculate TODAY'S COLLECTIONS based on payment_date
-        c.execute('''SELECT COALESCE(SUM(amount), 0) as todays_collections
-                     FROM bills 
-                     WHERE status = 'Paid' 
-                     AND date(payment_date) = ?''', (today,))
-        todays_collections_result = c.fetchone()
-        todays_collections = float(todays_collections_result['todays_collections']) if todays_collections_result['todays_collections'] else 0.0
-        
-        # Pending payments (bills with status other than 'Paid')
-        c.execute('''SELECT COALESCE(SUM(amount), 0) as pending_payments
-                     FROM bills 
-                     WHERE status != 'Paid' OR status IS NULL''')
-        pending_payments_result = c.fetchone()
-        pending_payments = float(pending_payments_result['pending_payments']) if pending_payments_result['pending_payments'] else 0.0
+        # Today's collections are bills paid today; pending is every unpaid bill
+        todays_collections = float(today_totals.get('revenue_collected', 0))
+        c.execute("SELECT COALESCE(SUM(value), 0) FROM daily_rollups WHERE metric = 'pending_amount'")
+        pending_payments = float(round(c.fetchone()[0], 2))
         
         insurance_claims = 5 if scheduled_today > 0 else 0
 
@@ -3238,8 +5114,8 @@ def api_front_office_dashboard():
                      JOIN slots s ON a.slot_id = s.id 
                      JOIN doctors d ON s.doctor_id = d.id 
                      JOIN members m ON a.member_id = m.id 
-                     WHERE date(s.slot_time) = ?
-                     ORDER BY s.slot_time''', (target_date,))
+                     WHERE s.slot_time >= ? AND s.slot_time < ?
+                     ORDER BY s.slot_time''', day_range(target_date))
         today_appointments = []
         for app in c.fetchall():
             slot_time = app['slot_time']
@@ -3353,7 +5229,7 @@ def api_add_family_member():
                 return jsonify({'success': False, 'error': 'Email already exists'}), 400
 
         # Hash the password before storing
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
 
         # Insert into members table with password
         c.execute('''INSERT INTO members
@@ -3508,7 +5384,122 @@ def api_delete_family_member(member_id):
         if conn:
             conn.close()
 
+# ----------------- Idempotency keys -----------------
+# Clients retrying a POST send the same Idempotency-Key header; the first
+# response is stored and replayed to every retry instead of re-running writes.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 3600)))  # seconds
+# How long a request may hold a key without storing a response; after that a
+# retry takes the key over, so a crash mid-request does not block it for the TTL
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+
+def _idempotency_key(raw_key):
+    # Scoped per caller and endpoint so two users can never collide on a key
+    scope = f"{session.get('user_type')}:{session.get('family_id')}:{request.path}:{raw_key}"
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _reserve_idempotency_key(conn, key, request_hash, now):
+    """Take key for this request; returns None once reserved, else the row of whoever holds it.
+
+    A stored response or a live lease is answered by a plain read. Only a new
+    key, an expired one, or one whose in-flight lease has lapsed is written.
+    """
+    c = conn.cursor()
+    while True:
+        c.execute('''SELECT request_hash, status_code, response_body, content_type, in_flight_until
+                     FROM idempotency_keys WHERE key = ? AND expires_ts > ?''', (key, now))
+        stored = c.fetchone()
+        if stored is not None and (stored['request_hash'] != request_hash or stored['status_code'] is not None
+                                   or (stored['in_flight_until'] or 0) > now):
+            return stored
+
+        c.execute('''INSERT INTO idempotency_keys (key, request_hash, expires_ts, in_flight_until)
+                     VALUES (?, ?, ?, ?)
+                     ON CONFLICT(key) DO UPDATE SET request_hash = excluded.request_hash, status_code = NULL,
+                         response_body = NULL, content_type = NULL, expires_ts = excluded.expires_ts,
+                         in_flight_until = excluded.in_flight_until
+                     WHERE idempotency_keys.expires_ts <= ?
+                        OR (idempotency_keys.status_code IS NULL
+                            AND COALESCE(idempotency_keys.in_flight_until, 0) <= ?
+                            AND idempotency_keys.request_hash = excluded.request_hash)''',
+                  (key, request_hash, now + IDEMPOTENCY_KEY_TTL, now + IDEMPOTENCY_LEASE_SECONDS, now, now))
+        reserved = c.rowcount == 1
+        conn.commit()
+        if reserved:
+            return None
+        # Another request reserved or finished the key in between; look again
+
+
+def idempotent(view):
+    """Honor the Idempotency-Key header on a POST route.
+
+    A replay with the same key returns the stored status and body. Reusing a
+    key with a different payload is a 422, and a retry that arrives while the
+    first request is still running is a 409, until IDEMPOTENCY_LEASE_SECONDS
+    pass without a response being stored. Server errors are not stored, so
+    the client can retry them.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        raw_key = request.headers.get('Idempotency-Key')
+        if not raw_key or request.method != 'POST':
+            return view(*args, **kwargs)
+
+        key = _idempotency_key(raw_key)
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        now = int(time.time())
+        lease = now + IDEMPOTENCY_LEASE_SECONDS
+
+        conn = get_db()
+        try:
+            stored = _reserve_idempotency_key(conn, key, request_hash, now)
+            if stored is not None:
+                if stored['request_hash'] != request_hash:
+                    return jsonify({'success': False,
+                                    'error': 'Idempotency-Key was already used with a different request'}), 422
+                if stored['status_code'] is None:
+                    return jsonify({'success': False,
+                                    'error': 'A request with this Idempotency-Key is still being processed'}), 409
+                logger.info(f"Replaying stored response for Idempotency-Key {raw_key}")
+                response = app.response_class(stored['response_body'], status=stored['status_code'],
+                                              content_type=stored['content_type'])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+        finally:
+            conn.close()
+
+        response = None
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            return response
+        finally:
+            conn = get_db()
+            try:
+                # Matching on our lease leaves the key alone if a retry has taken it over meanwhile
+                if response is not None and response.status_code < 500:
+                    conn.execute('''UPDATE idempotency_keys
+                                    SET status_code = ?, response_body = ?, content_type = ?, in_flight_until = NULL
+                                    WHERE key = ? AND in_flight_until = ?''',
+                                 (response.status_code, response.get_data(), response.content_type, key, lease))
+                else:
+                    conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND in_flight_until = ?', (key, lease))
+                conn.commit()
+            finally:
+                conn.close()
+
+    return wrapper
+
+
+def purge_expired_idempotency_keys(conn):
+    c = conn.cursor()
+    c.execute('DELETE FROM idempotency_keys WHERE expires_ts <= ?', (int(time.time()),))
+    conn.commit()
+    return c.rowcount
+
+
 @app.route('/api/book_appointment', methods=['GET', 'POST'])
+@idempotent
 def api_book_appointment():
     # generate_slots_for_doctor(doctor_id=1,days=7)
     if 'family_id' not in session or session.get('user_type') != 'patient':
@@ -3541,53 +5532,33 @@ def api_book_appointment():
             print(f"⏰ Current time: {current_time}")
             print("📅 Fetching available slots (future + not booked)...")
             
-            # Get slots that are in future AND not booked (using both methods for safety)
-            c.execute('''SELECT s.id, s.slot_time, d.name as doctor_name, d.specialty, d.id as doctor_id
-                         FROM slots s 
-                         JOIN doctors d ON s.doctor_id = d.id 
-                         WHERE s.slot_time > ? 
-                         AND s.booked = 0
-                         AND s.id NOT IN (
-                             SELECT slot_id FROM appointments WHERE status IN ('Scheduled', 'Confirmed')
-                         )
-                         ORDER BY s.slot_time, d.name''', (current_time,))
-            
-            available_slots = c.fetchall()
-            print(f"🎯 Available slots found: {len(available_slots)}")
-            
+            # Future, unbooked slots from the in-memory availability index
+            doctors_by_id = {doctor['id']: doctor for doctor in doctors}
+            free_by_doctor = availability_index.upcoming_free_slots(conn, epoch_seconds(datetime.now()),
+                                                                    doctor_ids=doctors_by_id)
+            held = held_slot_ids(conn, uid)
+            free_slots = sorted(
+                (slot_ts, doctors_by_id[doctor_id]['name'], doctor_id, slot_id, slot_time, slot_date, slot_clock)
+                for doctor_id, doctor_slots in free_by_doctor.items()
+                for slot_ts, slot_id, slot_time, slot_date, slot_clock in doctor_slots
+                if slot_id not in held
+            )
+
             slots = []
-            for i, row in enumerate(available_slots):
-                slot = dict(row)
-                print(f"   Slot {i+1} raw: {slot}")
-                
-                # Format the slot_time for frontend display
-                slot_time = slot['slot_time']
-                try:
-                    # Try different time formats
-                    if ':' in slot_time and slot_time.count(':') == 2:
-                        dt = datetime.strptime(slot_time, '%Y-%m-%d %H:%M:%S')
-                    elif ':' in slot_time and slot_time.count(':') == 1:
-                        dt = datetime.strptime(slot_time, '%Y-%m-%d %H:%M')
-                    else:
-                        print(f"   ⚠️ Unknown time format: {slot_time}")
-                        continue  # Skip invalid formats
-                    
-                    # Only include slots that are in the future
-                    if dt <= datetime.now():
-                        print(f"   ⏰ Skipping past slot: {slot_time}")
-                        continue
-                    
-                    slot['date'] = dt.strftime('%Y-%m-%d')
-                    slot['time'] = dt.strftime('%H:%M')
-                    slot['display'] = f"{dt.strftime('%Y-%m-%d %H:%M')} - Dr. {slot['doctor_name']} ({slot['specialty']})"
-                    slot['formatted_time'] = dt.strftime('%H:%M')
-                    print(f"   ✅ Available slot: {slot['display']}")
-                    
-                    slots.append(slot)
-                    
-                except Exception as e:
-                    print(f"   ❌ Error formatting slot time {slot_time}: {e}")
-                    continue  # Skip this slot
+            for _, doctor_name, doctor_id, slot_id, slot_time, slot_date, slot_clock in free_slots:
+                specialty = doctors_by_id[doctor_id]['specialty']
+                slots.append({
+                    'id': slot_id,
+                    'slot_time': slot_time,
+                    'doctor_name': doctor_name,
+                    'specialty': specialty,
+                    'doctor_id': doctor_id,
+                    'date': slot_date,
+                    'time': slot_clock,
+                    'display': f"{slot_date} {slot_clock} - Dr. {doctor_name} ({specialty})",
+                    'formatted_time': slot_clock,
+                })
+            print(f"🎯 Available slots found: {len(slots)}")
 
             conn.close()
 
@@ -3639,7 +5610,7 @@ def api_book_appointment():
             c = conn.cursor()
 
             # Verify slot exists
-            c.execute('SELECT doctor_id, slot_time FROM slots WHERE id = ?', (slot_id,))
+            c.execute('SELECT doctor_id, slot_time, slot_ts FROM slots WHERE id = ?', (slot_id,))
             slot = c.fetchone()
             if not slot:
                 error_msg = 'Selected slot not found'
@@ -3648,24 +5619,13 @@ def api_book_appointment():
 
             print(f"✅ Slot found: {slot['slot_time']} for doctor {slot['doctor_id']}")
 
-            # Check if slot is in the future
-            slot_time_str = slot['slot_time']
-            try:
-                # Handle both time formats
-                if ':' in slot_time_str and slot_time_str.count(':') == 2:
-                    slot_time = datetime.strptime(slot_time_str, '%Y-%m-%d %H:%M:%S')
-                elif ':' in slot_time_str and slot_time_str.count(':') == 1:
-                    slot_time = datetime.strptime(slot_time_str, '%Y-%m-%d %H:%M')
-                else:
-                    error_msg = f'Invalid slot time format: {slot_time_str}'
-                    print(f"❌ {error_msg}")
-                    return jsonify({'success': False, 'error': error_msg}), 400
-            except ValueError as e:
-                error_msg = f'Invalid slot time format: {slot_time_str}'
-                print(f"❌ {error_msg}: {e}")
+            # Check if slot is in the future (slot_ts is NULL when slot_time is unparseable)
+            if slot['slot_ts'] is None:
+                error_msg = f"Invalid slot time format: {slot['slot_time']}"
+                print(f"❌ {error_msg}")
                 return jsonify({'success': False, 'error': error_msg}), 400
 
-            if slot_time <= datetime.now():
+            if slot['slot_ts'] <= epoch_seconds(datetime.now()):
                 error_msg = 'Cannot book past time slots'
                 print(f"❌ Past slot: {error_msg}")
                 return jsonify({'success': False, 'error': error_msg}), 400
@@ -3676,18 +5636,6 @@ def api_book_appointment():
                 print(f"❌ Doctor mismatch: {error_msg}")
                 return jsonify({'success': False, 'error': error_msg}), 400
 
-            # Check for existing bookings (exclude current appointment if rescheduling)
-            if appointment_id:
-                c.execute('SELECT id FROM appointments WHERE slot_id = ? AND status = "Scheduled" AND id != ?', (slot_id, appointment_id))
-            else:
-                c.execute('SELECT id FROM appointments WHERE slot_id = ? AND status = "Scheduled"', (slot_id,))
-            
-            existing_booking = c.fetchone()
-            if existing_booking:
-                error_msg = 'Selected slot is already booked'
-                print(f"❌ Slot already booked: {error_msg}")
-                return jsonify({'success': False, 'error': error_msg}), 400
-
             # Verify member belongs to the family
             c.execute('SELECT id FROM members WHERE id = ? AND family_id = ?', (member_id, uid))
             member = c.fetchone()
@@ -3696,14 +5644,39 @@ def api_book_appointment():
                 print(f"❌ Member validation failed: {error_msg}")
                 return jsonify({'success': False, 'error': error_msg}), 400
 
+            # Claim the slot and write the appointment in one write transaction
+            begin_immediate(conn)
+            old_slot_id = None
+            if appointment_id:
+                # Only the family's own appointments can be moved
+                c.execute('''SELECT a.slot_id FROM appointments a
+                             JOIN members m ON a.member_id = m.id
+                             WHERE a.id = ? AND m.family_id = ?''', (appointment_id, uid))
+                current = c.fetchone()
+                if not current:
+                    conn.rollback()
+                    error_msg = 'Appointment not found'
+                    print(f"❌ Reschedule failed: {error_msg}")
+                    return jsonify({'success': False, 'error': error_msg}), 404
+                old_slot_id = current['slot_id']
+
+            print(f"🔒 Claiming slot {slot_id}")
+            if str(old_slot_id) != str(slot_id) and not claim_slot(c, slot_id, appointment_id, uid):
+                conn.rollback()
+                error_msg = 'Selected slot is already booked'
+                print(f"❌ Slot already booked: {error_msg}")
+                return jsonify({'success': False, 'error': error_msg}), 400
+
+            # Booking a slot offered from the waitlist closes the offer
+            c.execute("""UPDATE waitlist SET status = 'Booked'
+                         WHERE offered_slot_id = ? AND family_id = ? AND status = 'Offered'""", (slot_id, uid))
+
             # Insert or update appointment
             if appointment_id:
                 print(f"🔄 Rescheduling appointment {appointment_id} to slot {slot_id}")
                 c.execute('UPDATE appointments SET slot_id = ?, status = "Scheduled" WHERE id = ?', (slot_id, appointment_id))
-                if c.rowcount == 0:
-                    error_msg = 'Failed to reschedule appointment'
-                    print(f"❌ Reschedule failed: {error_msg}")
-                    return jsonify({'success': False, 'error': error_msg}), 400
+                if old_slot_id is not None and str(old_slot_id) != str(slot_id):
+                    c.execute('UPDATE slots SET booked = 0 WHERE id = ?', (old_slot_id,))
                 action = "rescheduled"
                 new_appointment_id = appointment_id
             else:
@@ -3712,12 +5685,6 @@ def api_book_appointment():
                 new_appointment_id = c.lastrowid
                 action = "booked"
 
-            # MARK THE SLOT AS BOOKED
-            print(f"🔒 Marking slot {slot_id} as booked")
-            c.execute('UPDATE slots SET booked = 1 WHERE id = ?', (slot_id,))
-            if c.rowcount == 0:
-                print(f"⚠️ Could not mark slot {slot_id} as booked")
-
             # Generate bill for the appointment
             try:
                 # Get doctor's consultation fee
@@ -3743,6 +5710,12 @@ def api_book_appointment():
                 'appointment_id': new_appointment_id
             })
 
+        except sqlite3.IntegrityError as e:
+            # uq_appointments_active_slot caught a double booking the claim did not
+            print(f"❌ Slot already booked: {str(e)}")
+            if conn:
+                conn.rollback()
+            return jsonify({'success': False, 'error': 'Selected slot is already booked'}), 400
         except Exception as e:
             print(f"❌ ERROR in book appointment POST API: {str(e)}")
             import traceback
@@ -3881,6 +5854,7 @@ def api_cancel_appointment(appointment_id):
         
         conn.commit()
         conn.close()
+        notify_slot_released(appointment['slot_id'])
         
         return jsonify({'success': True, 'message': 'Appointment cancelled successfully'})
         
@@ -3904,17 +5878,16 @@ def api_doctor_patients():
         c = conn.cursor()
 
         # Get doctor
-        c.execute('SELECT * FROM doctors WHERE family_id = ?', (uid,))
-        doctor = dict(c.fetchone() or {})
+        doctor = dict(session_principal(c, 'doctor') or {})
 
         # Get patients with last visit
         c.execute('''SELECT m.*, MAX(s.slot_time) as last_visit
                      FROM members m
                      JOIN appointments a ON m.id = a.member_id
                      JOIN slots s ON a.slot_id = s.id
-                     WHERE s.doctor_id = (SELECT id FROM doctors WHERE family_id = ?)
+                     WHERE s.doctor_id = ?
                      GROUP BY m.id
-                     ORDER BY last_visit DESC''', (uid,))
+                     ORDER BY last_visit DESC''', (doctor.get('id'),))
         patients = [dict(row) for row in c.fetchall()]
 
         conn.close()
@@ -3936,8 +5909,7 @@ def api_doctor_schedule():
         c = conn.cursor()
 
         # Get doctor
-        c.execute('SELECT * FROM doctors WHERE family_id = ?', (uid,))
-        doctor = dict(c.fetchone() or {})
+        doctor = dict(session_principal(c, 'doctor') or {})
 
         # Get schedule
         c.execute('''SELECT s.*, 
@@ -3946,8 +5918,8 @@ def api_doctor_schedule():
                      FROM slots s
                      LEFT JOIN appointments a ON s.id = a.slot_id
                      LEFT JOIN members m ON a.member_id = m.id
-                     WHERE s.doctor_id = (SELECT id FROM doctors WHERE family_id = ?)
-                     ORDER BY s.slot_time''', (uid,))
+                     WHERE s.doctor_id = ?
+                     ORDER BY s.slot_time''', (doctor.get('id'),))
         schedule = [dict(row) for row in c.fetchall()]
 
         conn.close()
@@ -3968,31 +5940,20 @@ def api_doctor_appointments():
         c = conn.cursor()
 
         # Get doctor
-        c.execute('SELECT * FROM doctors WHERE family_id = ?', (uid,))
-        doctor = dict(c.fetchone() or {})
+        doctor = dict(session_principal(c, 'doctor') or {})
 
         # Get appointments - ADD patient_id to the SELECT
+        # slot_time is returned as the date part and time as HH:MM, formatted in SQL from slot_ts
         c.execute('''SELECT a.id, m.id as patient_id, m.first_name, m.last_name, m.phone, m.email, 
-                            s.slot_time, a.status
+                            COALESCE(strftime('%Y-%m-%d', s.slot_ts, 'unixepoch'), s.slot_time) as slot_time,
+                            COALESCE(strftime('%H:%M', s.slot_ts, 'unixepoch'), 'N/A') as time,
+                            a.status
                      FROM appointments a 
                      JOIN slots s ON a.slot_id = s.id 
                      JOIN members m ON a.member_id = m.id 
-                     WHERE s.doctor_id = (SELECT id FROM doctors WHERE family_id = ?)
-                     ORDER BY s.slot_time DESC''', (uid,))
-        
-        appointments = []
-        for row in c.fetchall():
-            appointment = dict(row)
-            # Format the slot_time for frontend
-            slot_time = appointment['slot_time']
-            try:
-                dt = datetime.strptime(slot_time, '%Y-%m-%d %H:%M:%S')
-                appointment['slot_time'] = dt.strftime('%Y-%m-%d')
-                appointment['time'] = dt.strftime('%H:%M')
-            except:
-                appointment['slot_time'] = slot_time
-                appointment['time'] = 'N/A'
-            appointments.append(appointment)
+                     WHERE s.doctor_id = ?
+                     ORDER BY s.slot_ts DESC''', (doctor.get('id'),))
+        appointments = [dict(row) for row in c.fetchall()]
 
         conn.close()
         return jsonify({'doctor': doctor, 'appointments': appointments})
@@ -4013,8 +5974,7 @@ def api_doctor_prescriptions():
         c = conn.cursor()
 
         # Get doctor
-        c.execute('SELECT * FROM doctors WHERE family_id = ?', (uid,))
-        doctor = dict(c.fetchone() or {})
+        doctor = dict(session_principal(c, 'doctor') or {})
 
         if request.method == 'POST':
             data = request.json
@@ -4045,8 +6005,8 @@ def api_doctor_prescriptions():
                      FROM prescriptions p
                      JOIN members m ON p.member_id = m.id
                      JOIN doctors d ON p.doctor_id = d.id
-                     WHERE p.doctor_id = (SELECT id FROM doctors WHERE family_id = ?)
-                     ORDER BY p.prescription_date DESC''', (uid,))
+                     WHERE p.doctor_id = ?
+                     ORDER BY p.prescription_date DESC''', (doctor.get('id'),))
         prescriptions = [dict(row) for row in c.fetchall()]
 
         # Patients for dropdown
@@ -4054,8 +6014,8 @@ def api_doctor_prescriptions():
                      FROM members m
                      JOIN appointments a ON m.id = a.member_id
                      JOIN slots s ON a.slot_id = s.id
-                     WHERE s.doctor_id = (SELECT id FROM doctors WHERE family_id = ?)
-                     ORDER BY m.first_name''', (uid,))
+                     WHERE s.doctor_id = ?
+                     ORDER BY m.first_name''', (doctor.get('id'),))
         patients = [dict(row) for row in c.fetchall()]
 
         conn.close()
@@ -4133,8 +6093,7 @@ def api_doctor_medical_records():
         c = conn.cursor()
         
         # Get doctor details
-        c.execute('SELECT * FROM doctors WHERE family_id = ?', (uid,))
-        doctor = dict(c.fetchone() or {})
+        doctor = dict(session_principal(c, 'doctor') or {})
         
         # Get medical records of patients who visited this dotcor
         c.execute('''SELECT mr.*, m.first_name, m.last_name 
@@ -4144,9 +6103,9 @@ def api_doctor_medical_records():
                          SELECT DISTINCT a.member_id 
                          FROM appointments a 
                          JOIN slots s ON a.slot_id = s.id 
-                         WHERE s.doctor_id = (SELECT id FROM doctors WHERE family_id = ?)
+                         WHERE s.doctor_id = ?
                      )
-                     ORDER BY mr.record_date DESC''', (uid,))
+                     ORDER BY mr.record_date DESC''', (doctor.get('id'),))
         
         medical_records = [dict(row) for row in c.fetchall()]
         
@@ -4205,8 +6164,7 @@ def api_doctor_patient_full_details(patient_id):
         c = conn.cursor()
 
         # Get doctor details
-        c.execute('SELECT id FROM doctors WHERE family_id = ?', (session['family_id'],))
-        doctor = c.fetchone()
+        doctor = session_principal(c, 'doctor')
         if not doctor:
             return jsonify({'error': 'Doctor not found'}), 404
         
@@ -4251,8 +6209,8 @@ def api_doctor_patient_full_details(patient_id):
                      JOIN doctors d ON s.doctor_id = d.id
                      WHERE a.member_id = ? AND s.doctor_id = ? 
                      AND a.status != 'Cancelled'
-                     AND date(s.slot_time) = date('now')
-                     ORDER BY s.slot_time DESC LIMIT 1''', (patient_id, doctor_id))
+                     AND s.slot_time >= ? AND s.slot_time < ?
+                     ORDER BY s.slot_time DESC LIMIT 1''', (patient_id, doctor_id, *day_range(datetime.now())))
         current_appointment = dict(c.fetchone() or {})
 
         conn.close()
@@ -4304,8 +6262,7 @@ def handle_add_prescription(redirect_type="dashboard"):
         conn = get_db()
         c = conn.cursor()
 
-        c.execute('SELECT id FROM doctors WHERE family_id = ?', (uid,))
-        doctor = c.fetchone()
+        doctor = session_principal(c, 'doctor')
         if not doctor:
             conn.close()
             return redirect('/doctor_dashboard?error=Doctor not found')
@@ -4373,9 +6330,9 @@ def api_front_office_checkins():
             JOIN slots s ON a.slot_id = s.id
             JOIN doctors d ON s.doctor_id = d.id
             JOIN members m ON a.member_id = m.id
-            WHERE date(s.slot_time) = ?
+            WHERE s.slot_time >= ? AND s.slot_time < ?
             ORDER BY s.slot_time ASC
-        ''', (today,))
+        ''', day_range(today))
 
         checkins = [dict(row) for row in c.fetchall()]
 
@@ -4538,11 +6495,17 @@ def front_office_reschedule_appointment():
             conn.close()
             return jsonify({'success': False, 'error': 'Appointment not found'}), 404
         
-        # Free up the old slot
-        c.execute('UPDATE slots SET booked = 0 WHERE id = ?', (current_appointment['slot_id'],))
+        begin_immediate(conn)
         
         # Book the new slot
-        c.execute('UPDATE slots SET booked = 1 WHERE id = ?', (new_slot_id,))
+        if str(current_appointment['slot_id']) != str(new_slot_id) and not claim_slot(c, new_slot_id, appointment_id, session['family_id']):
+            conn.rollback()
+            conn.close()
+            return jsonify({'success': False, 'error': 'Selected slot is no longer available'}), 400
+        
+        # Free up the old slot
+        if str(current_appointment['slot_id']) != str(new_slot_id):
+            c.execute('UPDATE slots SET booked = 0 WHERE id = ?', (current_appointment['slot_id'],))
         
         # Update the appointment with the new slot
         c.execute('UPDATE appointments SET slot_id = ? WHERE id = ?', (new_slot_id, appointment_id))
@@ -4570,8 +6533,7 @@ def front_office_view_patient(patient_id):
         c = conn.cursor()
         
         # Get front office details (optional, for context)
-        c.execute('SELECT * FROM front_office WHERE family_id = ?', (session['family_id'],))
-        front_office = dict(c.fetchone() or {})
+        front_office = dict(session_principal(c, 'front_office') or {})
         
         # Get patient details
         c.execute('''SELECT 
@@ -4680,8 +6642,7 @@ def api_front_office_appointments():
         c = conn.cursor()
         
         # Get front office details
-        c.execute('SELECT * FROM front_office WHERE family_id = ?', (uid,))
-        front_office = dict(c.fetchone() or {})
+        front_office = dict(session_principal(c, 'front_office') or {})
         
         if request.method == 'POST':
             data = request.get_json()
@@ -4692,21 +6653,21 @@ def api_front_office_appointments():
             if not member_id or not doctor_id or not slot_id:
                 return jsonify({'success': False, 'error': 'member_id, doctor_id, and slot_id are required'}), 400
             
-            # Verify slot is available
-            c.execute('SELECT booked, doctor_id FROM slots WHERE id = ?', (slot_id,))
+            # Verify slot exists
+            c.execute('SELECT doctor_id FROM slots WHERE id = ?', (slot_id,))
             slot = c.fetchone()
             
             if not slot:
                 return jsonify({'success': False, 'error': 'Selected slot not found'}), 400
             
-            if slot['booked'] == 1:
-                return jsonify({'success': False, 'error': 'Selected slot is no longer available'}), 400
-            
             if str(slot['doctor_id']) != str(doctor_id):
                 return jsonify({'success': False, 'error': 'Selected slot does not belong to this doctor'}), 400
             
-            # Book the appointment
-            c.execute('UPDATE slots SET booked = 1 WHERE id = ?', (slot_id,))
+            # Book the appointment - claim_slot() fails if another booking got there first
+            begin_immediate(conn)
+            if not claim_slot(c, slot_id, family_id=uid):
+                conn.rollback()
+                return jsonify({'success': False, 'error': 'Selected slot is no longer available'}), 400
             c.execute('INSERT INTO appointments (member_id, slot_id, status) VALUES (?, ?, "Scheduled")', (member_id, slot_id))
             conn.commit()
             
@@ -4752,6 +6713,9 @@ def api_front_office_appointments():
             'slots': slots
         })
         
+    except sqlite3.IntegrityError as e:
+        logger.warning(f"Double booking rejected in front office appointments API: {e}")
+        return jsonify({'success': False, 'error': 'Selected slot is no longer available'}), 400
     except Exception as e:
         logger.error(f"Error in front office appointments API: {e}")
         return jsonify({'success': False, 'error': 'Failed to process request'}), 500
@@ -4768,8 +6732,7 @@ def api_front_office_patients():
         c = conn.cursor()
         
         # Get front office details
-        c.execute('SELECT * FROM front_office WHERE family_id = ?', (uid,))
-        front_office = dict(c.fetchone() or {})
+        front_office = dict(session_principal(c, 'front_office') or {})
         
         # Get all patients
         c.execute('''SELECT m.*, f.id as family_id, 
@@ -4803,14 +6766,10 @@ def api_front_office_payments():
         c = conn.cursor()
         
         # Get front office details
-        c.execute('SELECT * FROM front_office WHERE family_id = ?', (uid,))
-        front_office = dict(c.fetchone() or {})
+        front_office = dict(session_principal(c, 'front_office') or {})
         
         # Get all bills with member details
-        c.execute('''SELECT b.*, m.first_name, m.last_name
-                    FROM bills b
-                    LEFT JOIN members m ON b.member_id = m.id
-                    ORDER BY b.bill_date DESC''')
+        c.execute(f'SELECT {BILLS_SELECT} FROM {BILLS_FROM} ORDER BY b.bill_date DESC')
         bills_raw = c.fetchall()
         print("Raw bills data:", bills_raw)
         bills = [dict(row) for row in bills_raw]
@@ -4847,56 +6806,28 @@ def api_front_office_reports():
         c = conn.cursor()
         
         # Get front office details
-        c.execute('SELECT * FROM front_office WHERE family_id = ?', (uid,))
-        front_office = dict(c.fetchone() or {})
+        front_office = dict(session_principal(c, 'front_office') or {})
         
         # Get report data
         from datetime import datetime, timedelta
         today = datetime.now().strftime('%Y-%m-%d')
         last_week = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
         
-        # Daily appointments
-        c.execute('''SELECT COUNT(*) as count 
-                    FROM appointments a 
-                    JOIN slots s ON a.slot_id = s.id 
-                    WHERE date(s.slot_time) = ?''', (today,))
-        daily_appointments = c.fetchone()['count']
-        
-        # Weekly appointments
-        c.execute('''SELECT COUNT(*) as count 
-                    FROM appointments a 
-                    JOIN slots s ON a.slot_id = s.id 
-                    WHERE date(s.slot_time) BETWEEN ? AND ?''', (last_week, today))
-        weekly_appointments = c.fetchone()['count']
-        
-        # Daily revenue
-        c.execute('''SELECT COALESCE(SUM(amount), 0) as total 
-                    FROM bills 
-                    WHERE date(bill_date) = ? AND status = "Paid"''', (today,))
-        daily_revenue = c.fetchone()['total'] or 0
-        
-        # Weekly revenue
-        c.execute('''SELECT COALESCE(SUM(amount), 0) as total 
-                    FROM bills 
-                    WHERE date(bill_date) BETWEEN ? AND ? AND status = "Paid"''', (last_week, today))
-        weekly_revenue = c.fetchone()['total'] or 0
-        
-        # New patients this week
-        c.execute('''SELECT COUNT(*) as count 
-                    FROM members 
-                    WHERE date(created_date) BETWEEN ? AND ?''', (last_week, today))
-        new_patients = c.fetchone()['count']
+        # Report figures come from the daily rollups
+        daily_totals = rollup_totals(c, today, today)
+        weekly_totals = rollup_totals(c, last_week, today)
+        daily_appointments = rollup_appointment_count(daily_totals)
+        weekly_appointments = rollup_appointment_count(weekly_totals)
+        daily_revenue = daily_totals.get('revenue_collected', 0)
+        weekly_revenue = weekly_totals.get('revenue_collected', 0)
+        new_patients = int(weekly_totals.get('registrations', 0))
         
         # Top doctors by appointments
-        c.execute('''SELECT d.name, COUNT(a.id) as appointment_count
-                    FROM appointments a
-                    JOIN slots s ON a.slot_id = s.id
-                    JOIN doctors d ON s.doctor_id = d.id
-                    WHERE date(s.slot_time) BETWEEN ? AND ?
-                    GROUP BY d.id, d.name
-                    ORDER BY appointment_count DESC
-                    LIMIT 5''', (last_week, today))
-        top_doctors = [dict(row) for row in c.fetchall()]
+        top_doctors = [{'name': row['doctor'], 'appointment_count': row['appointments']}
+                       for row in rollup_top_doctors(c, 5, last_week, today)]
+        
+        six_months_ago = (datetime.now().replace(day=1) - timedelta(days=5 * 31)).replace(day=1)
+        appointments_by_month = rollup_appointments_by_month(c, six_months_ago.strftime('%Y-%m-%d'))
         
         conn.close()
         
@@ -4911,6 +6842,7 @@ def api_front_office_reports():
                 'new_patients': new_patients
             },
             'top_doctors': top_doctors,
+            'appointments_by_month': appointments_by_month,
             'report_period': {
                 'start_date': last_week,
                 'end_date': today
@@ -4922,6 +6854,7 @@ def api_front_office_reports():
         return jsonify({'success': False, 'error': 'Failed to load reports'}), 500
     
 @app.route('/api/front_office/create_bill', methods=['POST'])
+@idempotent
 def api_create_bill():
     if 'family_id' not in session or session.get('user_type') != 'front_office':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
@@ -4995,6 +6928,7 @@ def api_initiate_payment(bill_id):
         return jsonify({'success': False, 'error': 'Failed to initiate payment'}), 500
 
 @app.route('/api/verify_payment/<payment_id>', methods=['POST'])
+@idempotent
 def api_verify_payment(payment_id):
     if 'family_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
@@ -5075,7 +7009,7 @@ class AdminUser(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
 
     def check_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest() == self.password_hash
+        return verify_password(self.password_hash, password)[0]
 
 @login_manager.user_loader
 def load_user(admin_id):
@@ -5568,16 +7502,246 @@ def update_database_schema():
 # # Create upload directory if it doesn't exist
 # if not os.path.exists(app.config['UPLOAD_FOLDER']):
 #     os.makedirs(app.config['UPLOAD_FOLDER'])
+from flask import g, has_app_context
+
+# ----------------- SQLite Connection Pool -----------------
+# get_db() hands out warm connections from a shared pool instead of opening a
+# new sqlite3 connection per call. Handlers keep calling conn.close(); that now
+# returns the connection to the pool, and anything a handler forgets to close is
+# returned when the app context is torn down.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE') or 5)
+DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW') or 10)
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT') or 10)
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL') or 30)
+
+# PRAGMA profile - every setting can be overridden from the environment at startup.
+# WAL lets the dashboards keep reading while a booking is being written.
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough under WAL
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS') or 5000)
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB') or 20000)
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE') or 256 * 1024 * 1024)
+DB_TEMP_STORE = os.getenv('DB_TEMP_STORE', 'MEMORY')
+DB_WAL_CHECKPOINT_INTERVAL = float(os.getenv('DB_WAL_CHECKPOINT_INTERVAL') or 300)  # seconds, 0 disables
+
+# (pragma, value) pairs run once on every new connection before it is pooled
+DB_CONNECTION_PRAGMAS = [
+    ('journal_mode', DB_JOURNAL_MODE),
+    ('synchronous', DB_SYNCHRONOUS),
+    ('busy_timeout', DB_BUSY_TIMEOUT_MS),
+    ('cache_size', -DB_CACHE_SIZE_KB),  # negative value = size in KiB rather than pages
+    ('mmap_size', DB_MMAP_SIZE),
+    ('temp_store', DB_TEMP_STORE),
+]
+
+
+class SQLiteConnectionPool:
+    """Thread-safe pool of sqlite3 connections to a single database file."""
+
+    def __init__(self, database, size=5, max_overflow=10, timeout=10.0,
+                 healthcheck_interval=30.0, pragmas=None):
+        self.database = database
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.pragmas = list(pragmas or [])
+        self._idle = []  # (conn, last_used) stack - LIFO keeps the warmest connection busy
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # For dict-like rows
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size + self.max_overflow:
+                    self._created += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Connection pool exhausted ({self._created} connections in use)")
+                self._cond.wait(remaining)
+
+        if conn is not None and time.monotonic() - last_used > self.healthcheck_interval:
+            if self._is_healthy(conn):
+                return conn
+            logger.warning("Discarding unhealthy pooled database connection")
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        try:
+            # Same as closing a plain connection: uncommitted work is discarded
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding pooled connection that failed to reset: {e}")
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        # Overflow connection - really close it
+        self._discard(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+class PooledConnection:
+    """Proxy returned by get_db(); close() gives the connection back to the pool."""
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    def _raw(self):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return conn
+
+    def __getattr__(self, name):
+        return getattr(self._raw(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw(), name, value)
+
+    def __enter__(self):
+        return self._raw().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw().__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return  # already returned - handlers often close twice on error paths
+        object.__setattr__(self, '_conn', None)
+        self._pool.release(conn)
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = SQLiteConnectionPool(
+                    DATABASE,
+                    size=DB_POOL_SIZE,
+                    max_overflow=DB_POOL_MAX_OVERFLOW,
+                    timeout=DB_POOL_TIMEOUT,
+                    healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL,
+                    pragmas=DB_CONNECTION_PRAGMAS,
+                )
+    return _db_pool
+
+
 def get_db():
     try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row  # For dict-like rows
-        
+        pool = get_db_pool()
+        conn = PooledConnection(pool, pool.acquire())
+        # Track per app context so leaked connections are returned on teardown
+        if has_app_context():
+            g.setdefault('_db_connections', []).append(conn)
         return conn
     except sqlite3.Error as e:
         logger.error(f"Database connection error: {e}")
         raise
 
+
+@app.teardown_appcontext
+def return_db_connections(exception=None):
+    for conn in g.pop('_db_connections', []):
+        conn.close()
+
+
+def checkpoint_wal(mode='PASSIVE'):
+    """Fold the WAL file back into the main database; returns (busy, log, checkpointed)."""
+    conn = get_db()
+    try:
+        return tuple(conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone())
+    finally:
+        conn.close()
+
+
+_wal_checkpoint_stop = threading.Event()
+
+
+def start_wal_checkpointer(interval=None):
+    """Checkpoint the WAL periodically so it does not grow between automatic checkpoints."""
+    interval = DB_WAL_CHECKPOINT_INTERVAL if interval is None else interval
+    if interval <= 0 or DB_JOURNAL_MODE.upper() != 'WAL':
+        return None
+
+    def run():
+        while not _wal_checkpoint_stop.wait(interval):
+            try:
+                busy, log_frames, checkpointed = checkpoint_wal()
+                logger.debug(f"WAL checkpoint: busy={busy} log={log_frames} checkpointed={checkpointed}")
+            except sqlite3.Error as e:
+                logger.error(f"WAL checkpoint failed: {e}")
+
+    thread = threading.Thread(target=run, name='wal-checkpointer', daemon=True)
+    thread.start()
+    return thread
+
 def check_table_exists(cursor, table_name):
     try:
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
@@ -5586,6 +7750,722 @@ def check_table_exists(cursor, table_name):
         logger.error(f"Error checking table {table_name}: {e}")
         return False
 
+# ----------------- Schema Migrations -----------------
+# Named, run-once migrations recorded in schema_migrations. Each entry is
+# (name, function(cursor)); append new ones at the end, never reorder.
+
+
+class MigrationDeferred(Exception):
+    """A migration's precondition does not hold yet; it is left unrecorded and retried on the next startup."""
+
+
+# Index sets created by 0001, 0002 and 0018, frozen as those migrations first
+# ran them; a new index goes in a new list and migration, never in one of these.
+# (index name, table, columns)
+HOT_PATH_INDEXES = (
+    ('idx_slots_doctor_time', 'slots', ('doctor_id', 'slot_time')),
+    ('idx_appointments_slot_status', 'appointments', ('slot_id', 'status')),
+    ('idx_appointments_member', 'appointments', ('member_id',)),
+    ('idx_members_family', 'members', ('family_id',)),
+    ('idx_members_email', 'members', ('email',)),
+    ('idx_members_phone', 'members', ('phone',)),
+    ('idx_doctors_family', 'doctors', ('family_id',)),
+    ('idx_doctors_email', 'doctors', ('email',)),
+    ('idx_front_office_family', 'front_office', ('family_id',)),
+    ('idx_front_office_email', 'front_office', ('email',)),
+    ('idx_prescriptions_member', 'prescriptions', ('member_id',)),
+    ('idx_prescriptions_doctor_date', 'prescriptions', ('doctor_id', 'prescription_date')),
+    ('idx_medical_records_member', 'medical_records', ('member_id',)),
+    ('idx_bills_member', 'bills', ('member_id',)),
+    ('idx_bills_status_payment', 'bills', ('status', 'payment_date')),
+)
+SLOT_TIME_INDEXES = (
+    ('idx_slots_time', 'slots', ('slot_time',)),
+)
+# (sort column, id) for every admin_list() sort field
+ADMIN_SORT_INDEXES = (
+    ('idx_members_first_name_id', 'members', ('first_name', 'id')),
+    ('idx_members_last_name_id', 'members', ('last_name', 'id')),
+    ('idx_members_age_id', 'members', ('age', 'id')),
+    ('idx_members_created_date_id', 'members', ('created_date', 'id')),
+    ('idx_doctors_name_id', 'doctors', ('name', 'id')),
+    ('idx_doctors_specialty_id', 'doctors', ('specialty', 'id')),
+    ('idx_appointments_status_id', 'appointments', ('status', 'id')),
+    ('idx_slots_slot_time_id', 'slots', ('slot_time', 'id')),
+    ('idx_medical_records_record_date_id', 'medical_records', ('record_date', 'id')),
+    ('idx_medical_records_uploaded_date_id', 'medical_records', ('uploaded_date', 'id')),
+    ('idx_medical_records_record_type_id', 'medical_records', ('record_type', 'id')),
+    ('idx_prescriptions_date_id', 'prescriptions', ('prescription_date', 'id')),
+    ('idx_prescriptions_medication_id', 'prescriptions', ('medication', 'id')),
+)
+
+# Secondary indexes for the appointments -> slots -> doctors join graph and the
+# member/prescription/bill lookups the dashboards filter on, as the schema has
+# them today; 0004 replaced idx_slots_doctor_time with uq_slots_doctor_time.
+DB_INDEXES = [index for index in HOT_PATH_INDEXES + SLOT_TIME_INDEXES + ADMIN_SORT_INDEXES
+              if index[0] != 'idx_slots_doctor_time']
+
+
+def table_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return [column['name'] for column in cursor.fetchall()]
+
+
+def ensure_indexes(c, indexes=None):
+    """Create any missing index from indexes (default DB_INDEXES); skips tables/columns this database lacks."""
+    created = []
+    for name, table, columns in (indexes or DB_INDEXES):
+        if not check_table_exists(c, table):
+            continue
+        existing = table_columns(c, table)
+        missing = [col for col in columns if col not in existing]
+        if missing:
+            logger.warning(f"Skipping index {name}: {table} has no column(s) {', '.join(missing)}")
+            continue
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,))
+        if c.fetchone():
+            continue
+        c.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+        created.append(name)
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+
+# Integer epoch-second shadows of the free-form TEXT timestamp columns.
+# (table, text column, epoch column) - SQLite triggers keep them in step on every
+# INSERT/UPDATE, so writers (raw SQL, SQLAlchemy, Flask-Admin) need no changes.
+TIMESTAMP_COLUMNS = [
+    ('slots', 'slot_time', 'slot_ts'),
+    ('bills', 'bill_date', 'bill_ts'),
+    ('bills', 'payment_date', 'payment_ts'),
+    ('prescriptions', 'prescription_date', 'prescription_ts'),
+]
+
+TIMESTAMP_INDEXES = [
+    ('idx_slots_doctor_ts', 'slots', ('doctor_id', 'slot_ts')),
+    ('idx_slots_ts', 'slots', ('slot_ts',)),
+    ('idx_bills_status_payment_ts', 'bills', ('status', 'payment_ts')),
+    ('idx_bills_status_bill_ts', 'bills', ('status', 'bill_ts')),
+    ('idx_prescriptions_doctor_ts', 'prescriptions', ('doctor_id', 'prescription_ts')),
+]
+
+
+def create_hot_path_indexes(c):
+    ensure_indexes(c, HOT_PATH_INDEXES)
+
+
+def create_slot_time_index(c):
+    ensure_indexes(c, SLOT_TIME_INDEXES)
+
+
+def create_admin_sort_indexes(c):
+    ensure_indexes(c, ADMIN_SORT_INDEXES)
+
+
+def add_timestamp_columns(c):
+    """Add, backfill and trigger-maintain the *_ts columns listed in TIMESTAMP_COLUMNS."""
+    for table, text_col, ts_col in TIMESTAMP_COLUMNS:
+        if not check_table_exists(c, table):
+            continue
+        columns = table_columns(c, table)
+        if text_col not in columns:
+            logger.warning(f"Skipping {table}.{ts_col}: {table} has no {text_col} column")
+            continue
+        if ts_col not in columns:
+            logger.info(f"Adding {ts_col} column to {table} table...")
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {ts_col} INTEGER')
+
+        to_epoch = f"CAST(strftime('%s', NEW.{text_col}) AS INTEGER)"
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{ts_col}_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                UPDATE {table} SET {ts_col} = {to_epoch} WHERE id = NEW.id;
+            END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{ts_col}_update
+            AFTER UPDATE OF {text_col} ON {table}
+            BEGIN
+                UPDATE {table} SET {ts_col} = {to_epoch} WHERE id = NEW.id;
+            END''')
+
+        c.execute(f"UPDATE {table} SET {ts_col} = CAST(strftime('%s', {text_col}) AS INTEGER) "
+                  f"WHERE {text_col} IS NOT NULL")
+        logger.info(f"Backfilled {table}.{ts_col} for {c.rowcount} rows")
+
+    ensure_indexes(c, TIMESTAMP_INDEXES)
+
+
+def merge_duplicate_slots(c, key_sql):
+    """Fold slots that share (doctor_id, key_sql) into one, moving their appointments onto the survivor."""
+    c.execute(f'''SELECT doctor_id, GROUP_CONCAT(id) AS ids
+                  FROM slots
+                  WHERE doctor_id IS NOT NULL
+                  GROUP BY doctor_id, {key_sql}
+                  HAVING COUNT(*) > 1''')
+    duplicate_groups = c.fetchall()
+    removed = 0
+    for group in duplicate_groups:
+        ids = sorted(int(slot_id) for slot_id in group['ids'].split(','))
+        placeholders = ','.join('?' * len(ids))
+        # Keep the slot an appointment already points at, otherwise the oldest
+        c.execute(f'SELECT MIN(slot_id) FROM appointments WHERE slot_id IN ({placeholders})', ids)
+        keep_id = c.fetchone()[0] or ids[0]
+        dup_ids = [slot_id for slot_id in ids if slot_id != keep_id]
+        dup_placeholders = ','.join('?' * len(dup_ids))
+
+        c.execute(f'UPDATE appointments SET slot_id = ? WHERE slot_id IN ({dup_placeholders})', (keep_id, *dup_ids))
+        c.execute(f'''UPDATE slots SET booked = (SELECT MAX(booked) FROM slots WHERE id IN ({placeholders}))
+                      WHERE id = ?''', (*ids, keep_id))
+        c.execute(f'DELETE FROM slots WHERE id IN ({dup_placeholders})', dup_ids)
+        removed += len(dup_ids)
+    if removed:
+        logger.info(f"Merged {removed} duplicate slots across {len(duplicate_groups)} doctor/time pairs")
+
+
+def add_unique_doctor_slot_time(c):
+    """Merge duplicate (doctor_id, slot_time) slots, then enforce uniqueness so slot generation can INSERT OR IGNORE."""
+    merge_duplicate_slots(c, 'slot_time')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_slots_doctor_time ON slots (doctor_id, slot_time)')
+    # The unique index covers every lookup the plain one served
+    c.execute('DROP INDEX IF EXISTS idx_slots_doctor_time')
+
+
+# The value trg_slots_slot_ts_insert writes into slots.slot_ts. That trigger runs
+# after the INSERT, so the unique key is an index on the expression itself;
+# unparseable slot_time text falls back to comparing the text.
+SLOT_TS_KEY_SQL = "COALESCE(CAST(strftime('%s', slot_time) AS INTEGER), slot_time)"
+
+
+def add_unique_doctor_slot_ts(c):
+    """Key slot uniqueness on (doctor_id, slot_ts), so '10:00' and '10:00:00' are the same slot."""
+    c.execute(f'''SELECT doctor_id, {SLOT_TS_KEY_SQL} AS slot_key
+                  FROM slots
+                  WHERE doctor_id IS NOT NULL
+                  AND id IN (SELECT slot_id FROM appointments WHERE status IN ('Scheduled', 'Confirmed'))
+                  GROUP BY doctor_id, slot_key HAVING COUNT(*) > 1''')
+    double_booked = [tuple(row) for row in c.fetchall()]
+    if double_booked:
+        # Merging these would break uq_appointments_active_slot; like that index, they need a person
+        raise MigrationDeferred(f"slots already double-booked: {double_booked}")
+    merge_duplicate_slots(c, SLOT_TS_KEY_SQL)
+    c.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS uq_slots_doctor_ts ON slots (doctor_id, {SLOT_TS_KEY_SQL})')
+    c.execute('DROP INDEX IF EXISTS uq_slots_doctor_time')
+
+
+def create_schedule_templates(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS doctor_schedule_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER NOT NULL,
+        weekday INTEGER NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+        start_time TEXT,  -- NULL start/end marks a day off
+        end_time TEXT,
+        slot_minutes INTEGER NOT NULL DEFAULT 30,
+        break_start TEXT,
+        break_end TEXT,
+        updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(doctor_id, weekday),
+        FOREIGN KEY(doctor_id) REFERENCES doctors(id)
+    )''')
+
+
+# Bump the availability version of the (doctor, day) a slot belongs to
+_BUMP_SLOT_DAY_SQL = '''INSERT INTO availability_versions (doctor_id, day, version)
+                SELECT {row}.doctor_id, substr({row}.slot_time, 1, 10), 1 WHERE {row}.doctor_id IS NOT NULL
+                ON CONFLICT(doctor_id, day) DO UPDATE SET version = version + 1;'''
+_BUMP_APPOINTMENT_DAY_SQL = '''INSERT INTO availability_versions (doctor_id, day, version)
+                SELECT doctor_id, substr(slot_time, 1, 10), 1 FROM slots
+                WHERE id = {row}.slot_id AND doctor_id IS NOT NULL
+                ON CONFLICT(doctor_id, day) DO UPDATE SET version = version + 1;'''
+
+
+def create_availability_versions(c):
+    """Per (doctor, day) change counter read by AvailabilityIndex, maintained by triggers."""
+    c.execute('''CREATE TABLE IF NOT EXISTS availability_versions (
+        doctor_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (doctor_id, day)
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_availability_versions_day ON availability_versions (day)')
+    c.execute('''INSERT OR IGNORE INTO availability_versions (doctor_id, day, version)
+                 SELECT DISTINCT doctor_id, substr(slot_time, 1, 10), 1 FROM slots
+                 WHERE doctor_id IS NOT NULL''')
+
+    triggers = {
+        'trg_slots_availability_insert': ('AFTER INSERT ON slots', [_BUMP_SLOT_DAY_SQL.format(row='NEW')]),
+        'trg_slots_availability_update': ('AFTER UPDATE OF doctor_id, slot_time, booked ON slots',
+                                          [_BUMP_SLOT_DAY_SQL.format(row='OLD'),
+                                           _BUMP_SLOT_DAY_SQL.format(row='NEW')]),
+        'trg_slots_availability_delete': ('AFTER DELETE ON slots', [_BUMP_SLOT_DAY_SQL.format(row='OLD')]),
+        'trg_appointments_availability_insert': ('AFTER INSERT ON appointments',
+                                                 [_BUMP_APPOINTMENT_DAY_SQL.format(row='NEW')]),
+        'trg_appointments_availability_update': ('AFTER UPDATE OF slot_id, status ON appointments',
+                                                 [_BUMP_APPOINTMENT_DAY_SQL.format(row='OLD'),
+                                                  _BUMP_APPOINTMENT_DAY_SQL.format(row='NEW')]),
+        'trg_appointments_availability_delete': ('AFTER DELETE ON appointments',
+                                                 [_BUMP_APPOINTMENT_DAY_SQL.format(row='OLD')]),
+    }
+    for name, (event, statements) in triggers.items():
+        body = '\n                '.join(statements)
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                {body}
+            END''')
+
+
+def add_unique_active_appointment_slot(c):
+    """At most one Scheduled/Confirmed appointment per slot, as a backstop for claim_slot()."""
+    if 'status' not in table_columns(c, 'appointments'):
+        # init_db() creates appointments without it and update_database_schema() only adds it on its error path
+        logger.info("Adding status column to appointments table...")
+        c.execute("ALTER TABLE appointments ADD COLUMN status TEXT DEFAULT 'Scheduled'")
+    c.execute('''SELECT slot_id FROM appointments
+                 WHERE status IN ('Scheduled', 'Confirmed')
+                 GROUP BY slot_id HAVING COUNT(*) > 1''')
+    double_booked = [row['slot_id'] for row in c.fetchall()]
+    if double_booked:
+        # Resolving these needs a person; claim_slot() still guards new bookings
+        raise MigrationDeferred(f"slots already double-booked: {double_booked}")
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS uq_appointments_active_slot
+                 ON appointments (slot_id) WHERE status IN ('Scheduled', 'Confirmed')''')
+
+
+def create_idempotency_keys(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,  -- sha256 of caller, endpoint and Idempotency-Key header
+        request_hash TEXT NOT NULL,
+        status_code INTEGER,  -- NULL while the first request is still running
+        response_body BLOB,
+        content_type TEXT,
+        expires_ts INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_ts)')
+
+
+def add_idempotency_lease(c):
+    """In-flight lease on idempotency keys; rows left without one by an earlier crash can be taken over."""
+    if 'in_flight_until' not in table_columns(c, 'idempotency_keys'):
+        c.execute('ALTER TABLE idempotency_keys ADD COLUMN in_flight_until INTEGER')
+
+
+def create_slot_holds(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS slot_holds (
+        slot_id INTEGER PRIMARY KEY,
+        doctor_id INTEGER NOT NULL,
+        day TEXT NOT NULL,  -- 'YYYY-MM-DD' of the slot, for per-day availability lookups
+        family_id TEXT NOT NULL,
+        held_until INTEGER NOT NULL,  -- epoch seconds
+        FOREIGN KEY(slot_id) REFERENCES slots(id) ON DELETE CASCADE
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_slot_holds_doctor_day ON slot_holds (doctor_id, day)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_slot_holds_held_until ON slot_holds (held_until)')
+
+
+def add_slot_hold_cleanup(c):
+    """Drop a slot's hold when the slot is deleted. PRAGMA foreign_keys is off, so the ON DELETE CASCADE never fires."""
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_slots_hold_delete
+        AFTER DELETE ON slots
+        BEGIN
+            DELETE FROM slot_holds WHERE slot_id = OLD.id;
+        END''')
+    c.execute('DELETE FROM slot_holds WHERE slot_id NOT IN (SELECT id FROM slots)')
+
+
+def create_waitlist(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS waitlist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        member_id INTEGER NOT NULL,
+        family_id TEXT NOT NULL,
+        doctor_id INTEGER NOT NULL,
+        day TEXT NOT NULL,  -- 'YYYY-MM-DD'
+        priority INTEGER NOT NULL DEFAULT 0,  -- higher is offered first, then first come first served
+        status TEXT NOT NULL DEFAULT 'Waiting',  -- Waiting, Offering, Offered, Booked, Cancelled, Expired
+        offered_slot_id INTEGER,
+        offered_until INTEGER,  -- epoch seconds: end of the slot hold, or of the Offering step
+        created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(member_id) REFERENCES members(id),
+        FOREIGN KEY(doctor_id) REFERENCES doctors(id)
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_doctor_day_status ON waitlist (doctor_id, day, status)')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS uq_waitlist_active_member_day
+                 ON waitlist (member_id, doctor_id, day) WHERE status IN ('Waiting', 'Offering', 'Offered')''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_offered_slot ON waitlist (offered_slot_id)')
+
+
+# Add (sign = '+') or take back (sign = '-') one row's contribution to daily_rollups
+_ROLLUP_UPSERT = 'ON CONFLICT(day, doctor_id, metric) DO UPDATE SET value = value + excluded.value;'
+_ROLLUP_APPOINTMENT_SQL = '''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                SELECT substr(slot_time, 1, 10), COALESCE(doctor_id, {no_doctor}),
+                       '{prefix}' || COALESCE({row}.status, 'Scheduled'), {sign}1
+                FROM slots WHERE id = {row}.slot_id AND slot_time IS NOT NULL
+                ''' + _ROLLUP_UPSERT
+_ROLLUP_SLOT_SQL = '''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                SELECT substr({row}.slot_time, 1, 10), COALESCE({row}.doctor_id, {no_doctor}),
+                       '{prefix}' || COALESCE(status, 'Scheduled'), {sign}COUNT(*)
+                FROM appointments WHERE slot_id = {row}.id AND {row}.slot_time IS NOT NULL
+                GROUP BY status
+                ''' + _ROLLUP_UPSERT
+_ROLLUP_BILL_SQL = '''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                SELECT substr(CASE WHEN {row}.status = 'Paid' THEN COALESCE({row}.payment_date, {row}.bill_date)
+                                   ELSE {row}.bill_date END, 1, 10),
+                       {no_doctor}, metric, {sign}value
+                FROM (SELECT CASE WHEN {row}.status = 'Paid' THEN 'revenue_collected' ELSE 'pending_amount' END
+                             AS metric, {row}.amount AS value
+                      UNION ALL
+                      SELECT CASE WHEN {row}.status = 'Paid' THEN 'bills_paid' ELSE 'bills_pending' END, 1)
+                WHERE {row}.bill_date IS NOT NULL
+                ''' + _ROLLUP_UPSERT
+_ROLLUP_MEMBER_SQL = '''INSERT INTO daily_rollups (day, doctor_id, metric, value)
+                SELECT substr({row}.created_date, 1, 10), {no_doctor}, 'registrations', {sign}1
+                WHERE {row}.created_date IS NOT NULL
+                ''' + _ROLLUP_UPSERT
+
+
+def create_daily_rollups(c):
+    """Per (day, doctor, metric) report totals, backfilled here and maintained by triggers."""
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_rollups (
+        day TEXT NOT NULL,  -- 'YYYY-MM-DD'
+        doctor_id INTEGER NOT NULL,  -- ROLLUP_NO_DOCTOR for bill and member metrics
+        metric TEXT NOT NULL,
+        value REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, doctor_id, metric)
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_daily_rollups_metric_day ON daily_rollups (metric, day)')
+    if 'payment_date' not in table_columns(c, 'bills'):
+        # init_db() never created it, though the payment routes write it; 0003 skipped bills.payment_ts without it
+        logger.info("Adding payment_date column to bills table...")
+        c.execute('ALTER TABLE bills ADD COLUMN payment_date TEXT')
+        add_timestamp_columns(c)
+    rebuild_daily_rollups(c)
+
+    def sql(template, row, sign):
+        return template.format(row=row, sign=sign, no_doctor=ROLLUP_NO_DOCTOR, prefix=APPOINTMENT_METRIC_PREFIX)
+
+    triggers = {}
+    for table, template, columns in (
+            ('appointments', _ROLLUP_APPOINTMENT_SQL, 'slot_id, status'),
+            ('slots', _ROLLUP_SLOT_SQL, 'doctor_id, slot_time'),
+            ('bills', _ROLLUP_BILL_SQL, 'bill_date, payment_date, amount, status'),
+            ('members', _ROLLUP_MEMBER_SQL, 'created_date')):
+        # A new slot has no appointments yet, so slots need no insert trigger
+        if table != 'slots':
+            triggers[f'trg_{table}_rollup_insert'] = (f'AFTER INSERT ON {table}', [sql(template, 'NEW', '')])
+        triggers[f'trg_{table}_rollup_update'] = (f'AFTER UPDATE OF {columns} ON {table}',
+                                                  [sql(template, 'OLD', '-'), sql(template, 'NEW', '')])
+        triggers[f'trg_{table}_rollup_delete'] = (f'AFTER DELETE ON {table}', [sql(template, 'OLD', '-')])
+    for name, (event, statements) in triggers.items():
+        body = '\n                '.join(statements)
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                {body}
+            END''')
+
+
+# Add (sign = '+') or take back (sign = '-') one row's contribution to dashboard_counters
+_COUNTER_UPSERT = 'ON CONFLICT(counter, key) DO UPDATE SET value = value + excluded.value;'
+_COUNTER_ROWS_SQL = '''INSERT INTO dashboard_counters (counter, key, value)
+                VALUES ('rows', '{table}', {sign}1)
+                ''' + _COUNTER_UPSERT
+_COUNTER_BOOKED_SQL = '''INSERT INTO dashboard_counters (counter, key, value)
+                SELECT 'booked_slots', '', {sign}1 WHERE {row}.booked = 1
+                ''' + _COUNTER_UPSERT
+_COUNTER_AGE_SQL = '''INSERT INTO dashboard_counters (counter, key, value)
+                SELECT 'age_group', {age_group}, {sign}1 WHERE true
+                ''' + _COUNTER_UPSERT
+_COUNTER_ROLLUP_SQL = '''INSERT INTO dashboard_counters (counter, key, value)
+                SELECT 'rollup', {row}.metric, {sign}{row}.value WHERE true
+                UNION ALL
+                SELECT 'doctor_appointments', {row}.doctor_id, {sign}{row}.value
+                WHERE substr({row}.metric, 1, {prefix_length}) = '{prefix}'
+                ''' + _COUNTER_UPSERT
+
+
+def create_dashboard_counters(c):
+    """Running totals behind the admin dashboard, backfilled here and maintained by triggers."""
+    c.execute('''CREATE TABLE IF NOT EXISTS dashboard_counters (
+        counter TEXT NOT NULL,
+        key TEXT NOT NULL DEFAULT '',
+        value REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (counter, key)
+    ) WITHOUT ROWID''')
+    rebuild_dashboard_counters(c)
+
+    def sql(template, row, sign, table=''):
+        return template.format(row=row, sign=sign, table=table, age_group=AGE_GROUP_SQL.format(age=f'{row}.age'),
+                               prefix=APPOINTMENT_METRIC_PREFIX, prefix_length=len(APPOINTMENT_METRIC_PREFIX))
+
+    triggers = {}
+    for table in DASHBOARD_COUNT_TABLES:
+        inserted, deleted = [sql(_COUNTER_ROWS_SQL, 'NEW', '', table)], [sql(_COUNTER_ROWS_SQL, 'OLD', '-', table)]
+        for counted_table, template, column in (('slots', _COUNTER_BOOKED_SQL, 'booked'),
+                                                ('members', _COUNTER_AGE_SQL, 'age')):
+            if table == counted_table:
+                inserted.append(sql(template, 'NEW', ''))
+                deleted.append(sql(template, 'OLD', '-'))
+                triggers[f'trg_{table}_counter_update'] = (f'AFTER UPDATE OF {column} ON {table}',
+                                                           [sql(template, 'OLD', '-'), sql(template, 'NEW', '')])
+        triggers[f'trg_{table}_counter_insert'] = (f'AFTER INSERT ON {table}', inserted)
+        triggers[f'trg_{table}_counter_delete'] = (f'AFTER DELETE ON {table}', deleted)
+    # daily_rollups changes from inside its own triggers, so these carry every rollup edit along
+    triggers['trg_daily_rollups_counter_insert'] = ('AFTER INSERT ON daily_rollups',
+                                                    [sql(_COUNTER_ROLLUP_SQL, 'NEW', '')])
+    triggers['trg_daily_rollups_counter_update'] = ('AFTER UPDATE ON daily_rollups',
+                                                    [sql(_COUNTER_ROLLUP_SQL, 'OLD', '-'),
+                                                     sql(_COUNTER_ROLLUP_SQL, 'NEW', '')])
+    triggers['trg_daily_rollups_counter_delete'] = ('AFTER DELETE ON daily_rollups',
+                                                    [sql(_COUNTER_ROLLUP_SQL, 'OLD', '-')])
+    for name, (event, statements) in triggers.items():
+        body = '\n                '.join(statements)
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                {body}
+            END''')
+
+
+def create_email_outbox(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        to_email TEXT NOT NULL,
+        subject TEXT,
+        message TEXT,  -- complete MIME message; cleared once sent
+        status TEXT NOT NULL DEFAULT 'Pending',  -- Pending, Sent, Failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_ts INTEGER NOT NULL,  -- epoch seconds; also the claim lease while sending
+        last_error TEXT,
+        created_ts INTEGER NOT NULL,
+        sent_ts INTEGER
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_status_next ON email_outbox (status, next_attempt_ts)')
+
+
+# role, source table, rank - the order /api/login tries an email registered under several roles
+IDENTITY_SOURCES = [
+    ('admin', 'admins', 0),
+    ('doctor', 'doctors', 1),
+    ('front_office', 'front_office', 2),
+    ('patient', 'members', 3),
+]
+_IDENTITY_INSERT_SQL = '''INSERT OR REPLACE INTO identities (email, rank, role, principal_id, family_id, password_hash)
+                SELECT NEW.email, {rank}, '{role}', NEW.id, NEW.family_id, NEW.password_hash
+                WHERE NEW.email IS NOT NULL AND NEW.password_hash IS NOT NULL;'''
+_IDENTITY_DELETE_SQL = "DELETE FROM identities WHERE role = '{role}' AND principal_id = OLD.id;"
+
+
+def create_identities(c):
+    """email -> (role, principal, family_id, password hash) over every user table, kept in step by triggers."""
+    c.execute('''CREATE TABLE IF NOT EXISTS identities (
+        email TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        role TEXT NOT NULL,  -- admin, doctor, front_office, patient
+        principal_id INTEGER NOT NULL,  -- id in the role's table
+        family_id TEXT,
+        password_hash TEXT NOT NULL,
+        PRIMARY KEY (role, principal_id)
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_identities_email ON identities (email, rank)')
+
+    for role, table, rank in IDENTITY_SOURCES:
+        existing = table_columns(c, table)
+        for column in ('email', 'family_id', 'password_hash'):
+            # init_db() creates doctors, front_office and members without password_hash, and on a
+            # new database db.create_all() creates admins from the AdminUser model without email
+            # or family_id; registration and the admin forms write them
+            if column not in existing:
+                logger.info(f"Adding {column} column to {table} table...")
+                c.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+        c.execute(f'''INSERT OR REPLACE INTO identities (email, rank, role, principal_id, family_id, password_hash)
+                      SELECT email, ?, ?, id, family_id, password_hash FROM {table}
+                      WHERE email IS NOT NULL AND password_hash IS NOT NULL''', (rank, role))
+        insert_sql = _IDENTITY_INSERT_SQL.format(rank=rank, role=role)
+        delete_sql = _IDENTITY_DELETE_SQL.format(role=role)
+        triggers = {
+            f'trg_{table}_identity_insert': (f'AFTER INSERT ON {table}', [insert_sql]),
+            f'trg_{table}_identity_update': (f'AFTER UPDATE OF id, email, family_id, password_hash ON {table}',
+                                             [delete_sql, insert_sql]),
+            f'trg_{table}_identity_delete': (f'AFTER DELETE ON {table}', [delete_sql]),
+        }
+        for name, (event, statements) in triggers.items():
+            body = '\n                '.join(statements)
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {name} {event}
+                BEGIN
+                    {body}
+                END''')
+
+
+def create_sessions(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,  -- Flask's tagged JSON of the session dict
+        expires_ts INTEGER NOT NULL,
+        principal_role TEXT,  -- doctor / front_office when a principal row is cached
+        principal_family_id TEXT,
+        principal TEXT  -- JSON of the cached row
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_ts)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessions_principal ON sessions (principal_role, principal_family_id)')
+    for role, table in PRINCIPAL_TABLES.items():
+        # Any change to the row makes the cached copy stale; the next request reloads it
+        clear_sql = f'''UPDATE sessions SET principal_role = NULL, principal_family_id = NULL, principal = NULL
+                        WHERE principal_role = '{role}' AND principal_family_id = OLD.family_id;'''
+        for event in ('UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_session_principal_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    {clear_sql}
+                END''')
+
+
+SCHEMA_MIGRATIONS = [
+    ('0001_hot_path_indexes', create_hot_path_indexes),
+    ('0002_slot_time_index', create_slot_time_index),
+    ('0003_epoch_timestamp_columns', add_timestamp_columns),
+    ('0004_unique_doctor_slot_time', add_unique_doctor_slot_time),
+    ('0005_doctor_schedule_templates', create_schedule_templates),
+    ('0006_availability_versions', create_availability_versions),
+    ('0007_unique_active_appointment_slot', add_unique_active_appointment_slot),
+    ('0008_idempotency_keys', create_idempotency_keys),
+    ('0009_slot_holds', create_slot_holds),
+    ('0010_waitlist', create_waitlist),
+    ('0011_daily_rollups', create_daily_rollups),
+    ('0012_email_outbox', create_email_outbox),
+    ('0013_identities', create_identities),
+    ('0014_sessions', create_sessions),
+    ('0015_unique_doctor_slot_ts', add_unique_doctor_slot_ts),
+    ('0016_idempotency_lease', add_idempotency_lease),
+    ('0017_slot_hold_cleanup', add_slot_hold_cleanup),
+    ('0018_admin_sort_indexes', create_admin_sort_indexes),
+    ('0019_dashboard_counters', create_dashboard_counters),
+]
+
+
+def apply_migrations():
+    """Run every migration in SCHEMA_MIGRATIONS that has not been recorded yet."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''')
+        conn.commit()
+        c.execute('SELECT name FROM schema_migrations')
+        applied = {row['name'] for row in c.fetchall()}
+
+        for name, migrate in SCHEMA_MIGRATIONS:
+            if name in applied:
+                continue
+            logger.info(f"Applying migration {name}...")
+            try:
+                migrate(c)
+                c.execute('INSERT INTO schema_migrations (name) VALUES (?)', (name,))
+                conn.commit()
+            except MigrationDeferred as e:
+                conn.rollback()
+                logger.warning(f"Migration {name} deferred to the next startup: {e}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Migration {name} failed: {e}")
+                raise
+    finally:
+        conn.close()
+
+
+# Queries on the request hot path, with representative parameters. None of them
+# may fall back to a full table scan - see find_full_table_scans().
+HOT_QUERIES = {
+    'doctor_slots': (
+        'SELECT s.id, s.slot_time FROM slots s JOIN doctors d ON s.doctor_id = d.id '
+        'WHERE s.doctor_id = ? AND s.booked = 0 ORDER BY s.slot_time', (1,)),
+    'doctor_slots_for_day': (
+        'SELECT s.id, s.slot_time FROM slots s WHERE s.doctor_id = ? '
+        'AND s.slot_time >= ? AND s.slot_time < ? AND s.booked = 0 ORDER BY s.slot_time',
+        (1, '2025-01-01', '2025-01-02')),
+    'appointments_for_day': (
+        'SELECT a.id, s.slot_time FROM appointments a JOIN slots s ON a.slot_id = s.id '
+        'WHERE s.slot_time >= ? AND s.slot_time < ? ORDER BY s.slot_time',
+        ('2025-01-01', '2025-01-02')),
+    'doctor_upcoming_slots_for_day': (
+        'SELECT s.id FROM slots s WHERE s.doctor_id = ? AND s.slot_ts >= ? AND s.slot_ts < ? '
+        'AND s.booked = 0 ORDER BY s.slot_ts', (1, 0, 86400)),
+    'upcoming_slots': (
+        'SELECT s.id FROM slots s WHERE s.slot_ts > ? AND s.booked = 0 ORDER BY s.slot_ts', (0,)),
+    'active_appointment_for_slot': (
+        "SELECT id FROM appointments WHERE slot_id = ? AND status = 'Scheduled'", (1,)),
+    'doctor_appointments': (
+        'SELECT a.id, m.first_name, s.slot_time FROM appointments a '
+        'JOIN slots s ON a.slot_id = s.id JOIN members m ON a.member_id = m.id '
+        'WHERE s.doctor_id = ? ORDER BY s.slot_time', (1,)),
+    'family_appointments': (
+        'SELECT a.id, s.slot_time FROM members m JOIN appointments a ON a.member_id = m.id '
+        'JOIN slots s ON a.slot_id = s.id WHERE m.family_id = ?', ('X',)),
+    'family_members': ('SELECT * FROM members WHERE family_id = ?', ('X',)),
+    'member_by_email': ('SELECT id FROM members WHERE email = ?', ('x@example.com',)),
+    'identity_by_email': (
+        'SELECT role, family_id, password_hash FROM identities WHERE email = ? ORDER BY rank', ('x@example.com',)),
+    'member_by_phone': ('SELECT id FROM members WHERE phone = ?', ('0',)),
+    'doctor_by_family': ('SELECT * FROM doctors WHERE family_id = ?', ('X',)),
+    'front_office_by_family': ('SELECT * FROM front_office WHERE family_id = ?', ('X',)),
+    'member_prescriptions': (
+        'SELECT * FROM prescriptions WHERE member_id = ? ORDER BY prescription_date DESC', (1,)),
+    'doctor_prescriptions': (
+        'SELECT * FROM prescriptions WHERE doctor_id = ? ORDER BY prescription_date DESC', (1,)),
+    'member_bills': ('SELECT * FROM bills WHERE member_id = ?', (1,)),
+    'paid_bills_in_range': (
+        "SELECT SUM(amount) FROM bills WHERE status = 'Paid' "
+        'AND payment_ts >= ? AND payment_ts < ?', (0, 86400)),
+}
+
+
+def find_full_table_scans(conn, queries=None):
+    """EXPLAIN QUERY PLAN each hot query; return {name: [plan lines]} for any that scan a table without an index."""
+    offenders = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+        # "SCAN slots" / "SCAN s" is a full scan; "SCAN s USING [COVERING] INDEX ..." is not
+        if any(line.startswith('SCAN ') and ' USING ' not in line for line in plan):
+            offenders[name] = plan
+    return offenders
+
+
+@app.route('/admin/debug/query_plans')
+def admin_debug_query_plans():
+    """Debug route: lists hot queries that fall back to a full table scan"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        conn = get_db()
+        offenders = find_full_table_scans(conn)
+        conn.close()
+        return jsonify({'ok': not offenders, 'full_table_scans': offenders})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/admin/debug/availability_index')
+def admin_debug_availability_index():
+    """Debug route: hit/miss counters of the in-memory availability index"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(availability_index.stats())
+
+
+@app.route('/admin/debug/email_outbox')
+def admin_debug_email_outbox():
+    """Debug route: outbox counts by status and the most recent failures"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status')
+        counts = {row['status']: row['count'] for row in c.fetchall()}
+        c.execute('''SELECT id, to_email, subject, attempts, last_error, created_ts FROM email_outbox
+                     WHERE status = 'Failed' ORDER BY id DESC LIMIT 20''')
+        failed = [dict(row) for row in c.fetchall()]
+    finally:
+        conn.close()
+    return jsonify({'counts': counts, 'recent_failures': failed})
+
 # @app.route('/api/admin_dashboard' , methods=['GET'])
 # def admin_dashboard():
 #     conn = get_db()
@@ -5858,37 +8738,9 @@ def init_db():
             # Generate slots for the next 60 days
             from datetime import datetime, timedelta
             slots = []
-            start_date = datetime.now().replace(year=2025, month=8, day=21)  # Starting from August 21, 2025
-            
-            for i in range(60):  # Generate for 60 days
-                current_date = start_date + timedelta(days=i)
-                day_of_week = current_date.weekday()  # 0=Monday, 6=Sunday
-                
-                # Determine time slots based on weekday/weekend
-                if day_of_week < 5:  # Weekday (Monday to Friday)
-                    # 10am to 1pm (before lunch)
-                    for hour in range(10, 13):
-                        for minute in [0, 30]:
-                            slot_time = current_date.strftime('%Y-%m-%d') + f' {hour:02d}:{minute:02d}:00'
-                            slots.append((1, slot_time))  # Doctor 1
-                            slots.append((2, slot_time))  # Doctor 2
-                            slots.append((3, slot_time))  # Doctor 3
-                    
-                    # 2pm to 6pm (after lunch)
-                    for hour in range(14, 18):
-                        for minute in [0, 30]:
-                            slot_time = current_date.strftime('%Y-%m-%d') + f' {hour:02d}:{minute:02d}:00'
-                            slots.append((1, slot_time))  # Doctor 1
-                            slots.append((2, slot_time))  # Doctor 2
-                            slots.append((3, slot_time))  # Doctor 3
-                else:  # Weekend (Saturday and Sunday)
-                    # 10am to 1pm only
-                    for hour in range(10, 13):
-                        for minute in [0, 30]:
-                            slot_time = current_date.strftime('%Y-%m-%d') + f' {hour:02d}:{minute:02d}:00'
-                            slots.append((1, slot_time))  # Doctor 1
-                            slots.append((2, slot_time))  # Doctor 2
-                            slots.append((3, slot_time))  # Doctor 3
+            start_date = datetime.now().replace(year=2025, month=8, day=21).date()  # Starting from August 21, 2025
+            for doctor_id in (1, 2, 3):
+                slots.extend(build_slot_grid(doctor_id, 60, start_date))
             
             # Insert all slots
             c.executemany('INSERT OR IGNORE INTO slots (doctor_id, slot_time) VALUES (?, ?)', slots)
@@ -5960,6 +8812,12 @@ with app.app_context():
     db.create_all()
     init_db()
     update_database_schema()
+    apply_migrations()
+start_wal_checkpointer()
+start_slot_scheduler()
+start_hold_sweeper()
+start_waitlist_worker()
+start_email_worker()
 app.run(debug=True)
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
@@ -5976,10 +8834,12 @@ def admin_login():
             admin = c.fetchone()
             
             if admin:
-                # Verify password using the same hashing method
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
-                
-                if password_hash == admin['password_hash']:
+                matches, new_hash = verify_password(admin['password_hash'], password)
+                if matches:
+                    if new_hash:
+                        # Upgrade to the current PASSWORD_HASH_METHOD, as /api/login does
+                        c.execute('UPDATE admins SET password_hash = ? WHERE id = ?', (new_hash, admin['id']))
+                        conn.commit()
                     session['admin_id'] = admin['id']
                     session['family_id'] = admin['family_id']
                     session['user_type'] = 'admin'
@@ -6733,8 +9593,8 @@ def get_doctor_dashboard_data(doctor_id):
     # Get appointment counts
     c.execute('''SELECT COUNT(*) as count FROM appointments a 
                  JOIN slots s ON a.slot_id = s.id 
-                 WHERE date(s.slot_time) = ? AND s.doctor_id = ?''', 
-              (today, doctor['id']))
+                 WHERE s.slot_time >= ? AND s.slot_time < ? AND s.doctor_id = ?''', 
+              (*day_range(today), doctor['id']))
     total_patients_today = c.fetchone()['count']
     
     # For demo purposes, we'll generate some sample data
@@ -6750,9 +9610,9 @@ def get_doctor_dashboard_data(doctor_id):
                  FROM appointments a 
                  JOIN slots s ON a.slot_id = s.id 
                  JOIN members m ON a.member_id = m.id 
-                 WHERE date(s.slot_time) = ? AND s.doctor_id = ?
+                 WHERE s.slot_time >= ? AND s.slot_time < ? AND s.doctor_id = ?
                  ORDER BY s.slot_time''', 
-              (today, doctor['id']))
+              (*day_range(today), doctor['id']))
     todays_appointments = [dict(row) for row in c.fetchall()]
     
     # Get recent patients
@@ -6794,7 +9654,7 @@ def get_front_office_dashboard_data(family_id):
     # Get appointment counts
     c.execute('''SELECT COUNT(*) as count FROM appointments a 
                  JOIN slots s ON a.slot_id = s.id 
-                 WHERE date(s.slot_time) = ?''', (today,))
+                 WHERE s.slot_time >= ? AND s.slot_time < ?''', day_range(today))
     scheduled_today = c.fetchone()['count']
     
     # For demo purposes, we'll generate some sample data
@@ -6817,8 +9677,8 @@ def get_front_office_dashboard_data(family_id):
                  JOIN slots s ON a.slot_id = s.id 
                  JOIN members m ON a.member_id = m.id 
                  JOIN doctors d ON s.doctor_id = d.id 
-                 WHERE date(s.slot_time) = ?
-                 ORDER BY s.slot_time''', (today,))
+                 WHERE s.slot_time >= ? AND s.slot_time < ?
+                 ORDER BY s.slot_time''', day_range(today))
     todays_appointments = [dict(row) for row in c.fetchall()]
     
     # Get recent registrations
@@ -7632,6 +10492,7 @@ def front_office_cancel_appointment(appointment_id):
             c.execute('UPDATE appointments SET status = "Cancelled" WHERE id = ?', (appointment_id,))
             
             conn.commit()
+            notify_slot_released(appointment['slot_id'])
         
         conn.close()
         return jsonify({'success': True, 'message': 'Appointment cancelled successfully'})
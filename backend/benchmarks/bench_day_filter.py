@@ -0,0 +1,93 @@
+"""Per-day slot lookups as the slots table grows.
+
+Times the two day filters the dashboards and /api/available_slots run - one
+doctor's day and every doctor's day - written the old way, date(slot_time) = ?,
+and with day_range() bounds, on an in-memory slots table carrying the app's
+indexes. The day_range() columns should stay flat as the table grows.
+
+    python benchmarks/bench_day_filter.py [rows ...]
+"""
+import contextlib
+import io
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from tests.conftest import SEED_DATABASE, load_app  # noqa: E402
+
+DOCTORS = 50
+SLOTS_PER_DAY = 16  # every 30 minutes from 09:00
+REPEATS = 20
+QUERIES = {
+    'one doctor, one day': ('SELECT id FROM slots WHERE doctor_id = ? AND {day} ORDER BY slot_time', True),
+    'all doctors, one day': ('SELECT id FROM slots WHERE {day} ORDER BY slot_time', False),
+}
+DAY_FILTERS = {
+    'date()': ('date(slot_time) = ?', lambda app1, day: (day,)),
+    'day_range()': ('slot_time >= ? AND slot_time < ?', lambda app1, day: app1.day_range(day)),
+}
+
+
+def build_slots(app1, schema, rows):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute(schema)
+    days = max(rows // (DOCTORS * SLOTS_PER_DAY), 1)
+    first_day = datetime(2024, 1, 1, 9)
+    conn.executemany('INSERT INTO slots (doctor_id, slot_time, booked) VALUES (?, ?, 0)', (
+        (doctor_id, (first_day + timedelta(days=day, minutes=30 * n)).strftime('%Y-%m-%d %H:%M:%S'))
+        for day in range(days) for doctor_id in range(1, DOCTORS + 1) for n in range(SLOTS_PER_DAY)))
+    app1.ensure_indexes(conn.cursor())
+    conn.execute('ANALYZE')
+    return conn, [(first_day + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(days)]
+
+
+def time_query(app1, conn, days, sql, per_doctor, params_for):
+    """Median milliseconds per lookup over REPEATS random (doctor, day) pairs; also the rows seen."""
+    rng = random.Random(0)
+    timings, found = [], []
+    for _ in range(REPEATS):
+        params = params_for(app1, rng.choice(days))
+        if per_doctor:
+            params = (rng.randint(1, DOCTORS), *params)
+        start = time.perf_counter()
+        found.append(len(conn.execute(sql, params).fetchall()))
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), found
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'hospital.db')
+        shutil.copy(SEED_DATABASE, database)
+        logging.disable(logging.WARNING)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app1 = load_app(database)
+        schema = sqlite3.connect(database).execute("SELECT sql FROM sqlite_master WHERE name = 'slots'").fetchone()[0]
+
+    print(f"{'rows':>10}  {'query':<22}" + ''.join(f'{name + " ms":>16}' for name in DAY_FILTERS))
+    for rows in sizes:
+        conn, days = build_slots(app1, schema, rows)
+        total = conn.execute('SELECT COUNT(*) FROM slots').fetchone()[0]
+        for label, (sql, per_doctor) in QUERIES.items():
+            medians, results = [], []
+            for day_sql, params_for in DAY_FILTERS.values():
+                median, found = time_query(app1, conn, days, sql.format(day=day_sql), per_doctor, params_for)
+                medians.append(median)
+                results.append(found)
+            assert all(found == results[0] for found in results), 'day filters disagree'
+            print(f'{total:>10}  {label:<22}' + ''.join(f'{median:>16.3f}' for median in medians))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
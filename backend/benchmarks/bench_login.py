@@ -0,0 +1,99 @@
+"""/api/login latency under concurrent load.
+
+Signs in patients by email and password from several threads at once through
+the Flask test client, against a scratch copy of hospital1.db, and reports
+latency percentiles. The login does one identities lookup and one hash check,
+so with a real PASSWORD_HASH_METHOD the figures are mostly the hash and the
+PASSWORD_HASH_WORKERS queue in front of it.
+
+    python benchmarks/bench_login.py [--threads 8] [--logins 50] [--method pbkdf2:sha256:1000]
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from tests.conftest import SEED_DATABASE, load_app  # noqa: E402
+
+USERS = 100
+PASSWORD = 'bench-password'
+
+
+def add_patients(app1):
+    """USERS patients sharing one password hash; returns their emails."""
+    password_hash = app1.password_policy.hash(PASSWORD)
+    emails = [f'bench{n}@example.com' for n in range(USERS)]
+    conn = app1.get_db()
+    conn.executemany('''INSERT INTO members (family_id, first_name, last_name, age, gender, phone, email,
+                                             aadhar, address, prev_problem, curr_problem, password_hash)
+                        VALUES ('BENCH', 'Bench', ?, 30, 'Other', '0', ?, '0', '-', '-', '-', ?)''',
+                     [(str(n), email, password_hash) for n, email in enumerate(emails)])
+    conn.commit()
+    conn.close()
+    return emails
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(int(len(sorted_values) * pct / 100), len(sorted_values) - 1)]
+
+
+def main(threads, logins, method):
+    if method:
+        os.environ['PASSWORD_HASH_METHOD'] = method
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'hospital.db')
+        shutil.copy(SEED_DATABASE, database)
+        logging.disable(logging.WARNING)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app1 = load_app(database)
+            emails = add_patients(app1)
+
+            latencies, failures = [], []
+            barrier = threading.Barrier(threads)
+
+            def run(seed):
+                rng = random.Random(seed)
+                client = app1.app.test_client()
+                barrier.wait()
+                for _ in range(logins):
+                    start = time.perf_counter()
+                    response = client.post('/api/login', json={'identifier': rng.choice(emails), 'password': PASSWORD})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+
+            workers = [threading.Thread(target=run, args=(seed,)) for seed in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+            app1.get_db_pool().close_all()
+
+    latencies.sort()
+    print(f'{threads} threads x {logins} logins, {app1.PASSWORD_HASH_METHOD}, '
+          f'{app1.PASSWORD_HASH_WORKERS} hash workers')
+    print(f'p50 {statistics.median(latencies):.1f} ms  p95 {percentile(latencies, 95):.1f} ms  '
+          f'p99 {percentile(latencies, 99):.1f} ms  max {latencies[-1]:.1f} ms  '
+          f'{len(latencies) / elapsed:.0f} logins/s')
+    if failures:
+        print(f'{len(failures)} logins failed: {sorted(set(failures))}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=50, help='logins per thread')
+    parser.add_argument('--method', help='PASSWORD_HASH_METHOD to hash the passwords with')
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,55 @@
+"""Fixtures shared by the backend tests.
+
+app1.py starts its background workers and calls app.run() at module level, so
+it cannot simply be imported. The app1 fixture executes the module source up to
+the point where those start, against a throwaway copy of hospital1.db.
+"""
+import os
+import shutil
+import sys
+import types
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(BACKEND_DIR, 'app1.py')
+SEED_DATABASE = os.path.join(BACKEND_DIR, 'hospital1.db')
+
+
+def load_app(database_path):
+    """Run app1.py's module code against database_path, without the workers and the dev server."""
+    with open(APP_PATH, encoding='utf-8') as f:
+        source = f.read()
+    source = source[:source.index('\nstart_wal_checkpointer()')]
+    os.environ['DATABASE_PATH'] = database_path
+    module = types.ModuleType('app1')
+    module.__file__ = APP_PATH
+    sys.modules['app1'] = module
+    exec(compile(source, APP_PATH, 'exec'), module.__dict__)
+    return module
+
+
+@pytest.fixture(scope='session')
+def app1(tmp_path_factory):
+    database_path = str(tmp_path_factory.mktemp('db') / 'hospital.db')
+    shutil.copy(SEED_DATABASE, database_path)
+    return load_app(database_path)
+
+
+@pytest.fixture
+def conn(app1):
+    conn = app1.get_db()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client_for(app1):
+    """client_for(user_type, family_id): a test client signed in as that user."""
+    def make(user_type, family_id):
+        client = app1.app.test_client()
+        with client.session_transaction() as session:
+            session['user_type'] = user_type
+            session['family_id'] = family_id
+        return client
+    return make
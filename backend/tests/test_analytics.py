@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def admin(client_for):
+    return client_for('admin', 'ADMIN001')
+
+
+@pytest.mark.parametrize('granularity', ['day', 'week', 'month'])
+@pytest.mark.parametrize('bounds', [
+    {'to': '0001-01-01'},
+    {'to': '0001-01-20'},
+    {'from': '9999-12-01', 'to': '9999-12-31'},
+])
+def test_series_at_the_ends_of_the_calendar(admin, granularity, bounds):
+    response = admin.get('/api/analytics/series', query_string={'granularity': granularity, **bounds})
+
+    assert response.status_code == 200
+    assert response.get_json()['points']
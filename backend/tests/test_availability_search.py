@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.fixture
+def patient(client_for, conn):
+    family_id = conn.execute('SELECT family_id FROM members WHERE family_id IS NOT NULL LIMIT 1').fetchone()['family_id']
+    return client_for('patient', family_id)
+
+
+@pytest.mark.parametrize('params', [
+    {'after': '99999999999999999:1'},
+    {'after': '-1:1'},
+    {'after': '1:2:3'},
+    {'from': '9999-12-31'},
+    {'from': '9999-12-01', 'to': '9999-12-31'},
+    {'limit': 'many'},
+])
+def test_out_of_range_parameters_are_rejected(patient, params):
+    response = patient.get('/api/availability/search', query_string=params)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_cursor_pages_continue_the_first_page(app1, patient):
+    app1.run_slot_maintenance()
+    first = patient.get('/api/availability/search', query_string={'limit': 3}).get_json()
+    assert first['success']
+    assert first['next_cursor']
+    second = patient.get('/api/availability/search', query_string={'limit': 3, 'after': first['next_cursor']}).get_json()
+    both = patient.get('/api/availability/search', query_string={'limit': 6}).get_json()
+    assert [s['id'] for s in first['slots'] + second['slots']] == [s['id'] for s in both['slots']]
@@ -0,0 +1,104 @@
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+THREADS = 20
+_slot_numbers = itertools.count()
+
+
+def add_free_slot(conn):
+    """A free slot far in the future that no other test uses."""
+    doctor_id = conn.execute('SELECT id FROM doctors ORDER BY id LIMIT 1').fetchone()['id']
+    slot_time = datetime(2099, 1, 1, 9) + timedelta(minutes=15 * next(_slot_numbers))
+    c = conn.cursor()
+    c.execute('INSERT INTO slots (doctor_id, slot_time, booked) VALUES (?, ?, 0)',
+              (doctor_id, slot_time.strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    return {'id': c.lastrowid, 'doctor_id': doctor_id}
+
+
+@pytest.fixture
+def free_slot(conn):
+    return add_free_slot(conn)
+
+
+@pytest.fixture
+def member(conn):
+    return dict(conn.execute('SELECT id, family_id FROM members WHERE family_id IS NOT NULL ORDER BY id LIMIT 1').fetchone())
+
+
+def race(worker):
+    """Start THREADS copies of worker together; returns their results."""
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def run(index):
+        barrier.wait()
+        results[index] = worker()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def active_appointments(conn, slot_id):
+    return conn.execute("""SELECT COUNT(*) FROM appointments
+                           WHERE slot_id = ? AND status IN ('Scheduled', 'Confirmed')""", (slot_id,)).fetchone()[0]
+
+
+def test_concurrent_claims_have_one_winner(app1, conn, free_slot, member):
+    def claim():
+        worker_conn = app1.get_db()
+        try:
+            app1.begin_immediate(worker_conn)
+            c = worker_conn.cursor()
+            won = app1.claim_slot(c, free_slot['id'])
+            if won:
+                c.execute("INSERT INTO appointments (member_id, slot_id, status) VALUES (?, ?, 'Scheduled')",
+                          (member['id'], free_slot['id']))
+            worker_conn.commit()
+            return won
+        finally:
+            worker_conn.close()
+
+    results = race(claim)
+    assert results.count(True) == 1
+    assert results.count(False) == THREADS - 1
+    assert conn.execute('SELECT booked FROM slots WHERE id = ?', (free_slot['id'],)).fetchone()[0] == 1
+    assert active_appointments(conn, free_slot['id']) == 1
+
+
+def test_concurrent_bookings_have_one_winner(conn, client_for, free_slot, member):
+    clients = [client_for('patient', member['family_id']) for _ in range(THREADS)]
+    booking = {'member_id': member['id'], 'doctor_id': free_slot['doctor_id'], 'slot_id': free_slot['id']}
+
+    responses = race(lambda: clients.pop().post('/api/book_appointment', json=booking))
+
+    assert sorted(response.status_code for response in responses) == [200] + [400] * (THREADS - 1)
+    assert all(response.get_json()['error'] == 'Selected slot is already booked'
+               for response in responses if response.status_code == 400)
+    assert active_appointments(conn, free_slot['id']) == 1
+
+
+
+def test_rescheduling_another_familys_appointment_is_refused(conn, client_for, free_slot, member):
+    other = conn.execute('SELECT id, family_id FROM members WHERE family_id IS NOT NULL AND family_id != ? LIMIT 1',
+                         (member['family_id'],)).fetchone()
+    booked = client_for('patient', member['family_id']).post('/api/book_appointment', json={
+        'member_id': member['id'], 'doctor_id': free_slot['doctor_id'], 'slot_id': free_slot['id']})
+    appointment_id = booked.get_json()['appointment_id']
+    target = add_free_slot(conn)
+
+    response = client_for('patient', other['family_id']).post('/api/book_appointment', json={
+        'member_id': other['id'], 'doctor_id': target['doctor_id'], 'slot_id': target['id'],
+        'appointment_id': appointment_id})
+
+    assert response.status_code == 404
+    assert conn.execute('SELECT slot_id FROM appointments WHERE id = ?', (appointment_id,)).fetchone()[0] == free_slot['id']
+    assert conn.execute('SELECT booked FROM slots WHERE id = ?', (free_slot['id'],)).fetchone()[0] == 1
+    assert conn.execute('SELECT booked FROM slots WHERE id = ?', (target['id'],)).fetchone()[0] == 0
@@ -0,0 +1,61 @@
+import pytest
+
+from test_booking import add_free_slot
+
+
+def counter_snapshot(conn):
+    return {(row['counter'], row['key']): round(row['value'], 2)
+            for row in conn.execute('SELECT counter, key, value FROM dashboard_counters') if round(row['value'], 2)}
+
+
+@pytest.fixture
+def admin(client_for):
+    return client_for('admin', 'ADMIN001')
+
+
+def test_counters_follow_inserts_updates_and_deletes(app1, conn):
+    c = conn.cursor()
+    c.execute('''INSERT INTO members (family_id, first_name, last_name, age, gender, phone, email, aadhar, address,
+                                      prev_problem, curr_problem)
+                 VALUES (NULL, 'Counter', 'Test', 30, 'F', '0000000000', 'counter.test@example.com', '0', '-', '-', '-')''')
+    member_id = c.lastrowid
+    slot = add_free_slot(conn)
+    c.execute("INSERT INTO appointments (member_id, slot_id, status) VALUES (?, ?, 'Scheduled')", (member_id, slot['id']))
+    appointment_id = c.lastrowid
+    c.execute('UPDATE slots SET booked = 1 WHERE id = ?', (slot['id'],))
+    c.execute("INSERT INTO bills (member_id, bill_date, amount, status) VALUES (?, '2099-01-01', 125.5, 'Pending')",
+              (member_id,))
+    bill_id = c.lastrowid
+    conn.commit()
+
+    c.execute('UPDATE members SET age = 70 WHERE id = ?', (member_id,))
+    c.execute("UPDATE appointments SET status = 'Completed' WHERE id = ?", (appointment_id,))
+    c.execute("UPDATE bills SET status = 'Paid', payment_date = '2099-01-02' WHERE id = ?", (bill_id,))
+    conn.commit()
+
+    maintained = counter_snapshot(conn)
+    app1.rebuild_dashboard_counters(c)
+    assert counter_snapshot(conn) == maintained
+    conn.rollback()
+
+    c.execute('DELETE FROM bills WHERE id = ?', (bill_id,))
+    c.execute('DELETE FROM appointments WHERE id = ?', (appointment_id,))
+    c.execute('DELETE FROM slots WHERE id = ?', (slot['id'],))
+    c.execute('DELETE FROM members WHERE id = ?', (member_id,))
+    conn.commit()
+    app1.compact_daily_rollups(conn)
+
+    maintained = counter_snapshot(conn)
+    app1.rebuild_dashboard_counters(c)
+    assert counter_snapshot(conn) == maintained
+    conn.rollback()
+
+
+def test_summary_counts_match_the_tables(app1, conn, admin, monkeypatch):
+    monkeypatch.setitem(app1._dashboard_summary_cache, 'expires', 0)
+    summary = admin.get('/api/admin_dashboard').get_json()
+
+    for table in app1.DASHBOARD_COUNT_TABLES:
+        assert summary['counts'][table] == conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    assert summary['slots']['booked'] == conn.execute('SELECT COUNT(*) FROM slots WHERE booked = 1').fetchone()[0]
+    assert sum(group['patients'] for group in summary['age_groups']) == summary['counts']['members']
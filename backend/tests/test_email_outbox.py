@@ -0,0 +1,154 @@
+import socket
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip('aiosmtpd')
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+
+class Mailbox:
+    """aiosmtpd handler and authenticator that records what the app sends."""
+
+    def __init__(self):
+        self.accept_login = True
+        self.logins = set()  # peers that tried to log in, one per connection
+        self.refused = set()
+        self.messages = []
+
+    def __call__(self, server, session, envelope, mechanism, auth_data):
+        self.logins.add(session.peer)
+        return AuthResult(success=self.accept_login, handled=False)
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return '550 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def mailbox(app1, conn, monkeypatch):
+    mailbox = Mailbox()
+    port = free_port()
+    controller = Controller(mailbox, hostname='127.0.0.1', port=port,
+                            authenticator=mailbox, auth_require_tls=False)
+    controller.start()
+    monkeypatch.setattr(app1, 'MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setattr(app1, 'MAIL_PORT', port)
+    monkeypatch.setattr(app1, 'MAIL_USE_TLS', False)
+    monkeypatch.setattr(app1, 'MAIL_USE_SSL', False)
+    monkeypatch.setattr(app1, 'MAIL_USERNAME', 'clinic@example.com')
+    monkeypatch.setattr(app1, 'MAIL_PASSWORD', 'secret')
+    monkeypatch.setattr(app1, 'MAIL_FROM', 'clinic@example.com')
+    conn.execute('DELETE FROM email_outbox')
+    conn.commit()
+    yield mailbox
+    controller.stop()
+
+
+def outbox(conn):
+    return [dict(row) for row in conn.execute(
+        'SELECT status, attempts, next_attempt_ts, last_error FROM email_outbox ORDER BY id')]
+
+
+def make_due(conn):
+    conn.execute("UPDATE email_outbox SET next_attempt_ts = 0 WHERE status = 'Pending'")
+    conn.commit()
+
+
+def test_rejected_login_backs_off_the_batch_without_spending_attempts(app1, conn, mailbox):
+    mailbox.accept_login = False
+    for n in range(3):
+        app1.send_email(f'patient{n}@example.com', 'Reminder', '<p>hi</p>')
+    smtp = app1.SMTPSession()
+
+    sent, next_due = app1.process_email_outbox(smtp)
+
+    assert sent == 0
+    assert len(mailbox.logins) == 1
+    assert smtp.server is None
+    rows = outbox(conn)
+    assert [row['status'] for row in rows] == ['Pending'] * 3
+    assert [row['attempts'] for row in rows] == [0] * 3
+    assert all('535' in row['last_error'] for row in rows)
+    assert next_due > time.time()
+
+    # Later failures back off further, still without failing any message
+    make_due(conn)
+    app1.process_email_outbox(smtp)
+    first_delay = app1.email_retry_delay(1)
+    assert all(row['next_attempt_ts'] > time.time() + first_delay for row in outbox(conn))
+    assert [row['attempts'] for row in outbox(conn)] == [0] * 3
+
+    mailbox.accept_login = True
+    make_due(conn)
+    sent, _ = app1.process_email_outbox(smtp)
+    smtp.close()
+
+    assert sent == 3
+    assert len(mailbox.messages) == 3
+    assert [(row['status'], row['attempts']) for row in outbox(conn)] == [('Sent', 1)] * 3
+
+
+def test_unreachable_server_backs_off_the_batch(app1, conn, mailbox, monkeypatch):
+    monkeypatch.setattr(app1, 'MAIL_PORT', free_port())
+    app1.send_email('patient@example.com', 'Reminder', '<p>hi</p>')
+
+    sent, _ = app1.process_email_outbox(app1.SMTPSession())
+
+    assert sent == 0
+    assert [(row['status'], row['attempts']) for row in outbox(conn)] == [('Pending', 0)]
+
+
+def test_refused_recipient_fails_only_that_message(app1, conn, mailbox):
+    mailbox.refused.add('gone@example.com')
+    app1.send_email('gone@example.com', 'Reminder', '<p>hi</p>')
+    app1.send_email('patient@example.com', 'Reminder', '<p>hi</p>')
+    smtp = app1.SMTPSession()
+
+    sent, _ = app1.process_email_outbox(smtp)
+    smtp.close()
+
+    assert sent == 1
+    assert len(mailbox.logins) == 1
+    assert [(row['status'], row['attempts']) for row in outbox(conn)] == [('Failed', 1), ('Sent', 1)]
+
+
+def test_worker_survives_a_failed_pass(app1, monkeypatch):
+    passes = []
+    recovered = threading.Event()
+
+    def process(smtp):
+        passes.append(smtp.server)
+        if len(passes) == 1:
+            smtp.server = types.SimpleNamespace(quit=lambda: None)  # a session left open by the failure
+            raise UnicodeEncodeError('ascii', 'é', 0, 1, 'ordinal not in range')
+        recovered.set()
+        return 0, None
+
+    monkeypatch.setattr(app1, 'process_email_outbox', process)
+    monkeypatch.setattr(app1, 'EMAIL_POLL_INTERVAL', 0.05)
+    thread = app1.start_email_worker()
+    try:
+        app1._email_wakeup.set()
+        assert recovered.wait(5)
+        assert passes[1] is None  # the next pass starts on a fresh connection
+    finally:
+        app1._email_worker_stop.set()
+        app1._email_wakeup.set()
+        thread.join(5)
+        app1._email_worker_stop.clear()
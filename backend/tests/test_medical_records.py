@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def front_office(client_for, conn):
+    family_id = conn.execute('SELECT family_id FROM front_office ORDER BY id LIMIT 1').fetchone()['family_id']
+    return client_for('front_office', family_id)
+
+
+@pytest.fixture
+def member_with_history(conn):
+    """A member with several records and several prescriptions, the shape that used to fan out."""
+    member_id = conn.execute('SELECT id FROM members ORDER BY id LIMIT 1').fetchone()['id']
+    doctor_id = conn.execute('SELECT id FROM doctors ORDER BY id LIMIT 1').fetchone()['id']
+    conn.executemany('INSERT INTO medical_records (member_id, record_type, record_date) VALUES (?, ?, ?)',
+                     [(member_id, 'Lab Report', f'2024-03-{day:02d}') for day in (1, 2, 3)])
+    conn.executemany('''INSERT INTO prescriptions (member_id, doctor_id, prescription_date, medication)
+                        VALUES (?, ?, ?, ?)''',
+                     [(member_id, doctor_id, f'2024-03-{day:02d}', f'Medication {day}') for day in (1, 2, 3, 4)])
+    conn.commit()
+    return member_id
+
+
+def record_ids(conn):
+    return sorted(row['id'] for row in conn.execute('SELECT id FROM medical_records'))
+
+
+def test_one_row_per_medical_record(conn, front_office, member_with_history):
+    response = front_office.get('/api/All_medical_records')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['total_records'] == len(body['medical_records'])
+    assert sorted(record['id'] for record in body['medical_records']) == record_ids(conn)
+
+
+def test_pages_cover_every_record_once(conn, front_office, member_with_history):
+    ids, after = [], None
+    while True:
+        params = {'limit': 5, **({'after': after} if after else {})}
+        body = front_office.get('/api/All_medical_records', query_string=params).get_json()
+        ids += [record['id'] for record in body['medical_records']]
+        after = body['pagination']['next_cursor']
+        if not after:
+            break
+
+    assert sorted(ids) == record_ids(conn)
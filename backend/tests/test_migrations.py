@@ -0,0 +1,51 @@
+import sys
+
+from conftest import load_app
+
+
+def test_migrations_apply_to_a_new_database(app1, tmp_path, monkeypatch):
+    # load_app replaces the app1 module and DATABASE_PATH; put the session's back afterwards
+    monkeypatch.setitem(sys.modules, 'app1', app1)
+    monkeypatch.setenv('DATABASE_PATH', app1.DATABASE)
+    fresh = load_app(str(tmp_path / 'new.db'))
+    conn = fresh.get_db()
+    try:
+        applied = {row['name'] for row in conn.execute('SELECT name FROM schema_migrations')}
+        assert applied == {name for name, _ in fresh.SCHEMA_MIGRATIONS}
+        assert fresh.find_full_table_scans(conn) == {}
+    finally:
+        conn.close()
+
+
+def test_migration_with_an_unmet_precondition_is_retried(app1, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'app1', app1)
+    monkeypatch.setenv('DATABASE_PATH', app1.DATABASE)
+    fresh = load_app(str(tmp_path / 'new.db'))
+    name = '0007_unique_active_appointment_slot'
+
+    def recorded():
+        return conn.execute('SELECT 1 FROM schema_migrations WHERE name = ?', (name,)).fetchone() is not None
+
+    conn = fresh.get_db()
+    try:
+        conn.execute('DROP INDEX uq_appointments_active_slot')
+        conn.execute('DELETE FROM schema_migrations WHERE name = ?', (name,))
+        # Two active appointments on one slot: the unique index cannot be built until someone resolves them
+        doctor_id = conn.execute("""INSERT INTO doctors (name, specialty, email, phone)
+                                    VALUES ('Dr. Test', 'GP', 'test@example.com', '0')""").lastrowid
+        slot_id = conn.execute("""INSERT INTO slots (doctor_id, slot_time, booked)
+                                  VALUES (?, '2099-01-01 09:00:00', 1)""", (doctor_id,)).lastrowid
+        conn.executemany("INSERT INTO appointments (member_id, slot_id, status) VALUES (NULL, ?, 'Scheduled')",
+                         [(slot_id,), (slot_id,)])
+        conn.commit()
+
+        fresh.apply_migrations()
+        assert not recorded()
+
+        conn.execute("UPDATE appointments SET status = 'Cancelled' WHERE id = (SELECT MAX(id) FROM appointments)")
+        conn.commit()
+        fresh.apply_migrations()
+        assert recorded()
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'uq_appointments_active_slot'").fetchone()
+    finally:
+        conn.close()
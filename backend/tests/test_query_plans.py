@@ -0,0 +1,2 @@
+def test_hot_queries_do_not_scan_tables(app1, conn):
+    assert app1.find_full_table_scans(conn) == {}
@@ -0,0 +1,60 @@
+import hashlib
+import time
+from email.utils import parsedate_to_datetime
+
+import pytest
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """Run with a local clock well away from UTC, where a naive local expiry shows up as an offset."""
+    monkeypatch.setenv('TZ', 'Asia/Kolkata')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_session_cookie_expires_with_the_stored_session(app1, local_timezone):
+    client = app1.app.test_client()
+    response = client.post('/api/login', json={'identifier': 'admin@familycareconnect.com', 'password': 'admin123'})
+    assert response.status_code == 200
+
+    cookie = next(header for header in response.headers.getlist('Set-Cookie')
+                  if header.startswith(app1.app.config['SESSION_COOKIE_NAME'] + '='))
+    expires = next(part.split('=', 1)[1] for part in cookie.split('; ') if part.startswith('Expires='))
+    assert abs(parsedate_to_datetime(expires).timestamp() - (time.time() + app1.SESSION_LIFETIME_SECONDS)) < 60
+
+
+@pytest.fixture
+def legacy_doctor(conn):
+    """A doctor whose password is still an old unsalted sha256 digest; restored afterwards."""
+    doctor = dict(conn.execute('SELECT id, email, password_hash FROM doctors ORDER BY id LIMIT 1').fetchone())
+    conn.execute('UPDATE doctors SET email = ?, password_hash = ? WHERE id = ?',
+                 ('legacy.doctor@example.com', hashlib.sha256(b'legacy-pass').hexdigest(), doctor['id']))
+    conn.commit()
+    yield doctor
+    conn.execute('UPDATE doctors SET email = ?, password_hash = ? WHERE id = ?',
+                 (doctor['email'], doctor['password_hash'], doctor['id']))
+    conn.commit()
+
+
+def test_login_verifies_without_holding_a_connection(app1, conn, legacy_doctor, monkeypatch):
+    pool = app1.get_db_pool()
+    checked_out = lambda: pool._created - len(pool._idle)
+    before, in_use = checked_out(), []
+    verify_password = app1.verify_password
+
+    def recording_verify(stored, password):
+        in_use.append(checked_out())
+        return verify_password(stored, password)
+
+    monkeypatch.setattr(app1, 'verify_password', recording_verify)
+    client = app1.app.test_client()
+    response = client.post('/api/login', json={'identifier': 'legacy.doctor@example.com', 'password': 'legacy-pass'})
+
+    assert response.status_code == 200
+    assert response.get_json()['user_type'] == 'doctor'
+    assert in_use == [before]
+    stored = conn.execute('SELECT password_hash FROM doctors WHERE id = ?', (legacy_doctor['id'],)).fetchone()[0]
+    assert app1.password_policy.verify(stored, 'legacy-pass') == (True, None)
@@ -0,0 +1,23 @@
+import threading
+
+
+def test_sweeper_survives_a_failed_pass(app1, monkeypatch):
+    passes = []
+    swept_again = threading.Event()
+
+    def sweep(conn):
+        passes.append(len(passes))
+        if len(passes) == 1:
+            raise TimeoutError('no free database connection')
+        swept_again.set()
+        return 0
+
+    monkeypatch.setattr(app1, 'sweep_expired_holds', sweep)
+    monkeypatch.setattr(app1, 'expire_waitlist_offers', lambda conn: 0)
+    thread = app1.start_hold_sweeper(interval=0.05)
+    try:
+        assert swept_again.wait(5)
+    finally:
+        app1._hold_sweeper_stop.set()
+        thread.join(5)
+        app1._hold_sweeper_stop.clear()
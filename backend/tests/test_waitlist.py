@@ -0,0 +1,45 @@
+import threading
+from datetime import datetime, timedelta
+
+
+def add_waiting(conn, member_id, doctor_id, day):
+    conn.execute('''INSERT INTO waitlist (member_id, family_id, doctor_id, day)
+                    SELECT id, family_id, ?, ? FROM members WHERE id = ?''', (doctor_id, day, member_id))
+    conn.commit()
+
+
+def test_queues_drop_drained_and_past_days(app1, conn):
+    member_id = conn.execute('SELECT id FROM members WHERE family_id IS NOT NULL ORDER BY id LIMIT 1').fetchone()['id']
+    doctor_id = conn.execute('SELECT id FROM doctors ORDER BY id LIMIT 1').fetchone()['id']
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    future_day = (datetime.now() + timedelta(days=400)).strftime('%Y-%m-%d')
+    queues = app1.WaitlistQueues()
+
+    add_waiting(conn, member_id, doctor_id, future_day)
+    assert queues.pop_next(conn, doctor_id, future_day) is not None
+    assert (doctor_id, future_day) not in queues._heaps
+
+    add_waiting(conn, member_id, doctor_id, yesterday)
+    queues._refresh(conn, (doctor_id, yesterday))
+    assert (doctor_id, yesterday) in queues._heaps
+    queues.prune()
+    assert queues._heaps == {}
+
+
+def test_worker_survives_a_failed_offer(app1, monkeypatch):
+    offered = []
+    done = threading.Event()
+
+    def offer(conn, slot_id):
+        if slot_id == 'bad':
+            raise KeyError(slot_id)
+        offered.append(slot_id)
+        done.set()
+
+    monkeypatch.setattr(app1, 'offer_released_slot', offer)
+    app1.start_waitlist_worker()
+    app1.notify_slot_released('bad')
+    app1.notify_slot_released(42)
+
+    assert done.wait(5)
+    assert offered == [42]
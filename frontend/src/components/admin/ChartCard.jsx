@@ -11,28 +11,28 @@ const sampleData = [
   { name: "Sun", value: 30 },
 ];
 
-const ChartCard = ({ title, type }) => {
+const ChartCard = ({ title, type, data = sampleData, dataKey = "value", xKey = "name", height = 250 }) => {
   const Chart = type === "bar" ? BarChart : LineChart;
 
   return (
     <div className="bg-white rounded-2xl shadow-md p-4">
       <h2 className="text-lg font-semibold mb-4 text-gray-700">{title}</h2>
-      <ResponsiveContainer width="100%" height={250}>
+      <ResponsiveContainer width="100%" height={height}>
         {type === "bar" ? (
-          <BarChart data={sampleData}>
+          <BarChart data={data}>
             <CartesianGrid strokeDasharray="3 3" />
-            <XAxis dataKey="name" />
+            <XAxis dataKey={xKey} />
             <YAxis />
             <Tooltip />
-            <Bar dataKey="value" fill="#1B998B" radius={[10, 10, 0, 0]} />
+            <Bar dataKey={dataKey} fill="#1B998B" radius={[10, 10, 0, 0]} />
           </BarChart>
         ) : (
-          <LineChart data={sampleData}>
+          <LineChart data={data}>
             <CartesianGrid strokeDasharray="3 3" />
-            <XAxis dataKey="name" />
+            <XAxis dataKey={xKey} />
             <YAxis />
             <Tooltip />
-            <Line type="monotone" dataKey="value" stroke="#1B998B" strokeWidth={3} dot={{ r: 4 }} />
+            <Line type="monotone" dataKey={dataKey} stroke="#1B998B" strokeWidth={3} dot={{ r: 4 }} />
           </LineChart>
         )}
       </ResponsiveContainer>
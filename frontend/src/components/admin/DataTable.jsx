@@ -1,15 +1,42 @@
 // src/components/DataTable.jsx
-const DataTable = ({ title, data }) => {
-  if (!data || data.length === 0) {
+import { useCallback, useEffect, useState } from "react";
+
+// Pass `data` for a fixed list, or `fetchPage({ limit, after })` resolving to
+// { rows, nextCursor } to page through an admin list endpoint with limit/after.
+const DataTable = ({ title, data, fetchPage, pageSize = 50 }) => {
+  const [pagedRows, setPagedRows] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  const loadPage = useCallback(async (after) => {
+    setLoading(true);
+    try {
+      const page = await fetchPage({ limit: pageSize, after });
+      setPagedRows((prev) => (after ? [...prev, ...page.rows] : page.rows));
+      setNextCursor(page.nextCursor || null);
+    } finally {
+      setLoading(false);
+    }
+  }, [fetchPage, pageSize]);
+
+  useEffect(() => {
+    if (fetchPage) {
+      loadPage(undefined);
+    }
+  }, [fetchPage, loadPage]);
+
+  const rows = fetchPage ? pagedRows : data;
+
+  if (!rows || rows.length === 0) {
     return (
       <div className="bg-white rounded-2xl shadow-md p-6">
         <h2 className="text-lg font-semibold mb-4">{title}</h2>
-        <p className="text-gray-500">No records found.</p>
+        <p className="text-gray-500">{loading ? "Loading..." : "No records found."}</p>
       </div>
     );
   }
 
-  const headers = Object.keys(data[0]);
+  const headers = Object.keys(rows[0]);
 
   return (
     <div className="bg-white rounded-2xl shadow-md p-6 overflow-x-auto">
@@ -25,7 +52,7 @@ const DataTable = ({ title, data }) => {
           </tr>
         </thead>
         <tbody>
-          {data.map((row, idx) => (
+          {rows.map((row, idx) => (
             <tr key={idx} className="hover:bg-gray-50">
               {headers.map((head) => (
                 <td key={head} className="px-4 py-2 border">
@@ -36,6 +63,15 @@ const DataTable = ({ title, data }) => {
           ))}
         </tbody>
       </table>
+      {fetchPage && nextCursor && (
+        <button
+          onClick={() => loadPage(nextCursor)}
+          disabled={loading}
+          className="mt-4 px-4 py-2 rounded-lg bg-gray-100 text-gray-700 hover:bg-gray-200 disabled:opacity-50"
+        >
+          {loading ? "Loading..." : "Load more"}
+        </button>
+      )}
     </div>
   );
 };
@@ -41,130 +41,37 @@ useEffect(() => {
       setLoading(true);
       console.log('🔄 Fetching dashboard data...');
 
-      // Use AdminDashboard API call
+      // The dashboard API returns counts and top-N lists, not whole tables
       const data = await AdminDashboard();
-      console.log("📊 Full Dashboard Data:", data);
-
-      // Extract data from different possible structures
-      const patientsData = data.members || data.family_members || data.patients || [];
-      const doctorsData = data.doctors || data.Doctors || [];
-      const appointments = data.appointments || [];
-      const slots = data.slots || []; // Add slots data
-      const bills = data.bills || [];
-
-      console.log("👥 Patients:", patientsData);
-      console.log("👨‍⚕️ Doctors:", doctorsData);
-      console.log("📅 Appointments:", appointments);
-      console.log("⏰ Slots:", slots);
-      console.log("💰 Bills:", bills);
-
-      // Process appointments by joining with slots
-      const scheduleApps = appointments
-        .filter(apt => 
-          apt.status === 'scheduled' || apt.status === 'Scheduled' || !apt.status || apt.status === 'confirmed'
-        )
-        .map(apt => {
-          // Find the corresponding slot
-          const slot = slots.find(s => s.id === apt.slot_id);
-          
-          // Find patient details
-          const patient = patientsData.find(p => 
-            p.id === apt.member_id || 
-            p.id === apt.patient_id ||
-            `${p.first_name} ${p.last_name}` === apt.patient_name
-          );
-          
-          // Find doctor details
-          const doctor = doctorsData.find(d => 
-            d.id === slot?.doctor_id || 
-            d.id === apt.doctor_id ||
-            d.name === apt.doctor_name
-          );
-
-          // Extract date and time from slot_time
-          let appointmentDate = 'Date not set';
-          let appointmentTime = 'All day';
-          
-          if (slot && slot.slot_time) {
-            try {
-              const slotTime = new Date(slot.slot_time);
-              if (!isNaN(slotTime.getTime())) {
-                appointmentDate = slotTime.toISOString().split('T')[0]; // YYYY-MM-DD
-                appointmentTime = slotTime.toLocaleTimeString('en-US', {
-                  hour: '2-digit',
-                  minute: '2-digit',
-                  hour12: true
-                });
-              }
-            } catch (error) {
-              console.log('Error parsing slot time:', slot.slot_time);
-            }
-          }
-
-          return {
-            ...apt,
-            slot_details: slot,
-            patient_details: patient,
-            doctor_details: doctor,
-            patient_name: apt.patient_name || (patient ? `${patient.first_name} ${patient.last_name}` : 'Patient'),
-            doctor_name: apt.doctor_name || (doctor ? doctor.name : 'Doctor'),
-            date: appointmentDate,
-            time: appointmentTime,
-            status: apt.status || 'Scheduled'
-          };
-        })
-        .sort((a, b) => new Date(a.date) - new Date(b.date)); // Sort by date
-
-      console.log("📅 Enhanced Schedule Appointments:", scheduleApps);
-      
-      setScheduleAppointments(scheduleApps.slice(0, 5));
+      console.log("📊 Dashboard summary:", data);
 
-      // Recent patients (last 5)
-      const recentPatientsData = patientsData
-        .sort((a, b) => new Date(b.created_date || b.date) - new Date(a.created_date || a.date))
-        .slice(0, 5);
-      
-      console.log("🆕 Recent Patients:", recentPatientsData);
+      const counts = data.counts || {};
+      const byStatus = data.appointments_by_status || {};
+      const scheduleApps = data.upcoming_appointments_list || [];
+      const recentPatientsData = data.recent_patients || [];
+      const bills = data.recent_bills || [];
+
+      setScheduleAppointments(scheduleApps);
       setRecentPatients(recentPatientsData);
 
-      // Calculate statistics
-      const totalPatients = patientsData.length;
-      const totalDoctors = doctorsData.length;
-      const totalAppointments = appointments.length;
-      
-      const today = new Date().toISOString().split('T')[0];
-      const todayAppsCount = scheduleApps.filter(apt => apt.date === today).length;
-      
-      const upcomingAppointmentsCount = scheduleApps.filter(apt => 
-        new Date(apt.date) > new Date() && 
-        (apt.status === 'scheduled' || apt.status === 'Scheduled' || !apt.status)
-      ).length;
-      
-      // TOTAL REVENUE CALCULATION
-      const totalRevenue = bills
-        .filter(bill => bill.status === 'paid' || bill.status === 'Paid')
-        .reduce((sum, bill) => sum + (parseFloat(bill.amount) || 0), 0);
-
-      const completedAppointments = appointments.filter(apt => 
-        apt.status === 'completed' || apt.status === 'Completed'
-      ).length;
-      
-      const completionRate = totalAppointments > 0 ? 
+      const totalAppointments = counts.appointments || 0;
+      const completedAppointments = byStatus.Completed || 0;
+      const completionRate = totalAppointments > 0 ?
         Math.round((completedAppointments / totalAppointments) * 100) : 0;
 
       setStats({
-        total_patients: totalPatients,
-        total_doctors: totalDoctors,
+        total_patients: counts.members || 0,
+        total_doctors: counts.doctors || 0,
         total_appointments: totalAppointments,
-        upcoming_appointments: upcomingAppointmentsCount,
-        today_appointments: todayAppsCount,
+        upcoming_appointments: data.upcoming_appointments || 0,
+        today_appointments: data.today_appointments || 0,
         completion_rate: completionRate,
         completed_appointments: completedAppointments,
-        total_revenue: totalRevenue
+        total_revenue: data.revenue?.collected || 0
       });
 
       // Generate recent activity
-      generateRecentActivity(scheduleApps, patientsData, bills);
+      generateRecentActivity(scheduleApps, recentPatientsData, bills);
 
     } catch (error) {
       console.error("❌ Error fetching dashboard data:", error);
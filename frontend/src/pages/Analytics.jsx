@@ -16,7 +16,15 @@ import Navbar from '../components/admin/Navbar';
 import Sidebar from '../components/admin/sidebar';
 import StatCard from '../components/admin/StatCard';
 import ChartCard from '../components/admin/ChartCard';
-import { AdminDashboard as getAdminDashboard } from '../services/api';
+import { AdminDashboard as getAdminDashboard, getAnalyticsSeries } from '../services/api';
+
+// Series granularity and length for each time range option
+const RANGE_SERIES = {
+  week: { granularity: 'day', days: 7 },
+  month: { granularity: 'day', days: 30 },
+  quarter: { granularity: 'week', days: 91 },
+  year: { granularity: 'month', days: 365 }
+};
 
 const Analytics = () => {
   const [activeTab, setActiveTab] = useState('overview');
@@ -26,6 +34,7 @@ const Analytics = () => {
   const [isDark, setIsDark] = useState(false);
   const [loading, setLoading] = useState(true);
   const [stats, setStats] = useState({});
+  const [appointmentSeries, setAppointmentSeries] = useState([]);
 
   useEffect(() => {
     fetchAnalyticsData();
@@ -34,25 +43,33 @@ const Analytics = () => {
   const fetchAnalyticsData = async () => {
     try {
       setLoading(true);
-      const data = await getAdminDashboard();
+      const { granularity, days } = RANGE_SERIES[timeRange];
+      const from = new Date(Date.now() - (days - 1) * 24 * 60 * 60 * 1000).toISOString().slice(0, 10);
+      const [data, series] = await Promise.all([
+        getAdminDashboard(),
+        getAnalyticsSeries({ metric: 'appointments', granularity, from })
+      ]);
       console.log("Analytics Data:", data);
+      setAppointmentSeries(series.points || []);
       
       setAnalyticsData(data);
       
-      // Calculate comprehensive stats
-      const totalRevenue = data.payments?.reduce((sum, payment) => sum + (payment.amount || 0), 0) || 0;
-      const monthlyGrowth = calculateGrowth(data.payments || []);
-      const patientSatisfaction = calculateSatisfaction(data.appointments || []);
+      // Calculate comprehensive stats from the dashboard summary
+      const counts = data.counts || {};
+      const byStatus = data.appointments_by_status || {};
+      const totalRevenue = data.revenue?.collected || 0;
+      const monthlyGrowth = calculateGrowth(data.appointments_by_month || []);
+      const patientSatisfaction = calculateSatisfaction(byStatus, counts.appointments || 0);
       
       setStats({
-        totalPatients: data.members?.length || 0,
-        totalDoctors: data.doctors?.length || 0,
-        totalAppointments: data.appointments?.length || 0,
+        totalPatients: counts.members || 0,
+        totalDoctors: counts.doctors || 0,
+        totalAppointments: counts.appointments || 0,
         totalRevenue: totalRevenue,
         monthlyGrowth: monthlyGrowth,
         patientSatisfaction: patientSatisfaction,
         avgAppointmentDuration: 45, // Could be calculated from actual data
-        occupancyRate: calculateOccupancyRate(data.appointments || [], data.slots || [])
+        occupancyRate: calculateOccupancyRate(data.slots || {})
       });
       
     } catch (error) {
@@ -62,49 +79,22 @@ const Analytics = () => {
     }
   };
 
-  const calculateGrowth = (payments) => {
+  const calculateGrowth = (months) => {
     // Simple growth calculation - in real app, compare with previous period
     return 12.5; // Percentage
   };
 
-  const calculateSatisfaction = (appointments) => {
+  const calculateSatisfaction = (byStatus, total) => {
     // Mock satisfaction calculation
-    const completed = appointments.filter(apt => apt.status === 'completed').length;
-    const total = appointments.length;
+    const completed = byStatus.Completed || 0;
     return total > 0 ? Math.round((completed / total) * 100) : 85;
   };
 
-  const calculateOccupancyRate = (appointments, slots) => {
-    const bookedSlots = appointments.filter(apt => apt.status === 'scheduled' || apt.status === 'completed').length;
-    const totalSlots = slots.length;
-    return totalSlots > 0 ? Math.round((bookedSlots / totalSlots) * 100) : 65;
+  const calculateOccupancyRate = (slots) => {
+    return slots.total > 0 ? Math.round((slots.booked / slots.total) * 100) : 65;
   };
 
-  const getPatientDemographics = () => {
-    if (!analyticsData.members) return [];
-    
-    const ageGroups = {
-      '0-18': 0,
-      '19-35': 0,
-      '36-50': 0,
-      '51-65': 0,
-      '65+': 0
-    };
-    
-    analyticsData.members.forEach(patient => {
-      const age = patient.age || 30;
-      if (age <= 18) ageGroups['0-18']++;
-      else if (age <= 35) ageGroups['19-35']++;
-      else if (age <= 50) ageGroups['36-50']++;
-      else if (age <= 65) ageGroups['51-65']++;
-      else ageGroups['65+']++;
-    });
-    
-    return Object.entries(ageGroups).map(([ageGroup, count]) => ({
-      ageGroup,
-      patients: count
-    }));
-  };
+  const getPatientDemographics = () => analyticsData.age_groups || [];
 
   const getRevenueByDepartment = () => {
     // Mock data - in real app, this would come from your billing data
@@ -117,39 +107,10 @@ const Analytics = () => {
     ];
   };
 
-  const getAppointmentTrends = () => {
-    if (!analyticsData.appointments) return [];
-    
-    const monthlyCounts = {};
-    analyticsData.appointments.forEach(apt => {
-      const month = new Date(apt.date).getMonth();
-      monthlyCounts[month] = (monthlyCounts[month] || 0) + 1;
-    });
-    
-    return Object.entries(monthlyCounts).map(([month, count]) => ({
-      month: ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'][month],
-      appointments: count
-    }));
-  };
+  const getAppointmentTrends = () =>
+    appointmentSeries.map(({ period, value }) => ({ period, appointments: value }));
 
-  const getTopDoctors = () => {
-    if (!analyticsData.doctors || !analyticsData.appointments) return [];
-    
-    const doctorAppointments = {};
-    analyticsData.appointments.forEach(apt => {
-      if (apt.doctor_name) {
-        doctorAppointments[apt.doctor_name] = (doctorAppointments[apt.doctor_name] || 0) + 1;
-      }
-    });
-    
-    return Object.entries(doctorAppointments)
-      .sort(([,a], [,b]) => b - a)
-      .slice(0, 5)
-      .map(([doctor, appointments]) => ({
-        doctor,
-        appointments
-      }));
-  };
+  const getTopDoctors = () => analyticsData.top_doctors || [];
 
   const exportReport = () => {
     console.log('Exporting analytics report...');
@@ -320,6 +281,7 @@ const Analytics = () => {
                 type="line" 
                 data={getAppointmentTrends()}
                 dataKey="appointments"
+                xKey="period"
                 isDark={isDark}
                 height={300}
               />
@@ -328,6 +290,7 @@ const Analytics = () => {
                 type="bar" 
                 data={getPatientDemographics()}
                 dataKey="patients"
+                xKey="ageGroup"
                 isDark={isDark}
                 height={300}
               />
@@ -339,6 +302,7 @@ const Analytics = () => {
                 type="pie" 
                 data={getRevenueByDepartment()}
                 dataKey="revenue"
+                xKey="department"
                 isDark={isDark}
                 height={300}
               />
@@ -7,7 +7,7 @@ import AdminModal from '../components/AdminModal';
 import Sidebar from '../components/admin/sidebar';
 import StatCard from '../components/admin/StatCard';
 import ChartCard from '../components/admin/ChartCard';
-import { AdminDashboard as getAdminDashboard, addUser, updateUser, deleteUser } from '../services/api';
+import { getAllAdminTableRows, addUser, updateUser, deleteUser } from '../services/api';
 
 const Billing = () => {
   const [activeTab, setActiveTab] = useState('bills');
@@ -31,25 +31,11 @@ const Billing = () => {
   const fetchBillingData = async () => {
     try {
       setLoading(true);
-      const data = await getAdminDashboard();
-      console.log("📊 FULL API RESPONSE:", data);
-      
-      // Try different possible data structures for patients/members
-      let patientsData = [];
-      let membersData = [];
-      
-      // Check various possible locations for patient/member data
-      if (data.patients && Array.isArray(data.patients)) {
-        patientsData = data.patients;
-        console.log("✅ Found patients in data.patients");
-      } else if (data.members && Array.isArray(data.members)) {
-        patientsData = data.members;
-        console.log("✅ Found patients in data.members");
-      } else if (data.users && Array.isArray(data.users)) {
-        // Filter for patients only if users array contains different types
-        patientsData = data.users.filter(user => user.user_type === 1 || user.user_type === 'patient');
-        console.log("✅ Found patients in data.users");
-      }
+      const [patientsData, billsData] = await Promise.all([
+        getAllAdminTableRows('members', { fields: ['first_name', 'last_name', 'email', 'phone'] }),
+        getAllAdminTableRows('bills')
+      ]);
+      const data = { bills: billsData, payments: [] };
       
       console.log("👥 Final patients data:", patientsData);
       setPatients(patientsData);
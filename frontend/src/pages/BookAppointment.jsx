@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
-import { getBookAppointmentData, bookAppointment, getAvailableSlots } from '../services/api';
+import { getBookAppointmentData, bookAppointment, getAvailableSlots, holdSlot, releaseSlotHold } from '../services/api';
 import Navbar from '../components/Navbar';
 
 const BookAppointment = () => {
@@ -165,9 +165,30 @@ const BookAppointment = () => {
     }
     setFormData(prev => ({ ...prev, [name]: value }));
     if (name === 'doctor_id' || name === 'date') {
+      if (formData.slot_id) releaseSlotHold(formData.slot_id);
       setFormData(prev => ({ ...prev, slot_id: '' }));
       setError('');
     }
+    if (name === 'slot_id') {
+      handleSlotHold(value);
+    }
+  };
+
+  // Hold the picked slot so nobody else can book it while the form is filled in
+  const handleSlotHold = async (slotId) => {
+    if (formData.slot_id && formData.slot_id !== slotId) releaseSlotHold(formData.slot_id);
+    if (!slotId) return;
+    try {
+      await holdSlot(slotId);
+      setError('');
+    } catch (err) {
+      setError(err.message || 'Selected slot is no longer available');
+      setFormData(prev => ({ ...prev, slot_id: '' }));
+      setData(prev => ({
+        ...prev,
+        available_slots: prev.available_slots.filter(slot => String(slot.id) !== String(slotId))
+      }));
+    }
   };
 
   const handleSubmit = async (e) => {
@@ -5,7 +5,7 @@ import { motion } from 'framer-motion';
 import Navbar from '../components/admin/Navbar';
 import Modal from '../components/Modal';
 import Sidebar from '../components/admin/sidebar';
-import { AdminDashboard as getAdminDashboard } from '../services/api';
+import { getAllAdminTableRows } from '../services/api';
 
 const Settings = () => {
   const [activeTab, setActiveTab] = useState('admin');
@@ -35,11 +35,11 @@ const Settings = () => {
   const fetchSettingsData = async () => {
     try {
       setLoading(true);
-      const data = await getAdminDashboard();
-      console.log("Settings Data:", data);
+      const admins = await getAllAdminTableRows('admins');
+      console.log("Settings Data:", admins);
       
-      setAdmins(data.admins || []);
-      setConfigs(data.configs || []);
+      setAdmins(admins);
+      setConfigs([]);
       
     } catch (error) {
       console.error("Error fetching settings data:", error);
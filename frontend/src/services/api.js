@@ -192,6 +192,37 @@ export const getAvailableSlots = async (doctorId, date) => {
   }
 };
 
+// Earliest free slots across doctors; pass the previous next_cursor as `after` for the next page
+export const searchAvailability = async ({ specialty, from, to, limit, after } = {}) => {
+  try {
+    const res = await api.get('/api/availability/search', {
+      params: { specialty, from, to, limit, after }
+    });
+    return res.data;
+  } catch (error) {
+    throw new Error(handleError(error));
+  }
+};
+
+// Lease a slot for a few minutes while the patient finishes booking
+export const holdSlot = async (slotId) => {
+  try {
+    const response = await api.post('/api/slot_holds', { slot_id: slotId });
+    return response.data;
+  } catch (error) {
+    throw new Error(handleError(error));
+  }
+};
+
+export const releaseSlotHold = async (slotId) => {
+  try {
+    const response = await api.delete(`/api/slot_holds/${slotId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error releasing slot hold:', error.response?.data || error);
+  }
+};
+
 export const getAppointment = async (id) => {
   try {
     const res = await api.get(`/api/view_appointment/${id}`);
@@ -349,11 +380,11 @@ export const getDoctorMedicalRecords = async () => {
     throw handleError(error);
   }
 };
-export const getAllMedicalRecords = async () => {
+export const getAllMedicalRecords = async (params = {}) => {
   debugger
   try {
     console.log('🔄 Frontend: Calling GET /api/get All_medical_records...');
-    const response = await api.get('/api/All_medical_records');
+    const response = await api.get('/api/All_medical_records', { params });
     console.log('✅ Frontend: Doctor medical records response:', response);
     console.log('✅ Frontend: Response data:', response.data);
     return response.data;
@@ -577,10 +608,49 @@ export const AdminDashboard = async () => {
 };
 
 
-export const getAdminPatientData = async (id) => {
+// Gap-filled chart series: { points: [{ period, value }], total, ... }
+export const getAnalyticsSeries = async ({ metric, granularity, from, to, doctorId } = {}) => {
+  try {
+    const res = await api.get('/api/analytics/series', {
+      params: { metric, granularity, from, to, doctor_id: doctorId }
+    });
+    return res.data;
+  } catch (error) {
+    throw handleError(error);
+  }
+};
+
+// One page of an admin table; pass the returned next_cursor as `after` for the next page
+export const getAdminTable = async (table, { fields, limit, after } = {}) => {
+  try {
+    const res = await api.get(`/api/admin/tables/${table}`, {
+      params: { fields: fields?.join(','), limit, after }
+    });
+    return res.data;
+  } catch (error) {
+    throw handleError(error);
+  }
+};
+
+// Every row of an admin table, fetched page by page
+export const getAllAdminTableRows = async (table, { fields, pageSize = 500 } = {}) => {
+  const rows = [];
+  let after;
+  do {
+    const page = await getAdminTable(table, { fields, limit: pageSize, after });
+    rows.push(...page.rows);
+    after = page.next_cursor;
+  } while (after);
+  return rows;
+};
+
+
+// Admin list calls take optional { sort, limit, after, doctor_id, member_id, status, from, to };
+// with limit the response carries pagination.next_cursor; send it back as `after` for the next page
+export const getAdminPatientData = async (params) => {
   try {
     debugger
-    const res = await api.get(`/api/admin/getpatientdata`);
+    const res = await api.get(`/api/admin/getpatientdata`, { params });
     console.log("data come api.js", res.data)
     return res.data;
   } catch (error) {
@@ -588,10 +658,10 @@ export const getAdminPatientData = async (id) => {
   }
 };
 
-export const getAdminDoctordata = async (id) => {
+export const getAdminDoctordata = async (params) => {
   try {
     debugger
-    const res = await api.get(`/api/admin/getdoctordata`);
+    const res = await api.get(`/api/admin/getdoctordata`, { params });
     console.log("data come api.js", res.data)
     return res.data;
   } catch (error) {
@@ -724,11 +794,11 @@ export const deleteUser = async (userType, userId) => {
 
 
 // Admin Appointments APIs
-export const getAdminAppointments = async () => {
+export const getAdminAppointments = async (params) => {
   try {
     debugger
     console.log('🔄 Frontend: Fetching admin appointments data...');
-    const response = await api.get('/api/admin/appointments');
+    const response = await api.get('/api/admin/appointments', { params });
     console.log('✅ Frontend: Admin appointments data received:', response.data);
     return response.data;
   } catch (error) {
@@ -737,11 +807,11 @@ export const getAdminAppointments = async () => {
   }
 };
 
-export const getAdminSlots = async () => {
+export const getAdminSlots = async (params) => {
   try {
     debugger
     console.log('🔄 Frontend: Fetching admin slots data...');
-    const response = await api.get('/api/admin/slots');
+    const response = await api.get('/api/admin/slots', { params });
     console.log('✅ Frontend: Admin slots data received:', response.data);
     return response.data;
   } catch (error) {
@@ -838,10 +908,10 @@ export const deleteSlot = async (slotId) => {
 
 
 // Medical Records API methods - GET only (using existing unified API for CRUD)
-export const getAdminMedicalRecords = async () => {
+export const getAdminMedicalRecords = async (params) => {
   try {
     console.log('🔄 Frontend: Fetching admin medical records data...');
-    const response = await api.get('/api/admin/medical_records');
+    const response = await api.get('/api/admin/medical_records', { params });
     console.log('✅ Frontend: Admin medical records data received:', response.data);
     return response.data;
   } catch (error) {
@@ -850,10 +920,10 @@ export const getAdminMedicalRecords = async () => {
   }
 };
 
-export const getAdminPrescriptions = async () => {
+export const getAdminPrescriptions = async (params) => {
   try {
     console.log('🔄 Frontend: Fetching admin prescriptions data...');
-    const response = await api.get('/api/admin/prescriptions');
+    const response = await api.get('/api/admin/prescriptions', { params });
     console.log('✅ Frontend: Admin prescriptions data received:', response.data);
     return response.data;
   } catch (error) {